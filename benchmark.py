@@ -0,0 +1,520 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+
+# Tamaños de cada barrido: (completo, rápido)
+BARRIDOS = {
+    "lectura_xrdml": {"puntos": ([1_000, 10_000, 100_000, 1_000_000], [1_000, 20_000])},
+    "lectura_ftir": {"puntos": ([1_800, 7_200, 28_800, 115_200], [1_800, 7_200]),
+                     "formato": (["txt", "affn", "dif"], ["txt", "dif"])},
+    "preprocesado": {"muestras": ([1, 8, 32], [1, 4]), "puntos": ([5_000, 20_000], [5_000])},
+    "puntuacion": {"candidatos": ([100, 1_000, 10_000], [100, 1_000]), "picos": ([10, 50, 200], [10, 50])},
+    "simulacion": {"candidatos": ([4, 16], [4]), "atomos": ([4, 16], [4])},
+    "identificacion": {"materiales": ([10, 50, 200], [10, 30]), "picos": ([20, 100], [20])},
+    "graficas": {"muestras": ([2, 8], [2]), "puntos": ([10_000, 100_000], [10_000]),
+                 "script": (["raw", "analisis", "figuras_lote", "comparar"], ["raw", "figuras_lote"])},
+}
+
+
+# --- Generadores de datos sintéticos ---
+
+def perfil_xrd(two_theta, picos, rng, fondo=200.0, fwhm=0.12, altura_max=5_000.0):
+    """Difractograma sintético: fondo decreciente, 'picos' gaussianos al azar y ruido de Poisson."""
+    y = fondo * (1.0 + 40.0 / np.maximum(two_theta, 1.0))
+    sigma = fwhm / 2.3548
+    for centro, altura in zip(rng.uniform(two_theta[0], two_theta[-1], picos),
+                              rng.uniform(0.05, 1.0, picos) * altura_max):
+        cerca = np.abs(two_theta - centro) < 6 * sigma
+        y[cerca] += altura * np.exp(-0.5 * ((two_theta[cerca] - centro) / sigma) ** 2)
+    return rng.poisson(y).astype(np.float64)
+
+
+def generar_xrdml(ruta, puntos, picos=30, semilla=0, inicio=10.0, fin=90.0, lista_posiciones=False):
+    """
+    Escribe un XRDML sintético de 'puntos' puntos, con el mismo esquema que
+    exportan los difractómetros (namespace 2.3, un <scan> con <dataPoints>).
+    """
+    rng = np.random.default_rng(semilla)
+    two_theta = np.linspace(inicio, fin, puntos)
+    cuentas = perfil_xrd(two_theta, picos, rng)
+    if lista_posiciones:
+        posiciones = f"<listPositions>{' '.join(f'{v:.5f}' for v in two_theta)}</listPositions>"
+    else:
+        posiciones = f"<startPosition>{inicio:.5f}</startPosition><endPosition>{fin:.5f}</endPosition>"
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<xrdMeasurements xmlns="http://www.xrdml.com/XRDMeasurement/2.3" status="Completed">\n'
+                '  <sample type="To be analyzed"><id>sintetico</id></sample>\n'
+                '  <xrdMeasurement measurementType="Scan" status="Completed">\n'
+                '    <usedWavelength intended="K-Alpha 1"><kAlpha1 unit="Angstrom">1.78901</kAlpha1></usedWavelength>\n'
+                '    <scan appendNumber="0" mode="Continuous" scanAxis="Gonio" status="Completed">\n'
+                '      <dataPoints>\n'
+                f'        <positions axis="2Theta" unit="deg">{posiciones}</positions>\n'
+                '        <commonCountingTime unit="seconds">1.0</commonCountingTime>\n'
+                '        <counts unit="counts">')
+        f.write(" ".join(str(int(v)) for v in cuentas))
+        f.write('</counts>\n      </dataPoints>\n    </scan>\n  </xrdMeasurement>\n</xrdMeasurements>\n')
+    return two_theta, cuentas
+
+
+def perfil_ftir(numero_onda, bandas, rng):
+    """Espectro sintético en %T: bandas de absorción lorentzianas sobre una línea base suave."""
+    absorbancia = 0.05 + 0.02 * np.sin(numero_onda / 700.0)
+    for centro, ancho, altura in zip(rng.uniform(numero_onda.min(), numero_onda.max(), bandas),
+                                     rng.uniform(4.0, 40.0, bandas), rng.uniform(0.05, 1.2, bandas)):
+        absorbancia += altura / (1.0 + ((numero_onda - centro) / ancho) ** 2)
+    absorbancia += rng.normal(0.0, 0.002, len(numero_onda))
+    return 100.0 * 10.0 ** -absorbancia
+
+
+def _sqz(n):
+    """Entero en forma SQZ de JCAMP-DX (el primer dígito lleva el signo: 12 -> 'A2', -12 -> 'a2')."""
+    digitos = str(abs(n))
+    if n == 0:
+        return "@"
+    primero = int(digitos[0])
+    return ("abcdefghi" if n < 0 else "ABCDEFGHI")[primero - 1] + digitos[1:]
+
+
+def _dif(n):
+    """Entero en forma DIF de JCAMP-DX (0 -> '%', 12 -> 'J2', -12 -> 'j2')."""
+    digitos = str(abs(n))
+    if n == 0:
+        return "%"
+    primero = int(digitos[0])
+    return ("jklmnopqr" if n < 0 else "JKLMNOPQR")[primero - 1] + digitos[1:]
+
+
+def generar_ftir(ruta, puntos, formato="txt", bandas=25, semilla=0, minimo=400.0, maximo=4000.0, por_linea=10):
+    """
+    Escribe un espectro FTIR sintético en %T, de 'maximo' a 'minimo' cm-1.
+
+    'txt': tabla de dos columnas como la que exporta el espectrómetro.
+    'affn': JCAMP-DX con ##XYDATA=(X++(Y..Y)) en números ASCII.
+    'dif': JCAMP-DX comprimido SQZ/DIF, con el valor de control al inicio de cada línea.
+    """
+    rng = np.random.default_rng(semilla)
+    x = np.linspace(maximo, minimo, puntos)
+    y = perfil_ftir(x, bandas, rng)
+    if formato == "txt":
+        np.savetxt(ruta, np.column_stack([x, y]), fmt="%.4f", delimiter="\t")
+        return x, y
+
+    yfactor = 0.0001
+    enteros = np.rint(y / yfactor).astype(np.int64)
+    paso = (minimo - maximo) / (puntos - 1)
+    lineas = []
+    if formato == "affn":
+        for inicio in range(0, puntos, por_linea):
+            valores = " ".join(str(v) for v in enteros[inicio:inicio + por_linea])
+            lineas.append(f"{x[inicio]:.4f} {valores}")
+    elif formato == "dif":
+        inicio = 0
+        while inicio < puntos - 1:
+            fin = min(inicio + por_linea, puntos - 1)
+            difs = "".join(_dif(int(d)) for d in np.diff(enteros[inicio:fin + 1]))
+            lineas.append(f"{x[inicio]:.4f}{_sqz(int(enteros[inicio]))}{difs}")
+            # La línea siguiente repite la última ordenada como valor de control
+            inicio = fin
+        lineas.append(f"{x[-1]:.4f}{_sqz(int(enteros[-1]))}")
+    else:
+        raise ValueError(f"formato desconocido: '{formato}'")
+
+    encabezado = [
+        "##TITLE=Espectro sintetico", "##JCAMP-DX=4.24", "##DATA TYPE=INFRARED SPECTRUM",
+        "##XUNITS=1/CM", "##YUNITS=%T", "##XFACTOR=1.0", f"##YFACTOR={yfactor}",
+        f"##FIRSTX={maximo:.4f}", f"##LASTX={minimo:.4f}", f"##DELTAX={paso:.6f}", f"##NPOINTS={puntos}",
+        "##XYDATA=(X++(Y..Y))",
+    ]
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write("\n".join(encabezado + lineas + ["##END="]) + "\n")
+    return x, enteros * yfactor
+
+
+def patrones_sinteticos(candidatos, picos_por_patron=40, semilla=0, rango=(10.0, 90.0)):
+    """Patrones de barras al azar con el formato de los simulados (intensidades 0-100)."""
+    from patrones_simulados import PatronSimulado
+    rng = np.random.default_rng(semilla)
+    patrones = []
+    for _ in range(candidatos):
+        n = int(rng.integers(picos_por_patron // 2, picos_por_patron + 1))
+        x = np.sort(rng.uniform(*rango, n))
+        y = rng.pareto(1.5, n) + 0.1
+        patrones.append(PatronSimulado(x, y / y.max() * 100, [""] * n))
+    return patrones
+
+
+def picos_sinteticos(picos, semilla=0, rango=(10.0, 90.0)):
+    """Picos experimentales [(2θ, intensidad 0-100)], como los devuelve extraer_picos."""
+    rng = np.random.default_rng(semilla)
+    thetas = rng.uniform(*rango, picos)
+    intensidades = rng.uniform(1.0, 100.0, picos)
+    intensidades[0] = 100.0
+    return list(zip(thetas, intensidades))
+
+
+# --- Materials Project de prueba ---
+
+class _ResumenFalso:
+    def __init__(self, servidor):
+        self._servidor = servidor
+
+    def search(self, **criterios):
+        return self._servidor.buscar(**criterios)
+
+
+class MPResterFalso:
+    """
+    Sustituto local de mp_api.client.MPRester para los benchmarks.
+
+    Sirve, para cualquier sistema químico, 'materiales' estructuras cúbicas
+    deterministas de 'atomos' átomos (la misma consulta siempre devuelve lo
+    mismo) con energías sobre el casco entre 0 y 0.1 eV/átomo. Entiende los
+    criterios que usa esprayx (elements, num_elements, energy_above_hull,
+    material_ids y fields) y, con 'latencia', simula el tiempo de respuesta
+    del servidor. Cuenta las consultas en 'consultas'.
+    """
+
+    def __init__(self, api_key=None, materiales=20, atomos=8, latencia=0.0):
+        self.materials = SimpleNamespace(summary=_ResumenFalso(self))
+        self.num_materiales = materiales
+        self.atomos = atomos
+        self.latencia = latencia
+        self.consultas = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _estructura(self, elements, k):
+        from pymatgen.core import Lattice, Structure
+        rng = np.random.default_rng(zlib.crc32(f"{'-'.join(elements)}:{k}".encode()))
+        especies = [elements[i % len(elements)] for i in range(self.atomos)]
+        volumen_por_atomo = rng.uniform(10.0, 20.0)
+        a = (volumen_por_atomo * self.atomos) ** (1 / 3)
+        return Structure(Lattice.cubic(a), especies, rng.random((self.atomos, 3)))
+
+    @staticmethod
+    def _energia(k):
+        return (k % 11) * 0.01
+
+    def _doc(self, elements, k, campos=None):
+        elements = sorted(elements)
+        chemsys = "-".join(elements)
+        valores = {
+            "material_id": f"mp-falso-{chemsys}-{k}",
+            "formula_pretty": "".join(elements) + (f"_{k}" if k else ""),
+            "energy_above_hull": self._energia(k),
+            "last_updated": "2024-01-01T00:00:00",
+            "elements": elements,
+            "nelements": len(elements),
+        }
+        if campos is None or "structure" in campos:
+            valores["structure"] = self._estructura(elements, k)
+        if campos is not None:
+            valores = {c: valores.get(c) for c in campos}
+        return SimpleNamespace(**valores)
+
+    def buscar(self, elements=None, num_elements=None, energy_above_hull=None, material_ids=None, fields=None):
+        self.consultas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if material_ids:
+            docs = []
+            for material_id in material_ids:
+                chemsys, _, k = str(material_id).replace("mp-falso-", "", 1).rpartition("-")
+                docs.append(self._doc(chemsys.split("-"), int(k), fields))
+            return docs
+        elements = list(elements or [])
+        if not elements or (num_elements is not None and num_elements != len(elements)):
+            return []
+        indices = range(self.num_materiales)
+        if energy_above_hull is not None:
+            minimo, maximo = energy_above_hull
+            indices = [k for k in indices if minimo <= self._energia(k) <= maximo]
+        return [self._doc(elements, k, fields) for k in indices]
+
+
+# --- Medición ---
+
+def cronometrar(funcion, repeticiones=5, calentamiento=1):
+    """Ejecuta 'funcion' y devuelve los tiempos en segundos (mínimo, mediana y media)."""
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return {
+        "repeticiones": repeticiones,
+        "min_s": min(tiempos),
+        "mediana_s": float(np.median(tiempos)),
+        "media_s": float(np.mean(tiempos)),
+    }
+
+
+@contextlib.contextmanager
+def _entorno(**variables):
+    """Fija variables de entorno durante el bloque y luego restaura los valores anteriores."""
+    anteriores = {k: os.environ.get(k) for k in variables}
+    os.environ.update({k: str(v) for k, v in variables.items()})
+    try:
+        yield
+    finally:
+        for k, v in anteriores.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _silenciar():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _combinaciones(nombre, rapido):
+    """Todas las combinaciones de parámetros del barrido 'nombre'."""
+    combinaciones = [{}]
+    for parametro, (completo, reducido) in BARRIDOS[nombre].items():
+        valores = reducido if rapido else completo
+        combinaciones = [dict(c, **{parametro: v}) for c in combinaciones for v in valores]
+    return combinaciones
+
+
+# --- Benchmarks ---
+
+def bench_lectura_xrdml(directorio, rapido, repeticiones):
+    from lector_xrdml import leer_xrdml_moderno
+    for parametros in _combinaciones("lectura_xrdml", rapido):
+        ruta = os.path.join(directorio, f"xrd_{parametros['puntos']}.xrdml")
+        generar_xrdml(ruta, parametros["puntos"])
+        tamano = os.path.getsize(ruta)
+        with _entorno(WH_CACHE_ESPECTROS="0"):
+            yield dict(parametros, cache=False, bytes=tamano), cronometrar(lambda: leer_xrdml_moderno(ruta), repeticiones)
+        with _entorno(WH_CACHE_ESPECTROS="1", WH_CACHE_ESPECTROS_DIR=os.path.join(directorio, "cache_espectros")):
+            yield dict(parametros, cache=True, bytes=tamano), cronometrar(lambda: leer_xrdml_moderno(ruta), repeticiones)
+
+
+def bench_lectura_ftir(directorio, rapido, repeticiones):
+    from lector_ftir import leer_espectro_ftir
+    for parametros in _combinaciones("lectura_ftir", rapido):
+        extension = "txt" if parametros["formato"] == "txt" else "jdx"
+        ruta = os.path.join(directorio, f"ftir_{parametros['formato']}_{parametros['puntos']}.{extension}")
+        generar_ftir(ruta, parametros["puntos"], parametros["formato"])
+        with _entorno(WH_CACHE_ESPECTROS="0"):
+            yield dict(parametros, bytes=os.path.getsize(ruta)), cronometrar(lambda: leer_espectro_ftir(ruta), repeticiones)
+
+
+def bench_preprocesado(directorio, rapido, repeticiones):
+    from preprocesado import extraer_picos_lote
+    for parametros in _combinaciones("preprocesado", rapido):
+        two_theta = np.linspace(10.0, 90.0, parametros["puntos"])
+        escaneos = [(two_theta, perfil_xrd(two_theta, 30, np.random.default_rng(k)))
+                    for k in range(parametros["muestras"])]
+        yield parametros, cronometrar(lambda: extraer_picos_lote(escaneos), repeticiones)
+
+
+def bench_puntuacion(directorio, rapido, repeticiones):
+    from puntuacion import puntuar_candidatos
+    for parametros in _combinaciones("puntuacion", rapido):
+        patrones = patrones_sinteticos(parametros["candidatos"])
+        exp_peaks = picos_sinteticos(parametros["picos"])
+        yield parametros, cronometrar(lambda: puntuar_candidatos(patrones, exp_peaks, 0.55), repeticiones)
+
+
+def _identificador(directorio_patrones=None, materiales=20, atomos=8, procesos=1):
+    import esprayx
+    config = dict(esprayx.CONFIGURACION, CACHE_MP_RUTA=None, PATRONES_DIR=directorio_patrones,
+                  PROCESOS_SIMULACION=procesos, MODO_PUNTUACION="picos", PRECARGA=False,
+                  BUSCAR_SUBSISTEMAS=False, SCORE_THRESHOLD=0.0)
+    mpr = MPResterFalso(materiales=materiales, atomos=atomos)
+    return esprayx.InteractivePhaseIdentifier(config, mpr, None, esprayx.crear_almacen_patrones(config))
+
+
+def bench_simulacion(directorio, rapido, repeticiones):
+    for parametros in _combinaciones("simulacion", rapido):
+        identificador = _identificador(materiales=parametros["candidatos"], atomos=parametros["atomos"])
+        docs = identificador.mpr.buscar(elements=["Fe", "O"])
+        with _silenciar():
+            medida = cronometrar(lambda: identificador.simular_candidatos("Fe-O", docs), repeticiones, calentamiento=0)
+        identificador.cerrar()
+        yield parametros, medida
+
+
+def bench_identificacion(directorio, rapido, repeticiones):
+    """search_and_score completo con el almacén de patrones ya lleno: consulta, carga de patrones y puntuación."""
+    for parametros in _combinaciones("identificacion", rapido):
+        patrones = os.path.join(directorio, f"patrones_{parametros['materiales']}")
+        identificador = _identificador(patrones, materiales=parametros["materiales"], atomos=4)
+        exp_peaks = picos_sinteticos(parametros["picos"])
+        with _silenciar():
+            # La primera búsqueda simula y llena el almacén; no se mide
+            if not identificador.search_and_score(["Fe", "O"], exp_peaks):
+                raise RuntimeError("la búsqueda no devolvió candidatos puntuados")
+            medida = cronometrar(lambda: identificador.search_and_score(["Fe", "O"], exp_peaks),
+                                 repeticiones, calentamiento=0)
+        identificador.cerrar()
+        yield parametros, medida
+
+
+def bench_graficas(directorio, rapido, repeticiones):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    for parametros in _combinaciones("graficas", rapido):
+        script, muestras, puntos = parametros["script"], parametros["muestras"], parametros["puntos"]
+        tecnica = "ftir" if script == "comparar" else "xrd"
+        rutas = []
+        for k in range(muestras):
+            if tecnica == "xrd":
+                ruta = os.path.join(directorio, f"grafica_{puntos}_{k}.xrdml")
+                if not os.path.exists(ruta):
+                    generar_xrdml(ruta, puntos, semilla=k)
+            else:
+                ruta = os.path.join(directorio, f"grafica_{puntos}_{k}.txt")
+                if not os.path.exists(ruta):
+                    generar_ftir(ruta, puntos, semilla=k)
+            rutas.append(ruta)
+        salida = os.path.join(directorio, f"grafica_{script}.{'jpg' if tecnica == 'xrd' else 'png'}")
+
+        if script == "figuras_lote":
+            from figuras_lote import olvidar_espectros, renderizar_figura
+            figura = {"salida": salida, "entradas": rutas, "modo": "crudo", "tecnica": "xrd"}
+
+            def dibujar():
+                # Como los otros scripts, cada repetición vuelve a leer los archivos
+                olvidar_espectros()
+                renderizar_figura(figura)
+        else:
+            if script == "raw":
+                from raw import comparar_difractogramas_crudo as funcion
+            elif script == "analisis":
+                from analisis import comparar_difractogramas as funcion
+            else:
+                from comparar import comparar_espectros as funcion
+
+            def dibujar():
+                funcion(rutas, salida)
+                plt.close("all")
+
+        # Sin caché de espectros: se mide leer y dibujar, y no se escribe en la caché del usuario
+        with _silenciar(), _entorno(WH_CACHE_ESPECTROS="0"):
+            medida = cronometrar(dibujar, repeticiones)
+        yield parametros, medida
+
+
+BENCHMARKS = {
+    "lectura_xrdml": bench_lectura_xrdml,
+    "lectura_ftir": bench_lectura_ftir,
+    "preprocesado": bench_preprocesado,
+    "puntuacion": bench_puntuacion,
+    "simulacion": bench_simulacion,
+    "identificacion": bench_identificacion,
+    "graficas": bench_graficas,
+}
+
+
+def ejecutar(nombres=None, rapido=False, repeticiones=5, directorio=None):
+    """
+    Ejecuta los benchmarks 'nombres' (todos por defecto) y devuelve el informe.
+
+    Los archivos sintéticos se generan en 'directorio' (uno temporal si es
+    None) y no cuentan en los tiempos.
+    """
+    temporal = directorio is None
+    directorio = directorio or tempfile.mkdtemp(prefix="wh_bench_")
+    resultados = []
+    try:
+        for nombre in nombres or BENCHMARKS:
+            print(f"\n--- {nombre} ---")
+            for parametros, medida in BENCHMARKS[nombre](directorio, rapido, repeticiones):
+                resultados.append({"benchmark": nombre, "parametros": parametros, **medida})
+                descripcion = ", ".join(f"{k}={v}" for k, v in parametros.items())
+                print(f"  {descripcion:<50} mediana {medida['mediana_s'] * 1000:10.2f} ms")
+    finally:
+        if temporal:
+            shutil.rmtree(directorio, ignore_errors=True)
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "procesadores": os.cpu_count(),
+        "rapido": rapido,
+        "resultados": resultados,
+    }
+
+
+def _clave(resultado):
+    return resultado["benchmark"], json.dumps(resultado["parametros"], sort_keys=True)
+
+
+def comparar_informes(base, actual, umbral=1.2):
+    """
+    Compara las medianas de dos informes y devuelve las regresiones
+    [(benchmark, parámetros, cociente)] con cociente actual/base > umbral.
+    """
+    anteriores = {_clave(r): r for r in base["resultados"]}
+    regresiones = []
+    for resultado in actual["resultados"]:
+        anterior = anteriores.get(_clave(resultado))
+        if anterior is None or anterior["mediana_s"] <= 0:
+            continue
+        cociente = resultado["mediana_s"] / anterior["mediana_s"]
+        if cociente > umbral:
+            regresiones.append((resultado["benchmark"], resultado["parametros"], cociente))
+    return regresiones
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de lectura, puntuación, simulación y gráficas.")
+    parser.add_argument("benchmarks", nargs="*", help=f"Benchmarks a ejecutar: {', '.join(BENCHMARKS)} (todos por defecto).")
+    parser.add_argument("-o", "--salida", default="benchmark.json", help="Archivo JSON con los resultados.")
+    parser.add_argument("-r", "--repeticiones", type=int, default=5)
+    parser.add_argument("--rapido", action="store_true", help="Barridos reducidos, para una comprobación rápida.")
+    parser.add_argument("--directorio", help="Dónde generar los datos sintéticos (por defecto, uno temporal).")
+    parser.add_argument("--comparar", metavar="BASE.json", help="Informe anterior contra el que buscar regresiones.")
+    parser.add_argument("--umbral", type=float, default=1.2, help="Cociente de medianas que cuenta como regresión.")
+    args = parser.parse_args(argumentos)
+    desconocidos = [b for b in args.benchmarks if b not in BENCHMARKS]
+    if desconocidos:
+        parser.error(f"benchmark desconocido: {', '.join(desconocidos)}")
+
+    informe = ejecutar(args.benchmarks, args.rapido, args.repeticiones, args.directorio)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\n¡Listo! {len(informe['resultados'])} resultado(s) guardados en: {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar_informes(base, informe, args.umbral)
+        if not regresiones:
+            print(f"Sin regresiones respecto a '{args.comparar}' (umbral x{args.umbral}).")
+            return 0
+        print(f"\n{len(regresiones)} regresión(es) respecto a '{args.comparar}':")
+        for nombre, parametros, cociente in regresiones:
+            descripcion = ", ".join(f"{k}={v}" for k, v in parametros.items())
+            print(f"  {nombre:<16} {descripcion:<50} x{cociente:.2f}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
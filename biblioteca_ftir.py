@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import numpy as np
+
+from lector_ftir import leer_espectro_ftir
+
+
+RUTA_BIBLIOTECA_POR_DEFECTO = os.path.join(os.path.expanduser("~"), ".cache", "water-hyacinth", "biblioteca_ftir")
+METRICAS = ('coseno', 'correlacion')
+
+
+def absorbancia(y, yunits):
+    """
+    Convierte transmitancia (%T o fracción) a absorbancia; otras unidades se dejan igual.
+
+    Sin unidades se supone %T, como en las gráficas, salvo que los valores
+    parezcan ya absorbancia (máximo de 5 o menos).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if not yunits:
+        yunits = '%T' if np.nanmax(y) > 5 else 'ABSORBANCE'
+    unidades = yunits.upper().replace(' ', '')
+    if unidades in ('%T', 'TRANSMITTANCE', 'TRANSMITANCIA') or unidades.startswith('%T'):
+        transmitancia = y / 100.0 if unidades.startswith('%') or np.nanmax(y) > 1.5 else y
+        return -np.log10(np.clip(transmitancia, 1e-4, None))
+    return y
+
+
+def preparar_espectro(x, y, yunits, eje):
+    """
+    Lleva un espectro al eje de la biblioteca: absorbancia, interpolación
+    lineal, sin el mínimo y con ceros fuera del rango medido.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    a = absorbancia(y, yunits)
+    if x[0] > x[-1]:
+        x, a = x[::-1], a[::-1]
+    fila = np.interp(eje, x, a)
+    medido = (eje >= x[0]) & (eje <= x[-1])
+    if not medido.any():
+        raise ValueError("el espectro no cubre ningún punto del eje de la biblioteca")
+    fila -= fila[medido].min()
+    fila[~medido] = 0.0
+    return fila
+
+
+def _normalizar_filas(filas):
+    """Filas con norma 1 y su media; las filas nulas se dejan en cero."""
+    normas = np.linalg.norm(filas, axis=1, keepdims=True)
+    filas = np.divide(filas, normas, out=np.zeros_like(filas), where=normas > 0)
+    return filas, filas.mean(axis=1)
+
+
+def _dividir(numerador, denominador, minimo=1e-12):
+    """Cociente elemento a elemento; NaN donde el espectro es plano (denominador ~0)."""
+    resultado = np.full(len(numerador), np.nan)
+    validos = denominador > minimo
+    resultado[validos] = numerador[validos] / denominador[validos]
+    return resultado
+
+
+def _tramos(eje, ventanas):
+    """Convierte ventanas [(nu1, nu2), ...] en cm-1 a rebanadas de columnas sin solaparse."""
+    tramos = []
+    for a, b in ventanas:
+        inicio = int(np.searchsorted(eje, min(a, b), side='left'))
+        fin = int(np.searchsorted(eje, max(a, b), side='right'))
+        if fin > inicio:
+            tramos.append((inicio, fin))
+    tramos.sort()
+    unidos = []
+    for inicio, fin in tramos:
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fin))
+        else:
+            unidos.append((inicio, fin))
+    return [slice(inicio, fin) for inicio, fin in unidos]
+
+
+class BibliotecaFTIR:
+    """
+    Biblioteca de espectros FTIR de referencia para búsqueda por similitud.
+
+    Los espectros se guardan en absorbancia sobre un eje fijo de números de
+    onda, como una matriz float32 (espectros x puntos) con cada fila de norma
+    1, más la media de cada fila. Así, en todo el rango, coseno y correlación
+    salen de un único producto matriz-vector sobre la matriz abierta con
+    memory-map. Con ventanas se usan solo esas columnas y se renormaliza
+    dentro de ellas.
+
+    El directorio tiene un meta.json con los nombres y la versión vigente y,
+    por versión, un subdirectorio de versiones/ con eje.npy, espectros.npy y
+    medias.npy.
+    Cada construcción escribe una versión nueva completa y la publica
+    reemplazando meta.json, así un lector nunca ve arreglos de versiones
+    distintas.
+    """
+
+    def __init__(self, directorio=RUTA_BIBLIOTECA_POR_DEFECTO):
+        self.directorio = directorio
+        with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.nombres = meta["nombres"]
+        # Bibliotecas anteriores a las versiones guardaban los arreglos junto a meta.json
+        datos = os.path.join(directorio, meta.get("version", ""))
+        self.eje = np.load(os.path.join(datos, "eje.npy"))
+        self.espectros = np.load(os.path.join(datos, "espectros.npy"), mmap_mode='r')
+        self.medias = np.load(os.path.join(datos, "medias.npy"))
+        if self.espectros.shape != (len(self.nombres), len(self.eje)) or len(self.medias) != len(self.nombres):
+            raise ValueError(f"biblioteca FTIR inconsistente en '{directorio}': "
+                             f"{len(self.nombres)} nombres, espectros {self.espectros.shape}")
+
+    @staticmethod
+    def construir(directorio, rutas, minimo=400.0, maximo=4000.0, paso=2.0, agregar=False):
+        """
+        Crea (o con agregar=True amplía) la biblioteca con los espectros de 'rutas'.
+
+        Los archivos que no se pueden leer se avisan y se omiten. Los arreglos
+        se escriben (la matriz con memory-map) en un subdirectorio de versión
+        nuevo, que se publica al final reemplazando meta.json de una vez. Se
+        conserva la versión anterior para los lectores que aún la tengan
+        abierta; las más antiguas se eliminan.
+
+        Returns:
+            BibliotecaFTIR: La biblioteca ya abierta.
+        """
+        previa = None
+        if agregar and os.path.isfile(os.path.join(directorio, "meta.json")):
+            previa = BibliotecaFTIR(directorio)
+            eje = previa.eje
+        else:
+            eje = np.arange(minimo, maximo + paso / 2, paso)
+
+        filas, medias_nuevas, nombres = [], [], []
+        for ruta_archivo in rutas:
+            try:
+                espectro = leer_espectro_ftir(ruta_archivo)
+                fila = preparar_espectro(espectro['x'], espectro['y'], espectro['yunits'], eje)
+            except Exception as e:
+                print(f"Advertencia: se omite '{ruta_archivo}' ({e}).")
+                continue
+            fila, media = _normalizar_filas(fila[None, :])
+            filas.append(fila[0].astype(np.float32))
+            medias_nuevas.append(media[0])
+            nombres.append(os.path.splitext(os.path.basename(ruta_archivo))[0])
+
+        versiones = os.path.join(directorio, "versiones")
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        datos = os.path.join(versiones, version)
+        os.makedirs(datos)
+        num_previos = 0 if previa is None else len(previa)
+        total = num_previos + len(filas)
+        matriz = np.lib.format.open_memmap(os.path.join(datos, "espectros.npy"), mode='w+',
+                                           dtype=np.float32, shape=(total, len(eje)))
+        medias = np.empty(total, dtype=np.float32)
+        if previa is not None:
+            matriz[:num_previos] = previa.espectros
+            medias[:num_previos] = previa.medias
+            nombres = previa.nombres + nombres
+            del previa
+        for i, fila in enumerate(filas):
+            matriz[num_previos + i] = fila
+        medias[num_previos:] = medias_nuevas
+        matriz.flush()
+        del matriz
+
+        np.save(os.path.join(datos, "eje.npy"), eje)
+        np.save(os.path.join(datos, "medias.npy"), medias)
+
+        anterior = None
+        try:
+            with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+                anterior = json.load(f).get("version")
+        except (OSError, ValueError):
+            pass
+        temporal = os.path.join(directorio, f"meta.json.{os.getpid()}")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"version": f"versiones/{version}", "nombres": nombres}, f, ensure_ascii=False)
+        os.replace(temporal, os.path.join(directorio, "meta.json"))
+
+        # Solo se tocan los subdirectorios que genera construir, nunca otras carpetas del usuario
+        conservar = {version, os.path.basename(anterior or "")}
+        for nombre in os.listdir(versiones):
+            if re.fullmatch(r"v\d+-\d+", nombre) and nombre not in conservar:
+                shutil.rmtree(os.path.join(versiones, nombre), ignore_errors=True)
+        if anterior is None:
+            for nombre in ("eje.npy", "espectros.npy", "medias.npy"):
+                if os.path.isfile(os.path.join(directorio, nombre)):
+                    os.remove(os.path.join(directorio, nombre))
+        return BibliotecaFTIR(directorio)
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def similitudes(self, x, y, yunits=None, metrica='coseno', ventanas=None):
+        """Similitud (-1 a 1) del espectro (x, y) con cada espectro de la biblioteca."""
+        if metrica not in METRICAS:
+            raise ValueError(f"métrica desconocida: '{metrica}' (usa {', '.join(METRICAS)})")
+        consulta = preparar_espectro(x, y, yunits, self.eje)
+
+        if not ventanas:
+            q, media_q = _normalizar_filas(consulta[None, :])
+            productos = self.espectros @ q[0].astype(np.float32)
+            if metrica == 'coseno':
+                return productos.astype(np.float64)
+            n = len(self.eje)
+            medias = self.medias.astype(np.float64)
+            numerador = productos - n * medias * media_q[0]
+            denominador = np.sqrt(np.maximum(1.0 - n * medias ** 2, 0.0) * max(1.0 - n * media_q[0] ** 2, 0.0))
+            return _dividir(numerador, denominador)
+
+        tramos = _tramos(self.eje, ventanas)
+        if not tramos:
+            raise ValueError("ninguna ventana cae dentro del eje de la biblioteca")
+        productos = np.zeros(len(self))
+        sumas = np.zeros(len(self))
+        cuadrados = np.zeros(len(self))
+        q = np.concatenate([consulta[t] for t in tramos])
+        n = len(q)
+        for tramo in tramos:
+            bloque = self.espectros[:, tramo]
+            productos += bloque @ consulta[tramo].astype(np.float32)
+            sumas += bloque.sum(axis=1, dtype=np.float64)
+            cuadrados += np.einsum('ij,ij->i', bloque, bloque, dtype=np.float64)
+        if metrica == 'coseno':
+            return _dividir(productos, np.sqrt(cuadrados * np.dot(q, q)))
+        varianza_q = max(np.dot(q, q) - q.sum() ** 2 / n, 0.0)
+        return _dividir(productos - sumas * q.sum() / n,
+                        np.sqrt(np.maximum(cuadrados - sumas ** 2 / n, 0.0) * varianza_q))
+
+    def buscar(self, x, y, yunits=None, k=10, metrica='coseno', ventanas=None):
+        """
+        Las 'k' referencias más parecidas al espectro (x, y).
+
+        Returns:
+            list: Diccionarios con 'nombre', 'indice' y 'similitud', de mayor a menor.
+        """
+        similitud = np.nan_to_num(self.similitudes(x, y, yunits, metrica, ventanas), nan=-np.inf)
+        k = min(k, len(similitud))
+        if k <= 0:
+            return []
+        mejores = np.argpartition(-similitud, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitud[mejores], kind='stable')]
+        return [
+            {"nombre": self.nombres[i], "indice": int(i), "similitud": float(similitud[i])}
+            for i in mejores
+        ]
+
+
+def _ventana(texto):
+    a, b = texto.split('-', 1)
+    return float(a), float(b)
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Biblioteca de espectros FTIR de referencia.")
+    subparsers = parser.add_subparsers(dest="accion", required=True)
+
+    construir = subparsers.add_parser("construir", help="Crea o amplía la biblioteca.")
+    construir.add_argument("archivos", nargs="+", help="Espectros de referencia (.txt, .jdx, .dx).")
+    construir.add_argument("-d", "--directorio", default=RUTA_BIBLIOTECA_POR_DEFECTO)
+    construir.add_argument("--agregar", action="store_true", help="Añadir a una biblioteca existente.")
+    construir.add_argument("--paso", type=float, default=2.0, help="Paso del eje en cm-1.")
+    construir.add_argument("--rango", type=_ventana, default=(400.0, 4000.0), help="Rango del eje, p. ej. 400-4000.")
+
+    buscar = subparsers.add_parser("buscar", help="Busca los espectros de referencia más parecidos.")
+    buscar.add_argument("archivo", help="Espectro a identificar.")
+    buscar.add_argument("-d", "--directorio", default=RUTA_BIBLIOTECA_POR_DEFECTO)
+    buscar.add_argument("-k", type=int, default=10, help="Número de resultados.")
+    buscar.add_argument("--metrica", choices=METRICAS, default="coseno")
+    buscar.add_argument("--ventana", type=_ventana, action="append",
+                        help="Limitar a una ventana de números de onda, p. ej. 1800-1500 (repetible).")
+    args = parser.parse_args(argumentos)
+
+    if args.accion == "construir":
+        minimo, maximo = sorted(args.rango)
+        biblioteca = BibliotecaFTIR.construir(args.directorio, args.archivos, minimo, maximo, args.paso, args.agregar)
+        print(f"\n¡Listo! La biblioteca en '{args.directorio}' tiene {len(biblioteca)} espectro(s).")
+        return 0
+
+    biblioteca = BibliotecaFTIR(args.directorio)
+    espectro = leer_espectro_ftir(args.archivo)
+    resultados = biblioteca.buscar(espectro['x'], espectro['y'], espectro['yunits'],
+                                   args.k, args.metrica, args.ventana)
+    print(f"\nEspectros más parecidos a '{os.path.basename(args.archivo)}' ({args.metrica}):")
+    for posicion, resultado in enumerate(resultados, start=1):
+        print(f"  {posicion:>3}. {resultado['nombre']:<40} {resultado['similitud']:.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+from instrumentacion import contar
+
+
+RUTA_CACHE_POR_DEFECTO = os.path.join(os.path.expanduser("~"), ".cache", "water-hyacinth", "espectros")
+
+
+def hash_contenido(ruta_archivo, bloque=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta_archivo, 'rb') as f:
+        for trozo in iter(lambda: f.read(bloque), b''):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def _serializar(valor, arreglos):
+    """Convierte el resultado de un lector a JSON, separando los np.ndarray para guardarlos como .npy."""
+    if isinstance(valor, np.ndarray):
+        nombre = f"a{len(arreglos)}"
+        arreglos[nombre] = valor
+        return {"__npy__": nombre}
+    if isinstance(valor, dict):
+        return {str(k): _serializar(v, arreglos) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_serializar(v, arreglos) for v in valor]
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def _solo_lectura(valor):
+    """Marca como no escribibles los np.ndarray del resultado de un lector, igual que los memmap de la caché."""
+    if isinstance(valor, np.ndarray):
+        valor.setflags(write=False)
+    elif isinstance(valor, dict):
+        for v in valor.values():
+            _solo_lectura(v)
+    elif isinstance(valor, (list, tuple)):
+        for v in valor:
+            _solo_lectura(v)
+    return valor
+
+
+def _tamano(directorio):
+    """Bytes de los archivos de 'directorio' (0 si no existe)."""
+    try:
+        return sum(e.stat().st_size for e in os.scandir(directorio) if e.is_file())
+    except OSError:
+        return 0
+
+
+def _deserializar(valor, directorio):
+    if isinstance(valor, dict):
+        if set(valor) == {"__npy__"}:
+            return np.load(os.path.join(directorio, valor["__npy__"] + ".npy"), mmap_mode='r')
+        return {k: _deserializar(v, directorio) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_deserializar(v, directorio) for v in valor]
+    return valor
+
+
+class CacheEspectros:
+    """
+    Caché en disco de archivos ya parseados (XRDML, FTIR).
+
+    Cada entrada es un directorio con los arreglos en .npy (que se abren con
+    memory-map) y un meta.json con el resto del resultado. Una entrada es
+    válida si coinciden el tamaño y el mtime del archivo original; si solo
+    cambió el mtime se compara el hash del contenido antes de descartarla.
+    Cuando el total supera 'max_bytes' se eliminan las entradas usadas hace
+    más tiempo, hasta quedar en el 90 %. El total se lleva en memoria y el
+    directorio solo se recorre la primera vez y cuando se pasa del límite
+    (otros procesos también guardan, así que entonces se vuelve a contar).
+    """
+
+    def __init__(self, directorio=RUTA_CACHE_POR_DEFECTO, max_bytes=2 * 1024 ** 3):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._total = None
+        os.makedirs(directorio, exist_ok=True)
+
+    def _directorio_entrada(self, ruta_archivo, tipo):
+        clave = hashlib.sha1(f"{tipo}|{os.path.abspath(ruta_archivo)}".encode()).hexdigest()
+        return os.path.join(self.directorio, clave)
+
+    def _leer_meta(self, entrada):
+        try:
+            with open(os.path.join(entrada, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cargar(self, ruta_archivo, tipo, lector):
+        """
+        Devuelve lector(ruta_archivo), desde la caché si el archivo no cambió.
+
+        'tipo' distingue lectores (y sus versiones) para un mismo archivo. Si el
+        lector devuelve None (error de lectura) no se guarda nada.
+
+        Los arreglos del resultado son siempre de solo lectura: en un acierto
+        son np.memmap de la caché y en un fallo se marcan igual, para que una
+        modificación en el sitio falle desde la primera ejecución y no solo
+        cuando el archivo ya está en caché. Quien necesite modificarlos debe
+        copiarlos antes (np.array(...)).
+        """
+        estado = os.stat(ruta_archivo)
+        entrada = self._directorio_entrada(ruta_archivo, tipo)
+        meta = self._leer_meta(entrada)
+
+        if meta is not None and meta["tamano"] == estado.st_size:
+            vigente = meta["mtime_ns"] == estado.st_mtime_ns
+            if not vigente and meta["hash"] == hash_contenido(ruta_archivo):
+                # Mismo contenido con otro mtime (copia, touch): se actualiza el mtime guardado
+                vigente = True
+                meta["mtime_ns"] = estado.st_mtime_ns
+                self._escribir_meta(entrada, meta)
+            if vigente:
+                try:
+                    resultado = _deserializar(meta["resultado"], entrada)
+                except (OSError, ValueError):
+                    resultado = None
+                if resultado is not None:
+                    self.aciertos += 1
+                    contar("cache_espectros.aciertos")
+                    try:
+                        os.utime(os.path.join(entrada, "meta.json"))
+                    except OSError:
+                        # Otro proceso desalojó la entrada: los memmap ya abiertos siguen siendo válidos
+                        pass
+                    return resultado
+
+        self.fallos += 1
+        contar("cache_espectros.fallos")
+        resultado = lector(ruta_archivo)
+        if resultado is not None:
+            self._guardar(entrada, ruta_archivo, estado, resultado)
+        return _solo_lectura(resultado)
+
+    def _escribir_meta(self, entrada, meta):
+        temporal = os.path.join(entrada, f"meta.json.{os.getpid()}")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporal, os.path.join(entrada, "meta.json"))
+
+    def _guardar(self, entrada, ruta_archivo, estado, resultado):
+        arreglos = {}
+        meta = {
+            "archivo": os.path.abspath(ruta_archivo),
+            "tamano": estado.st_size,
+            "mtime_ns": estado.st_mtime_ns,
+            "hash": hash_contenido(ruta_archivo),
+            "resultado": _serializar(resultado, arreglos),
+        }
+        temporal = f"{entrada}.tmp{os.getpid()}"
+        shutil.rmtree(temporal, ignore_errors=True)
+        try:
+            os.makedirs(temporal)
+            for nombre, arreglo in arreglos.items():
+                np.save(os.path.join(temporal, nombre + ".npy"), np.ascontiguousarray(arreglo))
+            self._escribir_meta(temporal, meta)
+            diferencia = _tamano(temporal) - _tamano(entrada)
+            shutil.rmtree(entrada, ignore_errors=True)
+            os.rename(temporal, entrada)
+        except OSError:
+            # Otro proceso escribió la misma entrada a la vez; basta con una de las dos
+            shutil.rmtree(temporal, ignore_errors=True)
+            return
+        self._desalojar(diferencia)
+
+    def _desalojar(self, diferencia=0):
+        if self.max_bytes is None:
+            return
+        if self._total is not None:
+            self._total += diferencia
+            if self._total <= self.max_bytes:
+                return
+        entradas = []
+        total = 0
+        for nombre in os.listdir(self.directorio):
+            entrada = os.path.join(self.directorio, nombre)
+            meta = os.path.join(entrada, "meta.json")
+            if not os.path.isfile(meta):
+                continue
+            tamano = _tamano(entrada)
+            entradas.append((os.path.getmtime(meta), tamano, entrada))
+            total += tamano
+        # Se baja hasta el 90 % para que las siguientes escrituras no vuelvan a recorrer el directorio
+        objetivo = self.max_bytes * 0.9
+        for _, tamano, entrada in sorted(entradas):
+            if total <= objetivo:
+                break
+            shutil.rmtree(entrada, ignore_errors=True)
+            total -= tamano
+        self._total = total
+
+    def limpiar(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        os.makedirs(self.directorio, exist_ok=True)
+        self._total = 0
+
+
+_CACHE_GLOBAL = {}
+
+def cache_por_defecto():
+    """
+    Caché compartida por los lectores. Se configura con variables de entorno:
+    WH_CACHE_ESPECTROS=0 la desactiva, WH_CACHE_ESPECTROS_DIR cambia el
+    directorio y WH_CACHE_ESPECTROS_MB el tamaño máximo.
+    """
+    if os.getenv("WH_CACHE_ESPECTROS", "1") == "0":
+        return None
+    directorio = os.getenv("WH_CACHE_ESPECTROS_DIR", RUTA_CACHE_POR_DEFECTO)
+    if directorio not in _CACHE_GLOBAL:
+        try:
+            max_mb = float(os.getenv("WH_CACHE_ESPECTROS_MB", "2048"))
+            _CACHE_GLOBAL[directorio] = CacheEspectros(directorio, max_bytes=int(max_mb * 1024 * 1024))
+        except OSError as e:
+            print(f"Advertencia: no se pudo usar la caché de espectros en '{directorio}' ({e}).")
+            _CACHE_GLOBAL[directorio] = None
+    return _CACHE_GLOBAL[directorio]
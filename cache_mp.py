@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from instrumentacion import contar, etapa
+
+
+RUTA_CACHE_POR_DEFECTO = os.path.join(os.path.expanduser("~"), ".cache", "water-hyacinth", "mp_cache.sqlite")
+# Campos que mp_api añade a cada documento y que no son datos del material
+_CAMPOS_INTERNOS = ("fields_not_requested", "unavailable_fields")
+
+
+def _a_datos(doc):
+    """
+    Documento de Materials Project como dict apto para JSON.
+
+    Los documentos de mp_api son modelos pydantic creados al vuelo
+    (MPDataDoc) que no se pueden serializar con pickle; se guardan sus
+    campos, y los objetos de pymatgen (Structure) con su as_dict().
+    """
+    if hasattr(doc, "model_dump"):
+        datos = doc.model_dump(mode="json")
+        # En modo JSON los MPID se reescriben en otro formato; se guardan tal como se ven (str)
+        for campo in datos:
+            valor = doc.__dict__.get(campo)
+            if isinstance(valor, str):
+                datos[campo] = str(valor)
+    elif isinstance(doc, dict):
+        datos = dict(doc)
+    else:
+        datos = dict(vars(doc))
+    return {
+        campo: valor.as_dict() if hasattr(valor, "as_dict") else valor
+        for campo, valor in datos.items() if campo not in _CAMPOS_INTERNOS
+    }
+
+
+def _desde_datos(datos):
+    """Reconstruye un documento ligero (atributos como los de mp_api) a partir de _a_datos."""
+    valores = {}
+    for campo, valor in datos.items():
+        if isinstance(valor, dict) and "@module" in valor:
+            from monty.json import MontyDecoder
+            valor = MontyDecoder().process_decoded(valor)
+        valores[campo] = valor
+    return SimpleNamespace(**valores)
+
+
+class CacheMaterialsProject:
+    """
+    Caché local en SQLite de las consultas a Materials Project.
+
+    Cada entrada se identifica por el sistema químico y los parámetros de la
+    consulta (campos incluidos), y guarda los campos de los documentos como
+    JSON comprimido; al leerla se devuelven objetos con los mismos atributos.
+    Las entradas caducan tras 'ttl_segundos' y, si el archivo supera 'max_bytes',
+    se eliminan las de acceso más antiguo (LRU). En modo 'offline' nunca se
+    consulta la red: lo que no está en caché se reporta como vacío.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE_POR_DEFECTO, ttl_segundos=30 * 24 * 3600,
+                 max_bytes=512 * 1024 * 1024, offline=False):
+        self.ruta = ruta
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS consultas ("
+            " clave TEXT PRIMARY KEY,"
+            " creado REAL NOT NULL,"
+            " ultimo_acceso REAL NOT NULL,"
+            " tamano INTEGER NOT NULL,"
+            " datos BLOB NOT NULL)"
+        )
+        self._conexion.commit()
+
+    @staticmethod
+    def clave(**criterios):
+        """Clave canónica: elementos y campos ordenados, independiente del orden de entrada."""
+        normalizado = {}
+        for nombre, valor in criterios.items():
+            if valor is None:
+                continue
+            if nombre in ("elements", "fields", "material_ids"):
+                valor = sorted(str(v) for v in valor)
+            elif isinstance(valor, tuple):
+                valor = list(valor)
+            normalizado[nombre] = valor
+        if "elements" in normalizado:
+            normalizado["chemsys"] = "-".join(normalizado["elements"])
+        return json.dumps(normalizado, sort_keys=True)
+
+    def obtener(self, clave):
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT creado, datos FROM consultas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return None
+            creado, datos = fila
+            if self.ttl_segundos is not None and time.time() - creado > self.ttl_segundos and not self.offline:
+                # En modo offline se prefiere un dato caducado a ninguno
+                self._conexion.execute("DELETE FROM consultas WHERE clave = ?", (clave,))
+                self._conexion.commit()
+                self.fallos += 1
+                return None
+            self._conexion.execute(
+                "UPDATE consultas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+            )
+            self._conexion.commit()
+        try:
+            docs = [_desde_datos(d) for d in json.loads(zlib.decompress(datos))]
+        except (zlib.error, ValueError, TypeError, AttributeError):
+            # Entrada de un formato anterior (pickle) o dañada: se descarta
+            with self._lock:
+                self._conexion.execute("DELETE FROM consultas WHERE clave = ?", (clave,))
+                self._conexion.commit()
+                self.fallos += 1
+            return None
+        with self._lock:
+            self.aciertos += 1
+        return docs
+
+    def guardar(self, clave, docs):
+        datos = zlib.compress(json.dumps([_a_datos(doc) for doc in docs]).encode("utf-8"))
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO consultas (clave, creado, ultimo_acceso, tamano, datos)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (clave, ahora, ahora, len(datos), datos),
+            )
+            self._conexion.commit()
+            self._desalojar()
+
+    def _desalojar(self):
+        if self.max_bytes is None:
+            return
+        total = self._conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM consultas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        filas = self._conexion.execute(
+            "SELECT clave, tamano FROM consultas ORDER BY ultimo_acceso ASC"
+        ).fetchall()
+        for clave, tamano in filas:
+            if total <= self.max_bytes:
+                break
+            self._conexion.execute("DELETE FROM consultas WHERE clave = ?", (clave,))
+            total -= tamano
+        self._conexion.commit()
+
+    def buscar(self, mpr, **criterios):
+        """
+        Equivalente a mpr.materials.summary.search(**criterios) pero servido
+        desde la caché cuando es posible.
+        """
+        clave = self.clave(**criterios)
+        docs = self.obtener(clave)
+        if docs is not None:
+            contar("cache_mp.aciertos")
+            return docs
+        contar("cache_mp.fallos")
+        if self.offline or mpr is None:
+            print("Modo offline: la consulta no está en la caché local.")
+            return []
+        with etapa("mp.servidor"):
+            docs = mpr.materials.summary.search(**criterios)
+        try:
+            self.guardar(clave, docs)
+        except (TypeError, ValueError, sqlite3.Error) as e:
+            # Un documento que no se puede guardar no debe perder la respuesta del servidor
+            print(f"Advertencia: no se pudo guardar la consulta en la caché local ({e}).")
+        return docs
+
+    def limpiar(self):
+        with self._lock:
+            self._conexion.execute("DELETE FROM consultas")
+            self._conexion.commit()
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
@@ -1,54 +1,46 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import sys
 import os
-from matplotlib.ticker import MultipleLocator
+from lector_ftir import leer_espectro_ftir
+from decimacion import reducir_traza, resolver_presupuesto, separar_opcion_puntos
+from instrumentacion import cronometrado, etapa
 
-def comparar_espectros(archivos_entrada, nombre_salida):
+@cronometrado("grafica.comparar")
+def comparar_espectros(archivos_entrada, nombre_salida, puntos_max=None):
     """
     Lee múltiples archivos de espectro infrarrojo y los grafica juntos.
 
     Args:
         archivos_entrada (list): Una lista de rutas a los archivos de datos .txt.
         nombre_salida (str): El nombre del archivo de imagen para guardar la gráfica.
+        puntos_max (int | str, opcional): Puntos máximos por espectro, 'auto' para
+            ajustarlos al ancho de la figura o None para graficar todos.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MultipleLocator
+
     plt.figure(figsize=(15, 8))
+    columnas = resolver_presupuesto(puntos_max, ancho_pulgadas=15, dpi=plt.rcParams['figure.dpi'])
     
     x_units = "1/CM"
     y_units = "%T"
 
     for ruta_archivo in archivos_entrada:
         try:
-            # Leer las unidades de las primeras líneas del archivo (solo para la primera gráfica)
-            with open(ruta_archivo, 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if line.startswith('##XUNITS='):
-                        x_units = line.strip().split('=')[1]
-                    elif line.startswith('##YUNITS='):
-                        y_units = line.strip().split('=')[1]
-                    elif not line.startswith('##'):
-                        break
-
-            # Leer los datos numéricos usando pandas
-            data = pd.read_csv(
-                ruta_archivo,
-                comment='#',
-                sep=r'\s+',
-                header=None,
-                names=['x', 'y']
-            )
+            # Leer encabezado (unidades) y datos numéricos en una sola pasada
+            espectro = leer_espectro_ftir(ruta_archivo)
+            x_units = espectro['xunits'] or x_units
+            y_units = espectro['yunits'] or y_units
 
-            # Normalización Min-Max de los datos de transmitancia (eje Y)
-            y_min = data['y'].min()
-            y_max = data['y'].max()
-            data['y_norm'] = (data['y'] - y_min) / (y_max - y_min)
+            # Normalización Min-Max sobre los puntos medidos de cada espectro (sin interpolar a un eje común)
+            y_min = espectro['y'].min()
+            y_max = espectro['y'].max()
+            y_norm = (espectro['y'] - y_min) / (y_max - y_min)
 
             # Extraer el nombre de la muestra del nombre del archivo para la leyenda
             nombre_muestra = os.path.basename(ruta_archivo).replace('.txt', '')
-            
+
             # Dibujar la gráfica con los datos normalizados
-            plt.plot(data['x'], data['y_norm'], label=nombre_muestra)
+            plt.plot(*reducir_traza(espectro['x'], y_norm, columnas), label=nombre_muestra)
 
         except FileNotFoundError:
             print(f"Advertencia: El archivo '{ruta_archivo}' no fue encontrado. Se omitirá.")
@@ -78,13 +70,15 @@ def comparar_espectros(archivos_entrada, nombre_salida):
     ax.grid(which='minor', linestyle=':', linewidth='0.5', color='lightgray')
 
     plt.legend()
-    plt.savefig(nombre_salida)
+    with etapa("grafica.guardar"):
+        plt.savefig(nombre_salida)
     print(f"lito:) {nombre_salida}")
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("python comparar.py grafica.png ftir/prueba1.txt ftir/prueba2.txt")
+    puntos_max, argumentos = separar_opcion_puntos(sys.argv[1:])
+    if len(argumentos) < 2:
+        print("python comparar.py [--puntos=N|auto] grafica.png ftir/prueba1.txt ftir/prueba2.txt")
     else:
-        archivo_salida = sys.argv[1]
-        archivos_entrada = sys.argv[2:]
-        comparar_espectros(archivos_entrada, archivo_salida)
+        archivo_salida = argumentos[0]
+        archivos_entrada = argumentos[1:]
+        comparar_espectros(archivos_entrada, archivo_salida, puntos_max)
@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import numpy as np
+
+from lector_xrdml import leer_xrdml_moderno
+from lector_ftir import leer_espectro_ftir
+from preprocesado import apilar, rejilla_comun
+
+
+NORMALIZACIONES = ('minmax', 'area', 'maximo')
+
+
+def nombre_muestra(ruta_archivo, tecnica):
+    """Nombre de la muestra para leyendas, con la misma convención que las gráficas."""
+    nombre = os.path.basename(ruta_archivo)
+    return nombre.split('.')[0] if tecnica == 'xrd' else nombre.replace('.txt', '')
+
+
+def _leer(ruta_archivo, tecnica):
+    if tecnica == 'xrd':
+        datos = leer_xrdml_moderno(ruta_archivo, verbose=True)
+        return None if datos is None else (datos['2theta'], datos['intensity'], None, None)
+    try:
+        espectro = leer_espectro_ftir(ruta_archivo)
+    except FileNotFoundError:
+        print(f"Advertencia: El archivo '{ruta_archivo}' no fue encontrado. Se omitirá.")
+        return None
+    except Exception as e:
+        print(f"Ocurrió un error al procesar '{ruta_archivo}': {e}")
+        return None
+    return espectro['x'], espectro['y'], espectro['xunits'], espectro['yunits']
+
+
+class ConjuntoEspectros:
+    """
+    Muchas muestras XRD o FTIR sobre un mismo eje, como un único arreglo 2D.
+
+    'datos' tiene forma (muestras, puntos) y es contiguo; los puntos fuera del
+    rango medido de cada muestra valen NaN. Normalizaciones, diferencias y
+    cocientes operan sobre todas las filas a la vez y devuelven un conjunto
+    nuevo. Se guarda como un directorio con eje.npy, datos.npy y meta.json,
+    que al cargarse se abren con memory-map.
+
+    Es para comparaciones numéricas: la interpolación al eje común no
+    conserva los máximos medidos, así que las gráficas dibujan cada muestra
+    sobre sus propios puntos.
+    """
+
+    def __init__(self, eje, datos, nombres, tecnica='xrd', xunits=None, yunits=None):
+        self.eje = np.asarray(eje)
+        self.datos = np.asarray(datos)
+        self.nombres = list(nombres)
+        self.tecnica = tecnica
+        self.xunits = xunits
+        self.yunits = yunits
+        if self.datos.shape != (len(self.nombres), len(self.eje)):
+            raise ValueError(f"forma de datos {self.datos.shape} incompatible con "
+                             f"{len(self.nombres)} muestras y {len(self.eje)} puntos")
+
+    @classmethod
+    def desde_archivos(cls, rutas, tecnica='xrd', paso=None, rango='union'):
+        """
+        Lee los archivos y los interpola (linealmente) sobre un eje común.
+
+        Args:
+            paso (float, opcional): Paso del eje; por defecto el más fino de las muestras.
+            rango (str): 'union' cubre todas las muestras (NaN donde una no midió);
+                         'interseccion' solo el tramo medido por todas.
+        """
+        escaneos, nombres = [], []
+        xunits = yunits = None
+        for ruta_archivo in rutas:
+            leido = _leer(ruta_archivo, tecnica)
+            if leido is None:
+                continue
+            x, y, xu, yu = leido
+            escaneos.append((x, y))
+            nombres.append(nombre_muestra(ruta_archivo, tecnica))
+            xunits = xunits or xu
+            yunits = yunits or yu
+        if not escaneos:
+            raise ValueError("no se pudo leer ningún archivo de entrada válido")
+
+        eje = rejilla_comun(escaneos, paso)
+        if rango == 'interseccion':
+            inicio = max(float(np.min(x)) for x, _ in escaneos)
+            fin = min(float(np.max(x)) for x, _ in escaneos)
+            if inicio >= fin:
+                raise ValueError("las muestras no tienen ningún tramo en común")
+            eje = eje[(eje >= inicio) & (eje <= fin)]
+        elif rango != 'union':
+            raise ValueError(f"rango desconocido: '{rango}'")
+
+        datos, medido = apilar(escaneos, eje)
+        datos[~medido] = np.nan
+        return cls(eje, datos, nombres, tecnica, xunits, yunits)
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def _con_datos(self, datos, yunits=None):
+        return ConjuntoEspectros(self.eje, np.ascontiguousarray(datos), self.nombres,
+                                 self.tecnica, self.xunits, yunits)
+
+    def _fila(self, referencia):
+        if isinstance(referencia, str):
+            return self.nombres.index(referencia)
+        return int(referencia)
+
+    def normalizar(self, metodo='minmax'):
+        """
+        'minmax': cada muestra a [0, 1]. 'area': área bajo la curva igual a 1.
+        'maximo': máximo igual a 1 (sin restar el mínimo).
+        """
+        datos = np.asarray(self.datos, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if metodo == 'minmax':
+                minimo = np.nanmin(datos, axis=1, keepdims=True)
+                rango = np.nanmax(datos, axis=1, keepdims=True) - minimo
+                return self._con_datos((datos - minimo) / rango)
+            if metodo == 'maximo':
+                return self._con_datos(datos / np.nanmax(datos, axis=1, keepdims=True))
+            if metodo == 'area':
+                # Regla del trapecio sobre los tramos medidos (los NaN no suman)
+                anchos = np.diff(self.eje)
+                tramos = 0.5 * (datos[:, 1:] + datos[:, :-1]) * anchos
+                area = np.nansum(tramos, axis=1, keepdims=True)
+                return self._con_datos(datos / area)
+        raise ValueError(f"normalización desconocida: '{metodo}' (usa {', '.join(NORMALIZACIONES)})")
+
+    def diferencia(self, referencia=0):
+        """Cada muestra menos la de referencia (índice o nombre)."""
+        datos = np.asarray(self.datos, dtype=np.float64)
+        return self._con_datos(datos - datos[self._fila(referencia)], self.yunits)
+
+    def cociente(self, referencia=0):
+        """Cada muestra dividida entre la de referencia (NaN donde la referencia vale 0)."""
+        datos = np.asarray(self.datos, dtype=np.float64)
+        base = datos[self._fila(referencia)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._con_datos(np.where(base != 0, datos / base, np.nan))
+
+    def guardar(self, directorio, dtype=np.float32):
+        """Guarda el conjunto; float32 basta para graficar y comparar y ocupa la mitad."""
+        os.makedirs(directorio, exist_ok=True)
+        np.save(os.path.join(directorio, "eje.npy"), np.ascontiguousarray(self.eje, dtype=np.float64))
+        np.save(os.path.join(directorio, "datos.npy"), np.ascontiguousarray(self.datos, dtype=dtype))
+        meta = {
+            "nombres": self.nombres, "tecnica": self.tecnica,
+            "xunits": self.xunits, "yunits": self.yunits,
+        }
+        temporal = os.path.join(directorio, f"meta.json.{os.getpid()}")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temporal, os.path.join(directorio, "meta.json"))
+
+    @classmethod
+    def cargar(cls, directorio, mmap=True):
+        with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        modo = 'r' if mmap else None
+        eje = np.load(os.path.join(directorio, "eje.npy"), mmap_mode=modo)
+        datos = np.load(os.path.join(directorio, "datos.npy"), mmap_mode=modo)
+        return cls(eje, datos, meta["nombres"], meta["tecnica"], meta.get("xunits"), meta.get("yunits"))
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    normalizacion = None
+    for argumento in list(argumentos):
+        if argumento.startswith('--norm='):
+            normalizacion = argumento.split('=', 1)[1]
+            argumentos.remove(argumento)
+    if len(argumentos) < 3 or argumentos[0] not in ('xrd', 'ftir'):
+        print("\nUso: python conjunto.py [--norm=minmax|area|maximo] <xrd|ftir> <directorio_salida> <archivo1> ...")
+    else:
+        conjunto = ConjuntoEspectros.desde_archivos(argumentos[2:], argumentos[0])
+        if normalizacion:
+            conjunto = conjunto.normalizar(normalizacion)
+        conjunto.guardar(argumentos[1])
+        print(f"\n¡Listo! {len(conjunto)} muestra(s) x {len(conjunto.eje)} puntos guardadas en: {argumentos[1]}")
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+# 2*sqrt(2*ln 2): relación entre FWHM y sigma de una gaussiana
+_FWHM_A_SIGMA = 2.0 * np.sqrt(2.0 * np.log(2.0))
+
+
+def rejilla_uniforme(two_theta, intensidad):
+    """
+    Devuelve el perfil en una rejilla 2-Theta creciente y de paso constante.
+
+    Los XRDML con start/endPosition ya lo están; con listPositions irregulares
+    se interpola linealmente sobre el mismo número de puntos.
+    """
+    x = np.asarray(two_theta, dtype=np.float64)
+    y = np.asarray(intensidad, dtype=np.float64)
+    if len(x) > 1 and x[0] > x[-1]:
+        x, y = x[::-1], y[::-1]
+    pasos = np.diff(x)
+    if len(x) > 2 and not np.allclose(pasos, pasos[0], rtol=1e-6, atol=0.0):
+        rejilla = np.linspace(x[0], x[-1], len(x))
+        return rejilla, np.interp(rejilla, x, y)
+    return x, y
+
+
+def _nucleo_gaussiano(fwhm, paso, longitud):
+    """Gaussiana normalizada centrada en 0 con envoltura circular, lista para convolucionar por FFT."""
+    from scipy import fft
+    sigma = max(fwhm / _FWHM_A_SIGMA / paso, 1e-3)
+    radio = min(int(np.ceil(5 * sigma)), longitud // 2)
+    k = np.arange(-radio, radio + 1)
+    valores = np.exp(-0.5 * (k / sigma) ** 2)
+    nucleo = np.zeros(longitud)
+    nucleo[k % longitud] = valores / valores.sum()
+    return fft.rfft(nucleo)
+
+
+def _barras(patrones, x0, paso, n, longitud):
+    """Patrones de barras sobre la rejilla, repartiendo cada pico entre los dos puntos vecinos."""
+    barras = np.zeros((len(patrones), longitud))
+    longitudes = np.array([len(p.x) for p in patrones], dtype=np.int64)
+    if longitudes.sum() == 0:
+        return barras
+    thetas = np.concatenate([np.asarray(p.x, dtype=np.float64) for p in patrones])
+    intensidades = np.concatenate([np.asarray(p.y, dtype=np.float64) for p in patrones])
+    fila = np.repeat(np.arange(len(patrones)), longitudes)
+
+    posicion = (thetas - x0) / paso
+    dentro = (posicion >= 0) & (posicion <= n - 1)
+    posicion, intensidades, fila = posicion[dentro], intensidades[dentro], fila[dentro]
+    izquierda = np.floor(posicion).astype(np.int64)
+    fraccion = posicion - izquierda
+    derecha = np.minimum(izquierda + 1, n - 1)
+    plano = barras.reshape(-1)
+    np.add.at(plano, fila * longitud + izquierda, intensidades * (1.0 - fraccion))
+    np.add.at(plano, fila * longitud + derecha, intensidades * fraccion)
+    return barras
+
+
+def correlacion_perfiles(patrones, two_theta, intensidad, fwhm=0.15, desplazamiento_max=0.2, lote=256):
+    """
+    Puntúa patrones de barras contra el perfil medido completo, sin detectar picos.
+
+    Cada patrón se ensancha con una gaussiana de ancho 'fwhm' sobre la rejilla
+    2-Theta del difractograma y se calcula la correlación normalizada (Pearson)
+    con el perfil medido para todos los desplazamientos de cero hasta
+    ±'desplazamiento_max' grados, quedándose con la mejor. Ensanchamiento y
+    correlación se hacen por FFT para 'lote' candidatos a la vez.
+
+    Returns:
+        tuple: (scores en %, desplazamientos en grados). Score NaN si el patrón
+               no tiene picos dentro del rango medido; las correlaciones
+               negativas cuentan como 0.
+    """
+    from scipy import fft
+    num_candidatos = len(patrones)
+    scores = np.full(num_candidatos, np.nan)
+    desplazamientos = np.zeros(num_candidatos)
+    x, y = rejilla_uniforme(two_theta, intensidad)
+    n = len(x)
+    if num_candidatos == 0 or n < 2:
+        return scores, desplazamientos
+
+    paso = (x[-1] - x[0]) / (n - 1)
+    max_lag = min(int(round(desplazamiento_max / paso)), n - 1)
+    # Relleno con ceros para que la correlación no sea circular dentro de ±max_lag
+    longitud = fft.next_fast_len(n + max_lag + 1, real=True)
+
+    y = y - y.mean()
+    norma_y = np.sqrt(np.dot(y, y))
+    if norma_y == 0:
+        return scores, desplazamientos
+    Y = fft.rfft(y, longitud)
+    G = _nucleo_gaussiano(fwhm, paso, longitud)
+    lags = np.r_[np.arange(0, max_lag + 1), np.arange(-max_lag, 0)]
+
+    for inicio in range(0, num_candidatos, lote):
+        grupo = patrones[inicio:inicio + lote]
+        perfiles = fft.irfft(fft.rfft(_barras(grupo, x[0], paso, n, longitud), axis=1) * G, longitud, axis=1)[:, :n]
+        perfiles -= perfiles.mean(axis=1, keepdims=True)
+        normas = np.sqrt(np.einsum('ij,ij->i', perfiles, perfiles))
+
+        # corr[k] = sum_t perfil[t] * y[t + k]
+        corr = fft.irfft(np.conj(fft.rfft(perfiles, longitud, axis=1)) * Y, longitud, axis=1)
+        ventana = np.concatenate([corr[:, :max_lag + 1], corr[:, longitud - max_lag:]], axis=1) if max_lag else corr[:, :1]
+        mejor = np.argmax(ventana, axis=1)
+        maximo = ventana[np.arange(len(grupo)), mejor]
+
+        validos = normas > 0
+        bloque = slice(inicio, inicio + len(grupo))
+        scores[bloque] = np.where(validos, np.maximum(maximo, 0.0) / np.where(validos, normas, 1.0) / norma_y * 100, np.nan)
+        desplazamientos[bloque] = lags[mejor] * paso
+    return scores, desplazamientos
@@ -0,0 +1,107 @@
+import os
+import sys
+
+import numpy as np
+
+
+def decimar_m4(x, y, columnas):
+    """
+    Reduce una traza a lo que se puede ver en 'columnas' columnas de píxeles.
+
+    En cada columna se conservan el primer y el último punto y los de
+    intensidad mínima y máxima (M4), así que los máximos de los picos se
+    mantienen exactamente y el trazo dibujado no cambia a esa resolución.
+
+    Returns:
+        tuple: (x, y) reducidos, en el orden original de la traza.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if columnas <= 0 or n <= 4 * columnas:
+        return x, y
+
+    # Los espectros FTIR suelen venir con x decreciente; se trabaja sobre x ordenado
+    x_original, y_original = x, y
+    orden = None
+    if not np.all(x[1:] >= x[:-1]):
+        orden = np.argsort(x, kind='stable')
+        x, y = x[orden], y[orden]
+
+    x_min, x_max = x[0], x[-1]
+    if not np.isfinite(x_max - x_min) or x_max == x_min:
+        return x_original, y_original
+    columna = np.minimum(((x - x_min) / (x_max - x_min) * columnas).astype(np.int64), columnas - 1)
+
+    # Las columnas son tramos contiguos de la traza ordenada
+    inicios = np.flatnonzero(np.r_[True, columna[1:] != columna[:-1]])
+    finales = np.r_[inicios[1:], n] - 1
+
+    y_valida = np.where(np.isnan(y), -np.inf, y)
+    maximos = np.maximum.reduceat(y_valida, inicios)
+    y_valida = np.where(np.isnan(y), np.inf, y)
+    minimos = np.minimum.reduceat(y_valida, inicios)
+    tramo = np.repeat(np.arange(len(inicios)), finales - inicios + 1)
+    es_max = y == maximos[tramo]
+    es_min = y == minimos[tramo]
+    # Primera aparición del máximo y del mínimo en cada columna
+    idx_max = np.flatnonzero(es_max)
+    idx_max = idx_max[np.r_[True, tramo[idx_max][1:] != tramo[idx_max][:-1]]]
+    idx_min = np.flatnonzero(es_min)
+    idx_min = idx_min[np.r_[True, tramo[idx_min][1:] != tramo[idx_min][:-1]]]
+
+    conservar = np.unique(np.concatenate([inicios, finales, idx_max, idx_min]))
+    if orden is not None:
+        # Se vuelve al orden original de la traza
+        conservar = np.sort(orden[conservar])
+    return x_original[conservar], y_original[conservar]
+
+
+def resolver_presupuesto(puntos_max, ancho_pulgadas, dpi):
+    """
+    Traduce la opción de decimación a columnas de píxeles.
+
+    'puntos_max' puede ser None (sin decimar), 'auto' (una columna por píxel
+    del ancho de la figura) o un número máximo de puntos por traza.
+    """
+    if puntos_max is None:
+        return None
+    if puntos_max == 'auto':
+        return int(ancho_pulgadas * dpi)
+    return max(1, int(puntos_max) // 4)
+
+
+def reducir_traza(x, y, columnas):
+    if columnas is None:
+        return x, y
+    return decimar_m4(x, y, columnas)
+
+
+def separar_opcion_puntos(argumentos):
+    """
+    Extrae '--puntos=N' o '--puntos=auto' de la línea de comandos. Devuelve (puntos_max, resto).
+
+    Con un valor que no es 'auto' ni un entero positivo muestra el uso y
+    termina el script.
+    """
+    puntos_max = None
+    resto = []
+    for argumento in argumentos:
+        if argumento.startswith('--puntos='):
+            valor = argumento.split('=', 1)[1]
+            puntos_max = valor if valor == 'auto' else _entero_positivo(valor)
+            if puntos_max is None:
+                print(f"\nError: --puntos espera un entero positivo o 'auto', no '{valor}'.")
+                print(f"\nUso: python {os.path.basename(sys.argv[0])} [--puntos=N|auto] <salida> <archivo1> ...")
+                sys.exit(2)
+        else:
+            resto.append(argumento)
+    return puntos_max, resto
+
+
+def _entero_positivo(valor):
+    try:
+        numero = int(valor)
+    except ValueError:
+        return None
+    return numero if numero > 0 else None
@@ -1,17 +1,42 @@
 import sys
 import os
-import xml.etree.ElementTree as ET
+import argparse
+import glob
+import hashlib
+import json
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import combinations
 import numpy as np
-import pandas as pd
-from scipy.signal import find_peaks
-from mp_api.client import MPRester
-from pymatgen.analysis.diffraction.xrd import XRDCalculator
+
+# pandas, scipy.signal, mp_api y pymatgen tardan segundos en importarse: se cargan al usarlos
+from lector_xrdml import leer_xrdml_moderno
+from cache_mp import CacheMaterialsProject, RUTA_CACHE_POR_DEFECTO
+from patrones_simulados import (
+    AlmacenPatrones, PatronSimulado, RUTA_PATRONES_POR_DEFECTO, hash_estructura, marca_actualizacion
+)
+from puntuacion import puntuar_candidatos
+from indice_picos import IndicePicos
+from residuo import MotorResidual
+from correlacion import correlacion_perfiles
+from preprocesado import extraer_picos_lote
+from precarga import AUTO, Precargador, leer_historial, registrar_en_historial
+from instrumentacion import contar, cronometrado, etapa, mapear
 
 
 CONFIGURACION = {
     "NOMBRE_ARCHIVO": "sincompos.xrdml",
     "API_KEY": os.getenv("MP_API_KEY"), # ¡Asegúrate de poner tu clave aquí!
     "PROMINENCIA_PICO": 100.0,
+    # "prominencia": find_peaks con PROMINENCIA_PICO en cuentas sobre los datos crudos.
+    # "ruido": fondo (SNIP o mínimo móvil), suavizado y picos con prominencia relativa al ruido de cada escaneo,
+    # procesando todos los archivos del lote juntos sobre una rejilla 2-Theta común. Anchos en grados.
+    "DETECCION_PICOS": os.getenv("XRD_DETECCION_PICOS", "prominencia"),
+    "LINEA_BASE_METODO": "snip",
+    "LINEA_BASE_ANCHO": 2.0,
+    "SUAVIZADO_ANCHO": 0.1,
+    "PROMINENCIA_RELATIVA": 5.0,
     "LAMBDA_RAYOS_X_STR": "CoKa",
     "TOLERANCIA_ANGULO": 0.55,
     "SCORE_THRESHOLD": 2.0, 
@@ -19,101 +44,522 @@ CONFIGURACION = {
     # Solo se considerarán fases con una energía por encima del casco inferior a este valor (en eV/átomo).
     # 0.05 es un buen valor para incluir fases estables y ligeramente metaestables.
     "STABILITY_THRESHOLD_EV_PER_ATOM": 0.05,
+    # Caché local de consultas a Materials Project (None desactiva la caché).
+    "CACHE_MP_RUTA": os.getenv("MP_CACHE_PATH", RUTA_CACHE_POR_DEFECTO),
+    "CACHE_MP_TTL_HORAS": 24 * 30,
+    "CACHE_MP_MAX_MB": 512,
+    # En modo offline solo se usan resultados ya guardados en la caché.
+    "MODO_OFFLINE": os.getenv("MP_OFFLINE", "0") == "1",
+    # Directorio de patrones simulados ya calculados (None desactiva el almacén).
+    "PATRONES_DIR": os.getenv("MP_PATTERNS_DIR", RUTA_PATRONES_POR_DEFECTO),
+    "RANGO_2THETA": (0, 90),
+    # Procesos para simular patrones en paralelo (1 = en serie) y candidatos por envío a cada proceso.
+    "PROCESOS_SIMULACION": int(os.getenv("XRD_WORKERS", "1")),
+    "LOTE_SIMULACION": 4,
+    # Modo por lotes (esprayx.py --lote): procesos para leer archivos y coincidencias a guardar por sistema.
+    "PROCESOS_LOTE": os.cpu_count() or 1,
+    "TOP_LOTE": 5,
+    # Búsqueda automática ('auto'): candidatos preseleccionados por el índice de picos antes de puntuar.
+    "MAX_PRESELECCION": 50,
+    # Buscar también en todos los subsistemas (p. ej. Fe, O y Fe-O para "Fe,O") con consultas en paralelo.
+    "BUSCAR_SUBSISTEMAS": False,
+    "HILOS_CONSULTA": 4,
+    # Precarga en segundo plano, mientras se espera la respuesta del usuario, de los sistemas más probables.
+    "PRECARGA": os.getenv("XRD_PRECARGA", "1") == "1",
+    "PRECARGA_MAX_SISTEMAS": 6,
+    "HISTORIAL_SISTEMAS": os.path.join(os.path.dirname(RUTA_CACHE_POR_DEFECTO), "historial_sistemas.json"),
+    # Tras aceptar una fase, las siguientes iteraciones puntúan solo contra los picos que aún no explica ninguna.
+    "PUNTUAR_RESIDUO": True,
+    # "picos": coincidencia pico a pico; "perfil": correlación del patrón ensanchado con el difractograma completo
+    # (útil con ruido o picos solapados que find_peaks no separa), con FWHM y desplazamiento de cero máximo en grados.
+    "MODO_PUNTUACION": os.getenv("XRD_SCORE_MODE", "picos"),
+    "PERFIL_FWHM": 0.15,
+    "PERFIL_DESPLAZAMIENTO_MAX": 0.2,
 }
 
-# 
-def leer_xrdml_moderno(ruta_archivo):
+# Campos de la consulta inicial; la estructura solo se descarga para los candidatos que hay que simular.
+# 'last_updated' basta para saber si un patrón guardado corresponde a la estructura vigente.
+CAMPOS_RESUMEN = ["material_id", "formula_pretty", "energy_above_hull", "last_updated"]
+
+
+def subsistemas(elements):
+    """Todos los subsistemas químicos no vacíos, de mayor a menor: Fe,O -> [Fe,O], [Fe], [O]."""
+    return [
+        list(combinacion)
+        for tamano in range(len(elements), 0, -1)
+        for combinacion in combinations(elements, tamano)
+    ]
+
+
+_CALCULADORAS = {}
+
+def _calculadora(wavelength):
+    """XRDCalculator de este proceso para 'wavelength' (importa pymatgen la primera vez)."""
+    if wavelength not in _CALCULADORAS:
+        from pymatgen.analysis.diffraction.xrd import XRDCalculator
+        _CALCULADORAS[wavelength] = XRDCalculator(wavelength=wavelength)
+    return _CALCULADORAS[wavelength]
+
+def _simular_patron(args):
+    """Simula un patrón en el proceso actual. Devuelve (patrón, None) o (None, mensaje de error)."""
+    structure, wavelength, two_theta_range = args
     try:
-        namespaces = {'xrdml': 'http://www.xrdml.com/XRDMeasurement/2.3'}
-        tree = ET.parse(ruta_archivo)
-        root = tree.getroot()
-        counts_string = root.find('.//xrdml:counts', namespaces).text
-        intensidades = np.array([float(c) for c in counts_string.strip().split()])
-        pos_element = root.find('.//xrdml:positions[@axis="2Theta"]', namespaces)
-        start_pos = float(pos_element.find('xrdml:startPosition', namespaces).text)
-        end_pos = float(pos_element.find('xrdml:endPosition', namespaces).text)
-        angulos = np.linspace(start_pos, end_pos, len(intensidades))
-        return {'2theta': angulos, 'intensity': intensidades}
+        with etapa("simulacion.patron"):
+            pattern = _calculadora(wavelength).get_pattern(structure, two_theta_range=two_theta_range)
+        return PatronSimulado.desde_pymatgen(pattern), None
     except Exception as e:
-        print(f"ERROR al leer '{os.path.basename(ruta_archivo)}': {e}")
-        return None
+        return None, f"{type(e).__name__}: {e}"
+
+class BusquedaCancelada(Exception):
+    """Una búsqueda hecha dentro de InteractivePhaseIdentifier.cancelable se interrumpió."""
+
 
 class InteractivePhaseIdentifier:
-    def __init__(self, config, mpr_connection):
+    def __init__(self, config, mpr_connection, cache=None, almacen_patrones=None):
         self.config = config
         self.mpr = mpr_connection
-        self.xrd_calculator = XRDCalculator(wavelength=config["LAMBDA_RAYOS_X_STR"])
+        self.cache = cache
+        self.almacen_patrones = almacen_patrones
+        self.fallos = []
+        self._executor = None
+        self._lock_executor = threading.Lock()
+        # Silencio y registro de fallos por hilo, para que la precarga no se mezcle con el primer plano
+        self._local = threading.local()
+        self._indice = None
+        self.motor = None
+        self.perfil = None
 
-    def search_and_score(self, elements, exp_peaks):
-        print(f"\nBuscando en Materials Project materiales con EXACTAMENTE los elementos: {elements}...")
+    @property
+    def xrd_calculator(self):
+        return _calculadora(self.config["LAMBDA_RAYOS_X_STR"])
+
+    @contextmanager
+    def silenciado(self, silencio=True):
+        """Mientras dura, lo que informa el identificador desde este hilo no se imprime."""
+        anterior = getattr(self._local, "silencio", False)
+        self._local.silencio = silencio
         try:
-            
-            docs = self.mpr.materials.summary.search(
-                elements=elements, num_elements=len(elements), 
-                fields=["material_id", "formula_pretty", "structure", "energy_above_hull"]
-            )
-        except Exception as e:
-            print(f"Error en la consulta a la API: {e}")
+            yield
+        finally:
+            self._local.silencio = anterior
+
+    def _informar(self, *args, **kwargs):
+        if not getattr(self._local, "silencio", False):
+            print(*args, **kwargs)
+
+    @contextmanager
+    def cancelable(self, evento):
+        """Mientras dura, las búsquedas de este hilo lanzan BusquedaCancelada en cuanto se activa 'evento'."""
+        anterior = getattr(self._local, "cancelar", None)
+        self._local.cancelar = evento
+        try:
+            yield
+        finally:
+            self._local.cancelar = anterior
+
+    def _comprobar_cancelacion(self):
+        evento = getattr(self._local, "cancelar", None)
+        if evento is not None and evento.is_set():
+            raise BusquedaCancelada()
+
+    def _con_contexto_actual(self, funcion):
+        """
+        Envuelve 'funcion' para que otro hilo la ejecute con el silencio y la
+        cancelación del hilo actual, registrando sus errores de consulta donde
+        este los recoge.
+        """
+        contexto = {
+            clave: getattr(self._local, clave, None) for clave in ("silencio", "errores_consulta", "cancelar")
+        }
+        def envoltura(*args):
+            anterior = {clave: getattr(self._local, clave, None) for clave in contexto}
+            for clave, valor in contexto.items():
+                setattr(self._local, clave, valor)
+            try:
+                return funcion(*args)
+            finally:
+                for clave, valor in anterior.items():
+                    setattr(self._local, clave, valor)
+        return envoltura
+
+    @contextmanager
+    def recoger_fallos(self):
+        """Lista con los fallos que se registren desde este hilo mientras dura (además de self.fallos)."""
+        anterior = getattr(self._local, "fallos", None)
+        self._local.fallos = nuevos = []
+        try:
+            yield nuevos
+        finally:
+            self._local.fallos = anterior
+            if anterior is not None:
+                anterior.extend(nuevos)
+
+    @contextmanager
+    def recoger_errores_consulta(self):
+        """
+        Lista con los errores de consulta a Materials Project de este hilo
+        mientras dura. Las consultas que fallan devuelven un resultado vacío;
+        así quien las llama distingue "sin candidatos" de "no se pudo consultar".
+        """
+        anterior = getattr(self._local, "errores_consulta", None)
+        self._local.errores_consulta = nuevos = []
+        try:
+            yield nuevos
+        finally:
+            self._local.errores_consulta = anterior
+            if anterior is not None:
+                anterior.extend(nuevos)
+
+    def _registrar_error_consulta(self, mensaje, error):
+        self._informar(f"{mensaje}: {error}")
+        recogidos = getattr(self._local, "errores_consulta", None)
+        if recogidos is not None:
+            recogidos.append(f"{type(error).__name__}: {error}")
+        contar("mp.errores")
+
+    def _registrar_fallo(self, doc, error):
+        if isinstance(error, Exception):
+            error = f"{type(error).__name__}: {error}"
+        fallo = {"id": doc.material_id, "formula": doc.formula_pretty, "error": error}
+        self.fallos.append(fallo)
+        recogidos = getattr(self._local, "fallos", None)
+        if recogidos is not None:
+            recogidos.append(fallo)
+        contar("candidatos.fallidos")
+
+    def simular_candidatos(self, chemsys, docs):
+        """
+        Devuelve [(doc, patrón)] en el mismo orden de 'docs'. Los patrones ya
+        almacenados se reutilizan; el resto se simula en serie o en un
+        ProcessPoolExecutor según "PROCESOS_SIMULACION". Los candidatos que
+        fallan se registran en self.fallos.
+
+        Sin estructura (consulta ligera) un patrón guardado vale si coincide
+        su 'last_updated'; si no, se descarga la estructura y, si su hash es
+        el guardado, el patrón se conserva con la fecha nueva sin simularlo.
+        """
+        patrones = {}
+        sin_patron = []
+        actualizados = [marca_actualizacion(getattr(doc, "last_updated", None)) for doc in docs]
+        for i, doc in enumerate(docs):
+            if self.almacen_patrones is not None:
+                structure = getattr(doc, "structure", None)
+                try:
+                    huella = hash_estructura(structure) if structure is not None else None
+                except Exception as e:
+                    self._registrar_fallo(doc, e)
+                    continue
+                patron = self.almacen_patrones.obtener(chemsys, doc.material_id, huella, actualizados[i])
+                if patron is not None:
+                    patrones[i] = patron
+                    continue
+            sin_patron.append(i)
+        contar("patrones.reutilizados", len(patrones))
+
+        self._comprobar_cancelacion()
+        estructuras = self.obtener_estructuras([docs[i] for i in sin_patron])
+        pendientes = []
+        trabajos = []
+        revalidados = 0
+        for i in sin_patron:
+            structure = estructuras.get(str(docs[i].material_id))
+            if structure is None:
+                self._registrar_fallo(docs[i], "estructura no disponible")
+                continue
+            try:
+                huella = hash_estructura(structure) if self.almacen_patrones is not None else None
+            except Exception as e:
+                self._registrar_fallo(docs[i], e)
+                continue
+            if self.almacen_patrones is not None:
+                # Fecha nueva pero misma estructura: el patrón guardado sigue valiendo
+                patron = self.almacen_patrones.obtener(chemsys, docs[i].material_id, huella)
+                if patron is not None:
+                    patrones[i] = patron
+                    self.almacen_patrones.agregar(chemsys, docs[i].material_id, huella, patron,
+                                                  docs[i].formula_pretty, actualizados[i])
+                    revalidados += 1
+                    continue
+            pendientes.append((i, huella))
+            trabajos.append((structure, self.config["LAMBDA_RAYOS_X_STR"], self.config["RANGO_2THETA"]))
+        procesos = self.config["PROCESOS_SIMULACION"]
+        # map es perezoso: la simulación (get_pattern) ocurre al recorrer las salidas
+        with etapa("simulacion.get_pattern"):
+            if procesos > 1 and len(trabajos) > 1:
+                with self._lock_executor:
+                    if self._executor is None:
+                        self._executor = ProcessPoolExecutor(max_workers=procesos)
+                salidas = mapear(self._executor, _simular_patron, trabajos, chunksize=self.config["LOTE_SIMULACION"])
+            else:
+                salidas = map(_simular_patron, trabajos)
+
+            for (i, huella), (patron, error) in zip(pendientes, salidas):
+                self._comprobar_cancelacion()
+                if error is not None:
+                    self._registrar_fallo(docs[i], error)
+                    continue
+                patrones[i] = patron
+                contar("candidatos.simulados")
+                if self.almacen_patrones is not None:
+                    self.almacen_patrones.agregar(chemsys, docs[i].material_id, huella, patron,
+                                                  docs[i].formula_pretty, actualizados[i])
+        contar("patrones.revalidados", revalidados)
+
+        if self.almacen_patrones is not None and (pendientes or revalidados):
+            with etapa("patrones.guardar"):
+                self.almacen_patrones.guardar()
+            # La biblioteca creció: el índice de búsqueda automática se reconstruye al usarlo
+            self._indice = None
+
+        return [(docs[i], patrones[i]) for i in sorted(patrones)]
+
+    def _consultar(self, **criterios):
+        with etapa("mp.consulta"):
+            if self.cache is not None:
+                return self.cache.buscar(self.mpr, **criterios)
+            if self.mpr is None:
+                return []
+            return self.mpr.materials.summary.search(**criterios)
+
+    def obtener_estructuras(self, docs):
+        """
+        Devuelve {material_id: estructura} para 'docs'. Las que no vinieron en la
+        consulta inicial se descargan en una sola consulta por material_ids.
+        """
+        estructuras = {}
+        faltantes = []
+        for doc in docs:
+            structure = getattr(doc, "structure", None)
+            if structure is not None:
+                estructuras[str(doc.material_id)] = structure
+            else:
+                faltantes.append(str(doc.material_id))
+        if faltantes:
+            contar("estructuras.descargadas", len(faltantes))
+            try:
+                for doc in self._consultar(material_ids=faltantes, fields=["material_id", "structure"]):
+                    estructuras[str(doc.material_id)] = doc.structure
+            except Exception as e:
+                self._registrar_error_consulta("Error al descargar estructuras", e)
+        return estructuras
+
+    def indice_picos(self):
+        # Se devuelve la copia local: la precarga de otro sistema puede anular self._indice entretanto
+        indice = self._indice
+        if indice is None:
+            with etapa("indice_picos.construir"):
+                indice = IndicePicos.desde_almacen(self.almacen_patrones, self.config["TOLERANCIA_ANGULO"])
+            self._indice = indice
+        return indice
+
+    def usar_perfil(self, datos):
+        """Guarda el difractograma medido para el modo de puntuación "perfil"."""
+        self.perfil = (datos['2theta'], datos['intensity'])
+
+    def usar_residuo(self, exp_peaks):
+        """A partir de aquí, puntuar solo contra los picos de 'exp_peaks' que no expliquen las fases aceptadas."""
+        self.motor = MotorResidual(exp_peaks, self.config["TOLERANCIA_ANGULO"])
+
+    def aceptar_fase(self, match):
+        if self.motor is None:
+            return
+        explicados = self.motor.aceptar(match["id"], match["pattern"])
+        self._informar(f"{explicados} pico(s) explicados por {match['formula']}; "
+              f"quedan {len(self.motor.residuo())} sin explicar.")
+
+    def _puntuador_perfil(self, perfil):
+        """En modo "perfil", función que puntúa patrones contra 'perfil' (o el de usar_perfil); si no, None."""
+        perfil = perfil if perfil is not None else self.perfil
+        if self.config["MODO_PUNTUACION"] != "perfil" or perfil is None:
+            return None
+        return lambda patrones: correlacion_perfiles(
+            patrones, *perfil,
+            fwhm=self.config["PERFIL_FWHM"], desplazamiento_max=self.config["PERFIL_DESPLAZAMIENTO_MAX"]
+        )
+
+    @cronometrado("search_match")
+    def search_match(self, exp_peaks, perfil=None):
+        """
+        Identificación sin pistas: busca en toda la biblioteca local de patrones simulados.
+
+        La preselección es siempre por picos; en modo "perfil" la preselección se
+        puntúa como en puntuar(), para que todas las coincidencias usen la misma escala.
+        """
+        if self.motor is not None:
+            exp_peaks = self.motor.residuo()
+        if len(exp_peaks) == 0:
+            return []
+        if self.almacen_patrones is None:
+            self._informar("La búsqueda automática necesita el almacén de patrones ('PATRONES_DIR').")
             return []
+        indice = self.indice_picos()
+        if not len(indice):
+            self._informar("La biblioteca local de patrones está vacía. Busca primero algunas familias químicas.")
+            return []
+        self._informar(f"\nBúsqueda automática en {len(indice)} patrones de referencia de la biblioteca local...")
+        return indice.buscar(exp_peaks, self.config["MAX_PRESELECCION"], self.config["SCORE_THRESHOLD"],
+                             puntuar=self._puntuador_perfil(perfil))
+
+    def cerrar(self):
+        if self._executor is not None:
+            # Lo que quede en cola es de una búsqueda cancelada: no se espera a simularlo
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
 
-        if not docs:
-            print("No se encontraron estructuras con esta combinación exacta de elementos.")
+    def buscar_estables(self, elements):
+        """Consulta los materiales con exactamente 'elements' y devuelve los que pasan el filtro de estabilidad."""
+        self._comprobar_cancelacion()
+        self._informar(f"\nBuscando en Materials Project materiales con EXACTAMENTE los elementos: {elements}...")
+        umbral = self.config["STABILITY_THRESHOLD_EV_PER_ATOM"]
+        # El filtro de estabilidad se aplica en el servidor y no se piden estructuras todavía
+        criterios = dict(
+            elements=elements, num_elements=len(elements),
+            energy_above_hull=(0.0, umbral), fields=CAMPOS_RESUMEN
+        )
+        try:
+            docs = self._consultar(**criterios)
+        except Exception as e:
+            self._registrar_error_consulta("Error en la consulta a la API", e)
             return []
-            
-        
+        self._comprobar_cancelacion()
+        contar("candidatos.consultados", len(docs))
+
+        # Se repite el filtro en el cliente por si la fuente (caché antigua, servidor de pruebas) no lo aplicó
         stable_docs = [
             doc for doc in docs 
-            if doc.energy_above_hull <= self.config["STABILITY_THRESHOLD_EV_PER_ATOM"]
+            if doc.energy_above_hull is not None and doc.energy_above_hull <= umbral
         ]
-        print(f"Se encontraron {len(docs)} candidatos. {len(stable_docs)} son estables y serán analizados.")
+        contar("candidatos.estables", len(stable_docs))
 
         if not stable_docs:
-            print("Ninguno de los candidatos encontrados es termodinámicamente estable. No hay resultados para mostrar.")
+            self._informar(f"No se encontraron estructuras estables (E_hull <= {umbral} eV/átomo) con esta combinación exacta de elementos.")
             return []
+        self._informar(f"Se encontraron {len(stable_docs)} candidatos estables que serán analizados.")
+        return stable_docs
 
-        print(f"Calculando y puntuando los {len(stable_docs)} candidatos estables...")
-        
+    def puntuar(self, candidatos, exp_peaks, perfil=None):
+        """
+        Puntúa [(doc, patrón)] contra 'exp_peaks' (o contra el residuo, si se
+        activó usar_residuo) y devuelve las coincidencias ordenadas por score.
+
+        En modo "perfil" se usa 'perfil' (2theta, intensidad) o, sin él, el de
+        usar_perfil; el modo por lotes pasa el de cada archivo.
+        """
+        puntuador = self._puntuador_perfil(perfil)
+        patrones = [pattern for _, pattern in candidatos]
+        desplazamientos = None
+        contar("candidatos.puntuados", len(patrones))
+        with etapa("puntuacion"):
+            if puntuador is not None:
+                scores, desplazamientos = puntuador(patrones)
+            elif self.motor is not None:
+                scores = self.motor.puntuar([doc.material_id for doc, _ in candidatos], patrones)
+            else:
+                scores = puntuar_candidatos(patrones, exp_peaks, self.config["TOLERANCIA_ANGULO"])
         all_matches = []
+        for k, ((doc, pattern), final_score) in enumerate(zip(candidatos, scores)):
+            if np.isnan(final_score):
+                self._registrar_fallo(doc, "patrón simulado vacío o sin intensidad")
+            elif final_score >= self.config["SCORE_THRESHOLD"]:
+                match = {
+                    "id": doc.material_id, "score": final_score,
+                    "formula": doc.formula_pretty, "pattern": pattern
+                }
+                if desplazamientos is not None:
+                    match["desplazamiento"] = float(desplazamientos[k])
+                all_matches.append(match)
+        return sorted(all_matches, key=lambda x: x['score'], reverse=True)
+
+    def search_and_score_subsistemas(self, elements, exp_peaks):
+        """
+        Busca en todos los subsistemas de 'elements' con consultas concurrentes;
+        cada subsistema se simula y puntúa en cuanto llega su respuesta.
+        """
+        sistemas = subsistemas(elements)
+        self._informar(f"\nConsultando {len(sistemas)} subsistemas de {'-'.join(elements)} en paralelo...")
+        por_sistema = {}
+        buscar_estables = self._con_contexto_actual(self.buscar_estables)
+        with self.recoger_fallos() as fallos, ThreadPoolExecutor(max_workers=self.config["HILOS_CONSULTA"]) as hilos:
+            futuros = {hilos.submit(buscar_estables, sistema): k for k, sistema in enumerate(sistemas)}
+            for futuro in as_completed(futuros):
+                k = futuros[futuro]
+                stable_docs = futuro.result()
+                if not stable_docs:
+                    continue
+                chemsys = "-".join(sorted(sistemas[k]))
+                candidatos = self.simular_candidatos(chemsys, stable_docs)
+                por_sistema[k] = self.puntuar(candidatos, exp_peaks)
+        self.reportar_fallos(fallos)
+
+        # Orden estable independiente de qué consulta terminó primero
+        all_matches = [m for k in sorted(por_sistema) for m in por_sistema[k]]
+        return sorted(all_matches, key=lambda x: x['score'], reverse=True)
+
+    @cronometrado("search_and_score")
+    def search_and_score(self, elements, exp_peaks):
+        if self.config["BUSCAR_SUBSISTEMAS"] and len(elements) > 1:
+            return self.search_and_score_subsistemas(elements, exp_peaks)
+
+        stable_docs = self.buscar_estables(elements)
+        if not stable_docs:
+            return []
+
+        self._informar(f"Calculando y puntuando los {len(stable_docs)} candidatos estables...")
         
-        for doc in stable_docs:
-            try:
-                pattern = self.xrd_calculator.get_pattern(doc.structure, two_theta_range=(0,90))
-                ref_thetas = pattern.x
-                ref_intensities = (pattern.y / pattern.y.max()) * 100
-                total_score = 0
-                for exp_theta, exp_intensity in exp_peaks:
-                    diffs = np.abs(ref_thetas - exp_theta)
-                    closest_idx = np.argmin(diffs)
-                    if diffs[closest_idx] <= self.config["TOLERANCIA_ANGULO"]:
-                        intensity_score = 1.0 - abs(exp_intensity - ref_intensities[closest_idx]) / 100.0
-                        total_score += intensity_score
-                
-                final_score = (total_score / len(exp_peaks)) * 100
-                
-                if final_score >= self.config["SCORE_THRESHOLD"]:
-                    all_matches.append({
-                        "id": doc.material_id, "score": final_score, 
-                        "formula": doc.formula_pretty, "pattern": pattern
-                    })
-            except Exception:
-                continue
+        chemsys = "-".join(sorted(elements))
+        with self.recoger_fallos() as fallos:
+            candidatos = self.simular_candidatos(chemsys, stable_docs)
+            sorted_matches = self.puntuar(candidatos, exp_peaks)
+
+        self.reportar_fallos(fallos)
         
-        sorted_matches = sorted(all_matches, key=lambda x: x['score'], reverse=True)
         return sorted_matches
 
+    def reportar_fallos(self, nuevos_fallos):
+        if nuevos_fallos:
+            self._informar(f"Advertencia: {len(nuevos_fallos)} candidato(s) no se pudieron simular/puntuar:")
+            for fallo in nuevos_fallos:
+                self._informar(f"  - {fallo['formula']} ({fallo['id']}): {fallo['error']}")
 
-def main():
-    config = CONFIGURACION
-    if len(sys.argv) > 1:
-        config["NOMBRE_ARCHIVO"] = sys.argv[1]
 
-    datos = leer_xrdml_moderno(config["NOMBRE_ARCHIVO"])
-    if not datos: return
-    
-    indices_picos, _ = find_peaks(datos['intensity'], prominence=config["PROMINENCIA_PICO"])
+def crear_cache(config):
+    if not config.get("CACHE_MP_RUTA"):
+        return None
+    return CacheMaterialsProject(
+        config["CACHE_MP_RUTA"],
+        ttl_segundos=config["CACHE_MP_TTL_HORAS"] * 3600,
+        max_bytes=config["CACHE_MP_MAX_MB"] * 1024 * 1024,
+        offline=config["MODO_OFFLINE"],
+    )
+
+
+def conectar(config):
+    """Sesión de MPRester como contexto, o un contexto vacío en modo offline (sin importar mp_api)."""
+    if config["MODO_OFFLINE"]:
+        return nullcontext(None)
+    from mp_api.client import MPRester
+    return MPRester(config["API_KEY"])
+
+
+def crear_almacen_patrones(config):
+    if not config.get("PATRONES_DIR"):
+        return None
+    return AlmacenPatrones(config["PATRONES_DIR"], config["LAMBDA_RAYOS_X_STR"], config["RANGO_2THETA"])
+
+
+@cronometrado("picos.find_peaks")
+def extraer_picos(datos, prominencia):
+    """
+    Detecta los picos del difractograma y los devuelve ordenados por intensidad.
+
+    Returns:
+        tuple: (picos absolutos [(2θ, cuentas)], picos para puntuar [(2θ, intensidad 0-100)]).
+               Ambas listas están vacías si no se encontró ningún pico.
+    """
+    from scipy.signal import find_peaks
+    indices_picos, _ = find_peaks(datos['intensity'], prominence=prominencia)
     if len(indices_picos) == 0:
-        print("No se encontraron picos iniciales. Ajusta 'PROMINENCIA_PICO'.")
-        return
+        return [], []
 
     all_peaks = list(zip(datos['2theta'][indices_picos], datos['intensity'][indices_picos]))
     all_peaks.sort(key=lambda x: x[1], reverse=True)
@@ -122,71 +568,394 @@ def main():
     all_intensities_norm = (all_intensities / all_intensities.max()) * 100
     all_thetas = np.array([p[0] for p in all_peaks])
     peaks_for_scoring = list(zip(all_thetas, all_intensities_norm))
+    return all_peaks, peaks_for_scoring
+
 
+@cronometrado("picos.ruido")
+def extraer_picos_ruido(escaneos, config):
+    """Detección por ruido (ver preprocesado.py) de varios escaneos [(2theta, cuentas)] a la vez."""
+    return extraer_picos_lote(
+        escaneos, ancho_linea_base=config["LINEA_BASE_ANCHO"], ancho_suavizado=config["SUAVIZADO_ANCHO"],
+        prominencia_relativa=config["PROMINENCIA_RELATIVA"], metodo=config["LINEA_BASE_METODO"],
+    )
+
+
+def _leer_escaneo(ruta_archivo):
+    """Lee un XRDML en un proceso del lote y devuelve sus arreglos (no memory-maps) para enviarlos."""
+    datos = leer_xrdml_moderno(ruta_archivo)
+    if not datos:
+        return ruta_archivo, None, None
+    return ruta_archivo, np.array(datos['2theta']), np.array(datos['intensity'])
+
+
+def _picos_de_archivo(args):
+    """
+    Lee un XRDML y extrae sus picos (ejecutado en un proceso del lote). Con
+    'con_perfil' también devuelve el difractograma para el modo "perfil".
+    """
+    ruta_archivo, prominencia, con_perfil = args
+    datos = leer_xrdml_moderno(ruta_archivo)
+    if not datos:
+        return ruta_archivo, None, None, None
+    all_peaks, peaks_for_scoring = extraer_picos(datos, prominencia)
+    perfil = (np.array(datos['2theta']), np.array(datos['intensity'])) if con_perfil else None
+    return ruta_archivo, all_peaks, peaks_for_scoring, perfil
+
+
+def expandir_rutas(entradas, extension=".xrdml"):
+    """Convierte directorios y patrones glob en una lista ordenada de archivos sin repetir."""
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas.extend(glob.glob(os.path.join(entrada, "*" + extension)))
+        else:
+            rutas.extend(glob.glob(entrada) or [entrada])
+    return sorted(set(rutas))
+
+
+def nombre_json(ruta, directorio_salida, ocupados=()):
+    """
+    Nombre del JSON de resultados de 'ruta' en 'directorio_salida'.
+
+    Es el nombre del archivo sin extensión salvo que ya lo use otra entrada
+    del lote ('ocupados', en minúsculas) o un JSON de otro archivo con el
+    mismo nombre; entonces se añade un hash corto de la ruta absoluta.
+    """
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    absoluta = os.path.abspath(ruta)
+    for nombre in (base + ".json", f"{base}-{hashlib.sha1(absoluta.encode()).hexdigest()[:8]}.json"):
+        if nombre.lower() in ocupados:
+            continue
+        try:
+            with open(os.path.join(directorio_salida, nombre), encoding="utf-8") as f:
+                previo = json.load(f).get("archivo")
+        except (OSError, ValueError, AttributeError):
+            previo = None
+        if previo is None or os.path.abspath(previo) == absoluta:
+            return nombre
+    return nombre
+
+
+def escribir_resumen(resultados, ruta_resumen):
+    """Escribe el resumen.csv (una fila por coincidencia o error) de los resultados por archivo."""
+    import pandas as pd
+    filas = []
+    for resultado in resultados:
+        ruta = resultado["archivo"]
+        for chemsys, matches in resultado["coincidencias"].items():
+            for posicion, m in enumerate(matches, start=1):
+                filas.append({"archivo": ruta, "sistema": chemsys, "posicion": posicion, **m})
+        for chemsys, error in resultado.get("errores_consulta", {}).items():
+            filas.append({"archivo": ruta, "sistema": chemsys, "error": error})
+        if resultado["error"]:
+            filas.append({"archivo": ruta, "error": resultado["error"]})
+    pd.DataFrame(filas, columns=["archivo", "sistema", "posicion", "id", "formula", "score", "error"]).to_csv(
+        ruta_resumen, index=False, float_format="%.4f"
+    )
+
+
+def procesar_lote(rutas, sistemas, config, directorio_salida, auto=False, resumen=True):
+    """
+    Modo sin interacción: detecta picos en todos los archivos y los puntúa
+    contra los candidatos de cada sistema químico.
+
+    Los archivos se leen en paralelo (PROCESOS_LOTE). Cada sistema químico se
+    consulta y se simula una sola vez con la misma sesión de MPRester, y sus
+    patrones se comparten entre todos los archivos. Con 'auto' también se hace
+    la búsqueda automática en la biblioteca local. Por cada archivo se escribe
+    un JSON con sus picos y coincidencias (ver nombre_json; el nombre queda en
+    su clave 'json') y, con 'resumen', un resumen.csv con todo el lote y un
+    fallos_simulacion.json con los candidatos que no se pudieron simular o
+    puntuar (una vez por material). Si la consulta de un sistema a Materials
+    Project falla, ese sistema no tiene coincidencias y el error queda en
+    'errores_consulta' de cada archivo. Sin sistemas ni 'auto' solo se
+    detectan picos.
+    """
+    os.makedirs(directorio_salida, exist_ok=True)
+    procesos = config["PROCESOS_LOTE"]
+    # En modo "perfil" cada archivo se puntúa contra su propio difractograma
+    con_perfil = config["MODO_PUNTUACION"] == "perfil"
+    if config["DETECCION_PICOS"] == "ruido":
+        funcion, trabajos = _leer_escaneo, list(rutas)
+        print(f"Leyendo {len(rutas)} archivo(s) con {procesos} proceso(s)...")
+    else:
+        funcion, trabajos = _picos_de_archivo, [(ruta, config["PROMINENCIA_PICO"], con_perfil) for ruta in rutas]
+        print(f"Detectando picos en {len(rutas)} archivo(s) con {procesos} proceso(s)...")
+    if procesos > 1 and len(trabajos) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            picos = list(mapear(executor, funcion, trabajos, chunksize=config["LOTE_SIMULACION"]))
+    else:
+        picos = [funcion(trabajo) for trabajo in trabajos]
+
+    if config["DETECCION_PICOS"] == "ruido":
+        # Fondo, suavizado y picos de todo el lote en una sola pasada sobre un arreglo 2D
+        leidos = [(x, y) for _, x, y in picos if x is not None]
+        print(f"Detectando picos en {len(leidos)} escaneo(s) sobre una rejilla común...")
+        tablas = iter(extraer_picos_ruido(leidos, config))
+        picos = [
+            (ruta, *next(tablas), (x, y) if con_perfil else None) if x is not None else (ruta, None, None, None)
+            for ruta, x, y in picos
+        ]
+
+    resultados = {
+        ruta: {"archivo": ruta, "picos": [], "coincidencias": {}, "errores_consulta": {}, "error": None}
+        for ruta in rutas
+    }
+    validos = []
+    for ruta, all_peaks, peaks_for_scoring, perfil in picos:
+        if all_peaks is None:
+            resultados[ruta]["error"] = "no se pudo leer el archivo"
+        elif not all_peaks:
+            resultados[ruta]["error"] = "no se encontraron picos; ajusta 'PROMINENCIA_PICO' o 'PROMINENCIA_RELATIVA'"
+        else:
+            resultados[ruta]["picos"] = [
+                {"2theta": float(t), "intensidad": float(y)} for t, y in all_peaks
+            ]
+            validos.append((ruta, peaks_for_scoring, perfil))
+
+    fallos = []
+    # Sin nada que identificar (o sin picos) no se abre sesión con Materials Project
+    if validos and (sistemas or auto):
+        cache = crear_cache(config)
+        identifier = None
+        try:
+            with conectar(config) as mpr:
+                identifier = InteractivePhaseIdentifier(
+                    config, mpr, cache=cache, almacen_patrones=crear_almacen_patrones(config)
+                )
+                with ThreadPoolExecutor(max_workers=max(1, procesos)) as hilos:
+                    for elementos in sistemas:
+                        chemsys = "-".join(sorted(elementos))
+                        with identifier.recoger_errores_consulta() as errores:
+                            stable_docs = identifier.buscar_estables(elementos)
+                            with identifier.recoger_fallos() as nuevos_fallos:
+                                candidatos = identifier.simular_candidatos(chemsys, stable_docs) if stable_docs else []
+                        identifier.reportar_fallos(nuevos_fallos)
+                        if errores:
+                            # Un resultado vacío aquí diría "ninguna fase supera el umbral", que no es cierto
+                            for ruta, _, _ in validos:
+                                resultados[ruta]["errores_consulta"][chemsys] = "; ".join(errores)
+                            continue
+                        print(f"Puntuando {len(candidatos)} candidato(s) de {chemsys} contra {len(validos)} archivo(s)...")
+                        coincidencias = hilos.map(
+                            lambda item: identifier.puntuar(candidatos, item[1], item[2]), validos
+                        )
+                        for (ruta, _, _), matches in zip(validos, coincidencias):
+                            resultados[ruta]["coincidencias"][chemsys] = [
+                                {"id": str(m["id"]), "formula": m["formula"], "score": float(m["score"])}
+                                for m in matches[:config["TOP_LOTE"]]
+                            ]
+                    if auto:
+                        coincidencias = hilos.map(lambda item: identifier.search_match(item[1], item[2]), validos)
+                        for (ruta, _, _), matches in zip(validos, coincidencias):
+                            resultados[ruta]["coincidencias"]["auto"] = [
+                                {"id": str(m["id"]), "formula": m["formula"], "score": float(m["score"])}
+                                for m in matches[:config["TOP_LOTE"]]
+                            ]
+                # puntuar() registra el mismo fallo una vez por archivo: se guarda uno por material
+                fallos = list({fallo["id"]: fallo for fallo in identifier.fallos}.values())
+        finally:
+            if identifier is not None:
+                identifier.cerrar()
+            if cache is not None:
+                cache.cerrar()
+
+    ocupados = set()
+    for ruta in rutas:
+        resultado = resultados[ruta]
+        # Archivos con el mismo nombre en otros directorios no se pisan los resultados
+        resultado["json"] = nombre_json(ruta, directorio_salida, ocupados)
+        ocupados.add(resultado["json"].lower())
+        with open(os.path.join(directorio_salida, resultado["json"]), "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    if resumen:
+        escribir_resumen([resultados[ruta] for ruta in rutas], os.path.join(directorio_salida, "resumen.csv"))
+        with open(os.path.join(directorio_salida, "fallos_simulacion.json"), "w", encoding="utf-8") as f:
+            json.dump(fallos, f, ensure_ascii=False, indent=2)
+    print(f"\n¡Listo! Resultados de {len(rutas)} archivo(s) guardados en: {directorio_salida}")
+    return resultados
+
+
+def main_lote(argumentos):
+    parser = argparse.ArgumentParser(
+        prog="esprayx.py --lote",
+        description="Identificación de fases sin interacción sobre muchos archivos XRDML.",
+    )
+    parser.add_argument("entradas", nargs="+", help="Directorios, archivos o patrones glob (*.xrdml).")
+    parser.add_argument("-s", "--sistemas", nargs="+", default=[],
+                        help="Sistemas químicos candidatos, p. ej. Fe,O Ca,Si,O")
+    parser.add_argument("--auto", action="store_true",
+                        help="Buscar también en toda la biblioteca local de patrones, sin sistemas.")
+    parser.add_argument("-o", "--salida", default="resultados_lote", help="Directorio de salida.")
+    parser.add_argument("-j", "--procesos", type=int, default=None, help="Procesos en paralelo.")
+    args = parser.parse_args(argumentos)
+    if not args.sistemas and not args.auto:
+        parser.error("indica al menos un sistema con --sistemas o usa --auto")
+
+    config = dict(CONFIGURACION)
+    if args.procesos is not None:
+        config["PROCESOS_LOTE"] = args.procesos
+        config["PROCESOS_SIMULACION"] = args.procesos
+
+    sistemas = [[e.strip().capitalize() for e in s.split(",") if e.strip()] for s in args.sistemas]
+    rutas = expandir_rutas(args.entradas)
+    if not rutas:
+        print("No se encontraron archivos de entrada.")
+        return
+    procesar_lote(rutas, sistemas, config, args.salida, auto=args.auto)
+
+
+def main(argumentos=None):
+    argumentos = sys.argv[1:] if argumentos is None else argumentos
+    if argumentos and argumentos[0] == "--lote":
+        return main_lote(argumentos[1:])
+
+    config = CONFIGURACION
+    if argumentos:
+        config["NOMBRE_ARCHIVO"] = argumentos[0]
+
+    datos = leer_xrdml_moderno(config["NOMBRE_ARCHIVO"])
+    if not datos: return
+    
+    if config["DETECCION_PICOS"] == "ruido":
+        all_peaks, peaks_for_scoring = extraer_picos_ruido([(datos['2theta'], datos['intensity'])], config)[0]
+    else:
+        all_peaks, peaks_for_scoring = extraer_picos(datos, config["PROMINENCIA_PICO"])
+    if not all_peaks:
+        print("No se encontraron picos iniciales. Ajusta 'PROMINENCIA_PICO' o 'PROMINENCIA_RELATIVA'.")
+        return
+
+    import pandas as pd
     identified_phases = []
     
+    cache = crear_cache(config)
+    identifier = None
+    precarga = None
+    sistemas_sesion = []
+
     try:
-        with MPRester(config["API_KEY"]) as mpr:
-            identifier = InteractivePhaseIdentifier(config, mpr)
+        conexion = conectar(config)
+        with conexion as mpr:
+            identifier = InteractivePhaseIdentifier(
+                config, mpr, cache=cache, almacen_patrones=crear_almacen_patrones(config)
+            )
+            identifier.usar_perfil(datos)
+            if config["PUNTUAR_RESIDUO"]:
+                identifier.usar_residuo(peaks_for_scoring)
+            if config["PRECARGA"]:
+                precarga = Precargador(identifier, peaks_for_scoring, config["PRECARGA_MAX_SISTEMAS"])
 
-            for i in range(config["NUMERO_MAX_FASES"]):
-                print("\n\n" + "="*57)
-                print(f"      ITERACIÓN DE BÚSQUEDA #{i + 1}")
-                print("="*57)
+            try:
+                for i in range(config["NUMERO_MAX_FASES"]):
+                    print("\n\n" + "="*57)
+                    print(f"      ITERACIÓN DE BÚSQUEDA #{i + 1}")
+                    print("="*57)
 
-                top_peaks_df = pd.DataFrame(all_peaks[:5], columns=["2-Theta (°)", "Intensidad (abs)"])
-                print("Picos más fuertes del patrón completo:")
-                print(top_peaks_df.to_string(index=False, float_format="%.2f"))
+                    if identifier.motor is not None:
+                        picos_restantes = [p for p, explicado in zip(all_peaks, identifier.motor.explicados) if not explicado]
+                        if not picos_restantes:
+                            print("Todos los picos ya están explicados por las fases identificadas.")
+                            break
+                        titulo_picos = "Picos más fuertes aún sin explicar:"
+                    else:
+                        picos_restantes = all_peaks
+                        titulo_picos = "Picos más fuertes del patrón completo:"
+
+                    top_peaks_df = pd.DataFrame(picos_restantes[:5], columns=["2-Theta (°)", "Intensidad (abs)"])
+                    print(titulo_picos)
+                    print(top_peaks_df.to_string(index=False, float_format="%.2f"))
                 
-                if identified_phases:
-                    print("\n--- Fases ya Identificadas ---")
-                    for phase in identified_phases:
-                        print(f"  - {phase['formula']} (Score: {phase['score']:.2f}%)")
-                    print("------------------------------")
+                    if identified_phases:
+                        print("\n--- Fases ya Identificadas ---")
+                        for phase in identified_phases:
+                            print(f"  - {phase['formula']} (Score: {phase['score']:.2f}%)")
+                        print("------------------------------")
 
-                print("\nBasado en los picos, sugiere una familia química.")
-                user_input = input("Elementos a buscar (separados por coma, o 'saltar'/'salir'): ").strip()
+                    sugeridos = []
+                    if precarga is not None:
+                        for elements in sistemas_sesion + leer_historial(config["HISTORIAL_SISTEMAS"]):
+                            if sorted(elements) not in [sorted(s) for s in sugeridos]:
+                                sugeridos.append(elements)
+                        sugeridos = sugeridos[:config["PRECARGA_MAX_SISTEMAS"]]
+                        # Lo usado en esta sesión primero, luego las familias que sugieran los picos y el historial
+                        precarga.sugerir(sugeridos[:len(sistemas_sesion)] + [AUTO] + sugeridos[len(sistemas_sesion):])
 
-                if user_input.lower() in ['salir', 'quit', 'exit']: break
-                if user_input.lower() in ['saltar', 'skip']: continue
-                
-                elements_to_search = [elem.strip().capitalize() for elem in user_input.split(',')]
-                if not all(elements_to_search):
-                    print("Entrada no válida.")
-                    continue
+                    print("\nBasado en los picos, sugiere una familia química ('auto' busca en la biblioteca local).")
+                    if sugeridos:
+                        print("Sistemas recientes: " + "; ".join(",".join(s) for s in sugeridos))
+                    user_input = input("Elementos a buscar (separados por coma, 'auto', o 'saltar'/'salir'): ").strip()
+
+                    if user_input.lower() in ['salir', 'quit', 'exit']: break
+                    if user_input.lower() in ['saltar', 'skip']: continue
                 
-                best_matches = identifier.search_and_score(elements_to_search, peaks_for_scoring)
+                    if user_input.lower() == 'auto':
+                        elements_to_search = ['auto']
+                        if precarga is not None:
+                            best_matches = precarga.search_match()
+                        else:
+                            best_matches = identifier.search_match(peaks_for_scoring)
+                    else:
+                        elements_to_search = [elem.strip().capitalize() for elem in user_input.split(',')]
+                        if not all(elements_to_search):
+                            print("Entrada no válida.")
+                            continue
+                    
+                        if precarga is not None:
+                            best_matches = precarga.search_and_score(elements_to_search)
+                        else:
+                            best_matches = identifier.search_and_score(elements_to_search, peaks_for_scoring)
+                        sistemas_sesion = [elements_to_search] + [
+                            s for s in sistemas_sesion if sorted(s) != sorted(elements_to_search)
+                        ]
+                        registrar_en_historial(config["HISTORIAL_SISTEMAS"], elements_to_search)
                 
-                if best_matches:
-                    print("\n¡Posibles Coincidencias Encontradas (solo fases estables)!")
+                    if best_matches:
+                        print("\n¡Posibles Coincidencias Encontradas (solo fases estables)!")
                     
-                    df_results = pd.DataFrame(best_matches, columns=['score', 'formula', 'id'])
-                    df_results.index = np.arange(1, len(df_results) + 1)
-                    print(df_results.to_string(float_format="%.2f"))
+                        columnas = ['score', 'formula', 'id']
+                        if 'desplazamiento' in best_matches[0]:
+                            columnas.append('desplazamiento')
+                        df_results = pd.DataFrame(best_matches, columns=columnas)
+                        df_results.index = np.arange(1, len(df_results) + 1)
+                        print(df_results.to_string(float_format="%.2f"))
                     
-                    try:
-                        choice = input("\nAceptar fase # (o presiona Enter para saltar): ").strip()
-                        if not choice: continue
+                        try:
+                            choice = input("\nAceptar fase # (o presiona Enter para saltar): ").strip()
+                            if not choice: continue
                         
-                        selection = int(choice)
-                        if 1 <= selection <= len(best_matches):
-                            selected_phase = best_matches[selection - 1]
+                            selection = int(choice)
+                            if 1 <= selection <= len(best_matches):
+                                selected_phase = best_matches[selection - 1]
                             
-                            identified_phases.append({
-                                'id': selected_phase['id'],
-                                'score': selected_phase['score'],
-                                'formula': selected_phase['formula']
-                            })
-                            print(f"Fase '{selected_phase['formula']}' aceptada y registrada.")
-                        else:
-                            print("Selección fuera de rango.")
-                    except ValueError:
-                        print("Entrada no válida. Se esperaba un número.")
-                else:
-                    print(f"No se encontró ninguna coincidencia estable para '{', '.join(elements_to_search)}' que superara el umbral.")
+                                identified_phases.append({
+                                    'id': selected_phase['id'],
+                                    'score': selected_phase['score'],
+                                    'formula': selected_phase['formula']
+                                })
+                                print(f"Fase '{selected_phase['formula']}' aceptada y registrada.")
+                                if precarga is not None:
+                                    precarga.aceptar_fase(selected_phase)
+                                else:
+                                    identifier.aceptar_fase(selected_phase)
+                            else:
+                                print("Selección fuera de rango.")
+                        except ValueError:
+                            print("Entrada no válida. Se esperaba un número.")
+                    else:
+                        print(f"No se encontró ninguna coincidencia estable para '{', '.join(elements_to_search)}' que superara el umbral.")
+            finally:
+                # La precarga consulta con esta sesión de MPRester: se detiene antes de que el with la cierre
+                if precarga is not None:
+                    precarga.cerrar()
 
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
+    finally:
+        if identifier is not None:
+            identifier.cerrar()
+        if cache is not None:
+            cache.cerrar()
 
     print("\n\n" + "="*45)
     print(f"      RESULTADO FINAL DEL ANÁLISIS")
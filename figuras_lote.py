@@ -0,0 +1,276 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import MultipleLocator
+
+from lector_xrdml import leer_xrdml_moderno
+from lector_ftir import leer_espectro_ftir
+from decimacion import reducir_traza, resolver_presupuesto
+from instrumentacion import TareaMedida, cronometrado, etapa, fusionar
+
+
+# Mismo aspecto que raw.py, analisis.py, ftirabs.py y comparar.py respectivamente
+ESTILOS = {
+    ('xrd', 'crudo'): {
+        'titulo': 'Comparación de Difractogramas (Datos en Crudo)',
+        'xlabel': 'Ángulo 2-Theta (°)', 'ylabel': 'Intensidad (cuentas)',
+        'x_mayor': 10, 'x_menor': 2.5, 'y_mayor': None, 'y_menor': None,
+        'invertir_x': False, 'formato': 'jpg', 'dpi': 300,
+    },
+    ('xrd', 'normalizado'): {
+        'titulo': 'Comparación de Difractogramas (Intensidad Normalizada)',
+        'xlabel': 'Ángulo 2-Theta (°)', 'ylabel': 'Intensidad Normalizada',
+        'x_mayor': 10, 'x_menor': 2.5, 'y_mayor': 0.1, 'y_menor': 0.05,
+        'invertir_x': False, 'formato': 'jpg', 'dpi': 300,
+    },
+    ('ftir', 'crudo'): {
+        'titulo': 'Comparación de Espectros Infrarrojos (Datos en Crudo)',
+        'xlabel': 'Número de Onda ({x_units})', 'ylabel': '{y_units}',
+        'x_mayor': 200, 'x_menor': 50, 'y_mayor': None, 'y_menor': None,
+        'invertir_x': True, 'formato': None, 'dpi': 300,
+    },
+    ('ftir', 'normalizado'): {
+        'titulo': 'Comparación de Espectros Infrarrojos (Normalizados)',
+        'xlabel': 'Número de Onda ({x_units})', 'ylabel': 'Intensidad Normalizada',
+        'x_mayor': 200, 'x_menor': 50, 'y_mayor': 0.1, 'y_menor': 0.05,
+        'invertir_x': True, 'formato': None, 'dpi': 100,
+    },
+}
+
+ANCHO_FIGURA, ALTO_FIGURA = 15, 8
+
+
+def leer_manifiesto(ruta_manifiesto):
+    """
+    Lee el manifiesto de figuras en JSON (lista de objetos) o CSV.
+
+    Cada figura tiene 'salida', 'entradas' (lista; en CSV separadas por ';'),
+    'modo' ('crudo' o 'normalizado'), 'tecnica' ('xrd' o 'ftir') y,
+    opcionalmente, 'puntos' (N o 'auto', ver decimacion.py).
+    """
+    if ruta_manifiesto.lower().endswith('.json'):
+        with open(ruta_manifiesto, encoding='utf-8') as f:
+            figuras = json.load(f)
+    else:
+        with open(ruta_manifiesto, newline='', encoding='utf-8') as f:
+            figuras = [dict(fila) for fila in csv.DictReader(f)]
+        for figura in figuras:
+            figura['entradas'] = [e.strip() for e in figura['entradas'].split(';') if e.strip()]
+
+    for figura in figuras:
+        figura['modo'] = figura.get('modo', 'normalizado').lower()
+        figura['tecnica'] = figura.get('tecnica', 'xrd').lower()
+        if (figura['tecnica'], figura['modo']) not in ESTILOS:
+            raise ValueError(f"combinación no válida para '{figura.get('salida')}': "
+                             f"{figura['tecnica']}/{figura['modo']}")
+        puntos = figura.get('puntos') or None
+        if puntos is not None and puntos != 'auto':
+            puntos = int(puntos)
+        figura['puntos'] = puntos
+    return figuras
+
+
+_ESPECTROS = {}
+
+def olvidar_espectros():
+    """Vacía la memoria de espectros ya cargados en este proceso (ver _cargar)."""
+    _ESPECTROS.clear()
+
+
+def _cargar(tecnica, ruta_archivo):
+    """
+    Carga un espectro una sola vez por proceso (y por la caché de espectros, una vez en total).
+
+    La clave incluye tamaño y mtime, así un archivo modificado se vuelve a leer.
+    """
+    try:
+        estado = os.stat(ruta_archivo)
+        clave = (tecnica, ruta_archivo, estado.st_size, estado.st_mtime_ns)
+    except OSError:
+        clave = (tecnica, ruta_archivo, None, None)
+    if clave not in _ESPECTROS:
+        if tecnica == 'xrd':
+            datos = leer_xrdml_moderno(ruta_archivo)
+            _ESPECTROS[clave] = None if datos is None else {
+                'x': datos['2theta'], 'y': datos['intensity'], 'xunits': None, 'yunits': None,
+            }
+        else:
+            try:
+                _ESPECTROS[clave] = leer_espectro_ftir(ruta_archivo)
+            except Exception as e:
+                print(f"Ocurrió un error al procesar '{ruta_archivo}': {e}")
+                _ESPECTROS[clave] = None
+    return _ESPECTROS[clave]
+
+
+@cronometrado("grafica.figuras_lote")
+def renderizar_figura(figura):
+    """
+    Dibuja una figura del manifiesto con la API orientada a objetos (sin pyplot).
+
+    Returns:
+        tuple: (salida, número de muestras graficadas, mensaje de error o None).
+    """
+    tecnica, modo = figura['tecnica'], figura['modo']
+    estilo = ESTILOS[(tecnica, modo)]
+    columnas = resolver_presupuesto(figura.get('puntos'), ANCHO_FIGURA, estilo['dpi'])
+
+    fig = Figure(figsize=(ANCHO_FIGURA, ALTO_FIGURA))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    x_units, y_units = "1/CM", "%T"
+    muestras = 0
+    for ruta_archivo in figura['entradas']:
+        espectro = _cargar(tecnica, ruta_archivo)
+        if espectro is None:
+            continue
+        x_units = espectro['xunits'] or x_units
+        y_units = espectro['yunits'] or y_units
+        y = np.asarray(espectro['y'], dtype=np.float64)
+        if modo == 'normalizado':
+            y = (y - y.min()) / (y.max() - y.min())
+
+        nombre = os.path.basename(ruta_archivo)
+        nombre_muestra = nombre.split('.')[0] if tecnica == 'xrd' else nombre.replace('.txt', '')
+        ax.plot(*reducir_traza(espectro['x'], y, columnas), label=nombre_muestra)
+        muestras += 1
+
+    if muestras == 0:
+        return figura['salida'], 0, "no se pudo procesar ningún archivo de entrada válido"
+
+    ax.set_title(estilo['titulo'])
+    ax.set_xlabel(estilo['xlabel'].format(x_units=x_units, y_units=y_units))
+    ax.set_ylabel(estilo['ylabel'].format(x_units=x_units, y_units=y_units))
+    if estilo['invertir_x']:
+        ax.invert_xaxis()
+    ax.xaxis.set_major_locator(MultipleLocator(estilo['x_mayor']))
+    ax.xaxis.set_minor_locator(MultipleLocator(estilo['x_menor']))
+    if estilo['y_mayor'] is not None:
+        ax.yaxis.set_major_locator(MultipleLocator(estilo['y_mayor']))
+        ax.yaxis.set_minor_locator(MultipleLocator(estilo['y_menor']))
+        ax.grid(which='both', linestyle='-', linewidth='0.5')
+        ax.grid(which='minor', linestyle=':', linewidth='0.5', color='lightgray')
+    else:
+        ax.grid(which='both', linestyle='-', linewidth='0.5')
+        ax.grid(which='minor', axis='x', linestyle=':', linewidth='0.5', color='lightgray')
+    ax.legend()
+
+    directorio = os.path.dirname(figura['salida'])
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with etapa("grafica.guardar"):
+        fig.savefig(figura['salida'], format=estilo['formato'], dpi=estilo['dpi'])
+    return figura['salida'], muestras, None
+
+
+def _renderizar_grupo(figuras):
+    resultados = []
+    for figura in figuras:
+        try:
+            resultados.append(renderizar_figura(figura))
+        except Exception as e:
+            # Un error en una figura (p. ej. trazas demasiado largas para Agg) no detiene el lote
+            resultados.append((figura['salida'], 0, f"{type(e).__name__}: {e}"))
+    return resultados
+
+
+def _agrupar_por_entradas(figuras, grupos):
+    """
+    Reparte las figuras en a lo sumo 'grupos' grupos de forma que las que
+    comparten algún archivo caigan en el mismo proceso, para cargar cada
+    espectro una sola vez. Cada grupo es la lista de índices de sus figuras
+    en el manifiesto.
+
+    Las figuras se unen en componentes conexas por sus archivos de entrada
+    (si A comparte un archivo con B y B con C, las tres van juntas). Ningún
+    grupo pasa de len(figuras) / grupos figuras: una componente mayor (p. ej.
+    todas las figuras superponen la misma referencia) se parte en trozos y
+    sus archivos comunes se cargan una vez por trozo, algo barato con la
+    caché de espectros.
+    """
+    # Unión-búsqueda sobre las figuras: cada archivo enlaza la primera figura que lo usa con las demás
+    padre = list(range(len(figuras)))
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    primera_figura = {}
+    for i, figura in enumerate(figuras):
+        for ruta_archivo in figura['entradas']:
+            j = primera_figura.setdefault((figura['tecnica'], ruta_archivo), i)
+            padre[raiz(i)] = raiz(j)
+
+    componentes = {}
+    for i in range(len(figuras)):
+        componentes.setdefault(raiz(i), []).append(i)
+
+    grupos = max(1, grupos)
+    tope = -(-len(figuras) // grupos)
+    bloques = [
+        indices[k:k + tope] for indices in componentes.values() for k in range(0, len(indices), tope)
+    ]
+    repartos = [[] for _ in range(grupos)]
+    # Primero los bloques grandes, siempre al grupo con menos figuras
+    for indices in sorted(bloques, key=len, reverse=True):
+        destino = min(repartos, key=len)
+        destino.extend(indices)
+    return [r for r in repartos if r]
+
+
+def renderizar_lote(figuras, procesos=None):
+    """
+    Genera todas las figuras del manifiesto en procesos en paralelo.
+
+    Returns:
+        list: (salida, muestras, error) por figura, en el orden del manifiesto.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    # Cada lote lee los archivos como están ahora, sin arrastrar los de llamadas anteriores
+    olvidar_espectros()
+    if procesos <= 1 or len(figuras) <= 1:
+        return _renderizar_grupo(figuras)
+
+    # Los grupos terminan en cualquier orden: cada resultado vuelve a la posición de su figura
+    resultados = [None] * len(figuras)
+    grupos = _agrupar_por_entradas(figuras, procesos * 4)
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        futuros = {
+            executor.submit(TareaMedida(_renderizar_grupo), [figuras[i] for i in indices]): indices
+            for indices in grupos
+        }
+        for futuro in as_completed(futuros):
+            resultados_grupo, medido = futuro.result()
+            fusionar(medido)
+            for i, resultado in zip(futuros[futuro], resultados_grupo):
+                resultados[i] = resultado
+    return resultados
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera en paralelo muchas gráficas de comparación XRD/FTIR.")
+    parser.add_argument("manifiesto", help="Archivo .json o .csv con las figuras a generar.")
+    parser.add_argument("-j", "--procesos", type=int, default=None, help="Procesos en paralelo.")
+    args = parser.parse_args(argumentos)
+
+    figuras = leer_manifiesto(args.manifiesto)
+    resultados = renderizar_lote(figuras, args.procesos)
+    errores = [r for r in resultados if r[2] is not None]
+    for salida, _, error in errores:
+        print(f"  -> ERROR en '{salida}': {error}")
+    print(f"\n¡Listo! {len(resultados) - len(errores)} de {len(figuras)} gráfica(s) generadas.")
+    return 1 if errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,11 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import sys
 import os
-from matplotlib.ticker import MultipleLocator
+from lector_ftir import leer_espectro_ftir
+from decimacion import reducir_traza, resolver_presupuesto, separar_opcion_puntos
+from instrumentacion import cronometrado, etapa
 
-def comparar_espectros_crudo(archivos_entrada, nombre_salida):
+@cronometrado("grafica.ftirabs")
+def comparar_espectros_crudo(archivos_entrada, nombre_salida, puntos_max=None):
     """
     Lee múltiples archivos de espectro infrarrojo y los grafica juntos
     utilizando los datos en crudo, sin normalización.
@@ -12,38 +13,30 @@ def comparar_espectros_crudo(archivos_entrada, nombre_salida):
     Args:
         archivos_entrada (list): Una lista de rutas a los archivos de datos .txt.
         nombre_salida (str): El nombre del archivo de imagen para guardar la gráfica.
+        puntos_max (int | str, opcional): Puntos máximos por espectro, 'auto' para
+            ajustarlos al ancho de la figura o None para graficar todos.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MultipleLocator
+
     plt.figure(figsize=(15, 8))
+    columnas = resolver_presupuesto(puntos_max, ancho_pulgadas=15, dpi=300)
     
     x_units = "1/CM"
     y_units = "%T" # Valor por defecto
 
     for ruta_archivo in archivos_entrada:
         try:
-            # Leer las unidades de las primeras líneas del archivo
-            with open(ruta_archivo, 'r') as f:
-                lines = f.readlines()
-                # Se busca en las primeras 10 líneas para eficiencia
-                for line in lines[:10]: 
-                    if line.startswith('##XUNITS='):
-                        x_units = line.strip().split('=')[1]
-                    elif line.startswith('##YUNITS='):
-                        y_units = line.strip().split('=')[1]
-
-            # Leer los datos numéricos usando pandas
-            data = pd.read_csv(
-                ruta_archivo,
-                comment='#',
-                sep=r'\s+',
-                header=None,
-                names=['x', 'y']
-            )
+            # Leer encabezado (unidades) y datos numéricos en una sola pasada
+            espectro = leer_espectro_ftir(ruta_archivo)
+            x_units = espectro['xunits'] or x_units
+            y_units = espectro['yunits'] or y_units
 
            
             nombre_muestra = os.path.basename(ruta_archivo).replace('.txt', '')
             
             # Dibujar la gráfica con los datos en crudo (columna 'y')
-            plt.plot(data['x'], data['y'], label=nombre_muestra)
+            plt.plot(*reducir_traza(espectro['x'], espectro['y'], columnas), label=nombre_muestra)
 
         except FileNotFoundError:
             print(f"Advertencia: El archivo '{ruta_archivo}' no fue encontrado. Se omitirá.")
@@ -74,16 +67,18 @@ def comparar_espectros_crudo(archivos_entrada, nombre_salida):
 
     plt.legend()
     # Guardar la gráfica con el formato del nombre de archivo (ej. .png o .jpg)
-    plt.savefig(nombre_salida, dpi=300)
+    with etapa("grafica.guardar"):
+        plt.savefig(nombre_salida, dpi=300)
     print(f"¡Listo! Gráfica guardada en: {nombre_salida}")
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
+    puntos_max, argumentos = separar_opcion_puntos(sys.argv[1:])
+    if len(argumentos) < 2:
         # Instrucciones de uso actualizadas
-        print("\nUso: python ftirabs.py <grafica.png> <archivo1.txt> <archivo2.txt> ...")
+        print("\nUso: python ftirabs.py [--puntos=N|auto] <grafica.png> <archivo1.txt> <archivo2.txt> ...")
         print("\nEjemplo:")
         print("python ftirabs.py mi_comparacion_cruda.png ftir/prueba1.txt ftir/prueba2.txt")
     else:
-        archivo_salida = sys.argv[1]
-        archivos_entrada = sys.argv[2:]
-        comparar_espectros_crudo(archivos_entrada, archivo_salida)
\ No newline at end of file
+        archivo_salida = argumentos[0]
+        archivos_entrada = argumentos[1:]
+        comparar_espectros_crudo(archivos_entrada, archivo_salida, puntos_max)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import numpy as np
+
+from puntuacion import puntuar_candidatos
+
+
+class IndicePicos:
+    """
+    Índice invertido de posiciones 2-Theta sobre una biblioteca de patrones de referencia.
+
+    Cada pico de referencia se asigna a un intervalo de ancho 'tolerancia'; el
+    índice guarda, ordenados por intervalo, los pares (intervalo, material).
+    Un pico experimental solo puede coincidir con picos de su intervalo o de
+    los dos vecinos, así que contar cuántos picos experimentales caen cerca de
+    cada material permite preseleccionar candidatos sin recorrer toda la
+    biblioteca. La puntuación completa se hace solo sobre la preselección.
+    """
+
+    def __init__(self, entradas, tolerancia, intensidad_minima=5.0):
+        """
+        Args:
+            entradas (list): Tuplas (chemsys, material_id, formula, patrón).
+            tolerancia (float): Ancho del intervalo en grados (TOLERANCIA_ANGULO).
+            intensidad_minima (float): Los picos de referencia más débiles (0-100) no se indexan.
+        """
+        self.tolerancia = float(tolerancia)
+        self.sistemas = [e[0] for e in entradas]
+        self.ids = [e[1] for e in entradas]
+        self.formulas = [e[2] for e in entradas]
+        self.patrones = [e[3] for e in entradas]
+
+        if not self.patrones:
+            self._intervalos = np.empty(0, dtype=np.int64)
+            self._materiales = np.empty(0, dtype=np.int64)
+            return
+
+        longitudes = np.array([len(p.x) for p in self.patrones], dtype=np.int64)
+        thetas = np.concatenate([np.asarray(p.x, dtype=np.float64) for p in self.patrones])
+        intensidades = np.concatenate([np.asarray(p.y, dtype=np.float64) for p in self.patrones])
+        materiales = np.repeat(np.arange(len(self.patrones)), longitudes)
+
+        fuertes = intensidades >= intensidad_minima
+        intervalos = np.floor(thetas[fuertes] / self.tolerancia).astype(np.int64)
+        materiales = materiales[fuertes]
+
+        # Pares únicos (intervalo, material) ordenados por intervalo
+        base = len(self.patrones)
+        claves = np.unique(intervalos * base + materiales)
+        self._intervalos = claves // base
+        self._materiales = claves % base
+
+    @classmethod
+    def desde_almacen(cls, almacen, tolerancia, intensidad_minima=5.0):
+        """Construye el índice con todos los patrones guardados en un AlmacenPatrones."""
+        return cls(list(almacen.recorrer()), tolerancia, intensidad_minima)
+
+    def __len__(self):
+        return len(self.patrones)
+
+    def conteo_aciertos(self, exp_thetas):
+        """Número de picos experimentales con algún pico indexado a menos de un intervalo, por material."""
+        exp_thetas = np.asarray(exp_thetas, dtype=np.float64).reshape(-1)
+        if len(self.patrones) == 0 or len(exp_thetas) == 0:
+            return np.zeros(len(self.patrones), dtype=np.int64)
+
+        centro = np.floor(exp_thetas / self.tolerancia).astype(np.int64)
+        consulta = (centro[:, None] + np.array([-1, 0, 1])[None, :]).reshape(-1)
+        pico = np.repeat(np.arange(len(exp_thetas)), 3)
+
+        izquierda = np.searchsorted(self._intervalos, consulta, side="left")
+        derecha = np.searchsorted(self._intervalos, consulta, side="right")
+        tamanos = derecha - izquierda
+        if tamanos.sum() == 0:
+            return np.zeros(len(self.patrones), dtype=np.int64)
+
+        # Expande cada rango [izquierda, derecha) sin bucles de Python
+        desplazamiento = np.arange(tamanos.sum()) - np.repeat(np.cumsum(tamanos) - tamanos, tamanos)
+        posiciones = np.repeat(izquierda, tamanos) + desplazamiento
+        materiales = self._materiales[posiciones]
+        picos = np.repeat(pico, tamanos)
+
+        # Cada pico experimental cuenta una sola vez por material
+        pares = np.unique(picos * len(self.patrones) + materiales)
+        return np.bincount(pares % len(self.patrones), minlength=len(self.patrones))
+
+    def preseleccionar(self, exp_peaks, max_candidatos=50, aciertos_minimos=1):
+        """Índices de los materiales con más picos experimentales cercanos, de mayor a menor."""
+        exp = np.asarray(exp_peaks, dtype=np.float64).reshape(-1, 2)
+        conteo = self.conteo_aciertos(exp[:, 0])
+        elegibles = np.flatnonzero(conteo >= aciertos_minimos)
+        orden = np.argsort(-conteo[elegibles], kind="stable")
+        return elegibles[orden][:max_candidatos]
+
+    def buscar(self, exp_peaks, max_candidatos=50, score_minimo=0.0, puntuar=None):
+        """
+        Búsqueda automática: preselecciona por conteo de picos y puntúa la preselección.
+
+        Args:
+            puntuar (callable): Opcional. Recibe los patrones preseleccionados y
+                devuelve (scores, desplazamientos o None), p. ej. la correlación de
+                perfiles; por defecto se puntúa por coincidencia de picos.
+
+        Returns:
+            list: Coincidencias ordenadas por score con 'id', 'formula', 'sistema',
+                  'score', 'aciertos' y 'pattern' (y 'desplazamiento' si 'puntuar' lo da).
+        """
+        exp = np.asarray(exp_peaks, dtype=np.float64).reshape(-1, 2)
+        conteo = self.conteo_aciertos(exp[:, 0])
+        seleccion = self.preseleccionar(exp, max_candidatos)
+        patrones = [self.patrones[i] for i in seleccion]
+        if puntuar is None:
+            scores, desplazamientos = puntuar_candidatos(patrones, exp, self.tolerancia), None
+        else:
+            scores, desplazamientos = puntuar(patrones)
+
+        coincidencias = []
+        for k, (i, score) in enumerate(zip(seleccion, scores)):
+            if np.isnan(score) or score < score_minimo:
+                continue
+            coincidencia = {
+                "id": self.ids[i], "formula": self.formulas[i] or self.sistemas[i],
+                "sistema": self.sistemas[i], "score": score,
+                "aciertos": int(conteo[i]), "pattern": self.patrones[i],
+            }
+            if desplazamientos is not None:
+                coincidencia["desplazamiento"] = float(desplazamientos[k])
+            coincidencias.append(coincidencia)
+        return sorted(coincidencias, key=lambda x: x["score"], reverse=True)
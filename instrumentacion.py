@@ -0,0 +1,213 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+# Desactivada por defecto: etapa() devuelve este contexto vacío y contar() retorna de inmediato
+_ACTIVO = False
+_NULO = nullcontext()
+_lock = threading.Lock()
+_inicio = time.perf_counter()
+_etapas = {}
+_contadores = {}
+_eventos = []
+_ruta_traza = None
+_MAX_EVENTOS = 200_000
+
+
+def activa():
+    return _ACTIVO
+
+
+def activar(traza=None, resumen_al_salir=True):
+    """
+    Empieza a medir. Al terminar el programa se imprime el resumen y, con
+    'traza', se guarda la traza JSON (formato de eventos de Chrome, se abre
+    en chrome://tracing o Perfetto).
+    """
+    global _ACTIVO, _ruta_traza
+    if traza:
+        _ruta_traza = traza
+    if not _ACTIVO and resumen_al_salir:
+        atexit.register(_al_salir)
+    _ACTIVO = True
+
+
+def desactivar():
+    global _ACTIVO
+    _ACTIVO = False
+
+
+def reiniciar():
+    global _inicio
+    with _lock:
+        _etapas.clear()
+        _contadores.clear()
+        _eventos.clear()
+        _inicio = time.perf_counter()
+
+
+@contextmanager
+def _medir(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fin = time.perf_counter()
+        duracion = fin - inicio
+        with _lock:
+            llamadas, total, maximo = _etapas.get(nombre, (0, 0.0, 0.0))
+            _etapas[nombre] = (llamadas + 1, total + duracion, max(maximo, duracion))
+            if len(_eventos) < _MAX_EVENTOS:
+                _eventos.append((nombre, inicio - _inicio, duracion, threading.get_ident()))
+
+
+def etapa(nombre):
+    """Contexto que mide el tiempo de una etapa: with etapa("mp.consulta"): ..."""
+    return _medir(nombre) if _ACTIVO else _NULO
+
+
+def cronometrado(nombre):
+    """Decorador equivalente a envolver toda la función en etapa(nombre)."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _ACTIVO:
+                return funcion(*args, **kwargs)
+            with _medir(nombre):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def contar(nombre, cantidad=1):
+    """Suma 'cantidad' al contador 'nombre' (candidatos, bytes leídos, aciertos de caché...)."""
+    if not _ACTIVO:
+        return
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + cantidad
+
+
+def instantanea():
+    """Copia de lo medido: {'etapas': {nombre: {...}}, 'contadores': {nombre: valor}}."""
+    with _lock:
+        etapas = {
+            nombre: {"llamadas": llamadas, "total_s": total, "max_s": maximo}
+            for nombre, (llamadas, total, maximo) in _etapas.items()
+        }
+        return {"etapas": etapas, "contadores": dict(_contadores)}
+
+
+def _diferencia(antes, despues):
+    """Lo medido entre dos instantaneas(); de las etapas se conserva el máximo más reciente."""
+    etapas = {}
+    for nombre, e in despues["etapas"].items():
+        previa = antes["etapas"].get(nombre, {"llamadas": 0, "total_s": 0.0})
+        if e["llamadas"] > previa["llamadas"]:
+            etapas[nombre] = {"llamadas": e["llamadas"] - previa["llamadas"],
+                              "total_s": e["total_s"] - previa["total_s"], "max_s": e["max_s"]}
+    contadores = {
+        nombre: valor - antes["contadores"].get(nombre, 0)
+        for nombre, valor in despues["contadores"].items() if valor != antes["contadores"].get(nombre, 0)
+    }
+    return {"etapas": etapas, "contadores": contadores}
+
+
+def fusionar(medido):
+    """Suma a este proceso lo medido en otro (lo que devuelve TareaMedida)."""
+    if not medido or not _ACTIVO:
+        return
+    with _lock:
+        for nombre, e in medido["etapas"].items():
+            llamadas, total, maximo = _etapas.get(nombre, (0, 0.0, 0.0))
+            _etapas[nombre] = (llamadas + e["llamadas"], total + e["total_s"], max(maximo, e["max_s"]))
+        for nombre, valor in medido["contadores"].items():
+            _contadores[nombre] = _contadores.get(nombre, 0) + valor
+
+
+class TareaMedida:
+    """
+    Envuelve una función de nivel de módulo para ejecutarla en un proceso
+    trabajador: devuelve (resultado, lo medido durante la llamada), y el
+    proceso principal lo suma a sus etapas y contadores con fusionar().
+
+    Se mide la diferencia y no el total porque un trabajador creado con fork
+    arranca con una copia de lo que ya había medido el proceso principal.
+    """
+
+    def __init__(self, funcion):
+        self.funcion = funcion
+
+    def __call__(self, *args):
+        if not _ACTIVO:
+            return self.funcion(*args), None
+        antes = instantanea()
+        resultado = self.funcion(*args)
+        return resultado, _diferencia(antes, instantanea())
+
+
+def mapear(executor, funcion, *iterables, **kwargs):
+    """executor.map(funcion, ...) que suma a este proceso lo medido en los procesos trabajadores."""
+    salidas = executor.map(TareaMedida(funcion), *iterables, **kwargs)
+
+    def resultados():
+        for resultado, medido in salidas:
+            fusionar(medido)
+            yield resultado
+    return resultados()
+
+
+def imprimir_resumen(salida=None):
+    salida = salida or sys.stderr
+    datos = instantanea()
+    if not datos["etapas"] and not datos["contadores"]:
+        return
+    print("\n--- Instrumentación ---", file=salida)
+    if datos["etapas"]:
+        print(f"{'Etapa':<32} {'Llamadas':>9} {'Total (s)':>11} {'Media (ms)':>11} {'Máx (ms)':>10}", file=salida)
+        for nombre, e in sorted(datos["etapas"].items(), key=lambda item: item[1]["total_s"], reverse=True):
+            media = e["total_s"] / e["llamadas"] * 1000
+            print(f"{nombre:<32} {e['llamadas']:>9} {e['total_s']:>11.3f} {media:>11.2f} {e['max_s'] * 1000:>10.2f}",
+                  file=salida)
+    if datos["contadores"]:
+        print(f"\n{'Contador':<32} {'Valor':>12}", file=salida)
+        for nombre, valor in sorted(datos["contadores"].items()):
+            print(f"{nombre:<32} {valor:>12}", file=salida)
+
+
+def exportar_traza(ruta):
+    """Guarda las etapas medidas como eventos de Chrome ('ph': 'X', tiempos en µs) más los contadores."""
+    pid = os.getpid()
+    with _lock:
+        eventos = [
+            {"name": nombre, "cat": nombre.split(".", 1)[0], "ph": "X", "pid": pid, "tid": tid,
+             "ts": round(inicio * 1e6, 3), "dur": round(duracion * 1e6, 3)}
+            for nombre, inicio, duracion, tid in _eventos
+        ]
+    traza = {"traceEvents": eventos, "displayTimeUnit": "ms", **instantanea()}
+    temporal = f"{ruta}.{pid}"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(traza, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _al_salir():
+    if not _ACTIVO:
+        return
+    imprimir_resumen()
+    if _ruta_traza:
+        try:
+            exportar_traza(_ruta_traza)
+            print(f"Traza guardada en: {_ruta_traza}", file=sys.stderr)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar la traza en '{_ruta_traza}' ({e}).", file=sys.stderr)
+
+
+# WH_INSTRUMENTACION=1 activa el resumen al salir; WH_TRAZA=ruta.json además guarda la traza
+if os.getenv("WH_INSTRUMENTACION", "0") == "1" or os.getenv("WH_TRAZA"):
+    activar(os.getenv("WH_TRAZA"))
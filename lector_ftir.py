@@ -0,0 +1,250 @@
+from itertools import chain
+import os
+import re
+import numpy as np
+
+from cache_espectros import cache_por_defecto
+from instrumentacion import contar, cronometrado
+
+
+# Cambiar al modificar el formato del resultado para invalidar la caché de espectros
+VERSION_LECTOR = 3
+
+
+# Caracteres ASDF de JCAMP-DX: SQZ (valor absoluto), DIF (diferencia) y DUP (repetición)
+_SQZ = {'@': 0, **{c: i + 1 for i, c in enumerate('ABCDEFGHI')}, **{c: -(i + 1) for i, c in enumerate('abcdefghi')}}
+_DIF = {'%': 0, **{c: i + 1 for i, c in enumerate('JKLMNOPQR')}, **{c: -(i + 1) for i, c in enumerate('jklmnopqr')}}
+_DUP = {**{c: i + 1 for i, c in enumerate('STUVWXYZ')}, 's': 9}
+
+_TOKEN_ASDF = re.compile(r'([@A-Ia-i%J-Rj-rS-Zs]|[+-])?(\d+\.?\d*|\.\d+)?')
+_NUMERO_AFFN = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?')
+# Línea AFFN: solo números completos separados por espacios, ',', ';' o por el signo del siguiente.
+# 'E'/'e' sueltas no bastan, porque también son los dígitos SQZ de +5 y -5
+_LINEA_AFFN = re.compile(
+    r'^[\s,;]*(?:[+-]?(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?(?:[\s,;]+|(?=[+-])|$))*$'
+)
+
+
+def _etiqueta(texto):
+    """Normaliza una etiqueta JCAMP ('##X UNITS' -> 'XUNITS'), según la norma se ignoran espacios, '-', '/' y '_'."""
+    return re.sub(r'[\s\-/_]', '', texto).upper()
+
+
+def _numero(encabezado, etiqueta, defecto=None):
+    try:
+        return float(encabezado[etiqueta])
+    except (KeyError, ValueError):
+        return defecto
+
+
+def _decodificar_asdf(linea):
+    """
+    Decodifica una línea de XYDATA en forma AFFN o comprimida (SQZ/DIF/DUP).
+
+    Returns:
+        tuple: (valores, terminó_en_dif). El primer valor es la abscisa de la línea.
+    """
+    if _LINEA_AFFN.match(linea):
+        valores = [float(v) for v in _NUMERO_AFFN.findall(linea)]
+        # Una sola 'abscisa' con exponente ('3998E345') es en realidad x seguida de un valor SQZ
+        if len(valores) > 1 or not re.search('[Ee]', linea):
+            return valores, False
+
+    valores = []
+    ultima_dif = None
+    for prefijo, digitos in _TOKEN_ASDF.findall(linea):
+        if not prefijo and not digitos:
+            continue
+        if prefijo in _SQZ:
+            valor = float(f"{abs(_SQZ[prefijo])}{digitos}")
+            valores.append(valor if _SQZ[prefijo] >= 0 else -valor)
+            ultima_dif = None
+        elif prefijo in _DIF:
+            diferencia = float(f"{abs(_DIF[prefijo])}{digitos}")
+            ultima_dif = diferencia if _DIF[prefijo] >= 0 else -diferencia
+            valores.append(valores[-1] + ultima_dif)
+        elif prefijo in _DUP:
+            repeticiones = int(f"{_DUP[prefijo]}{digitos}") - 1
+            for _ in range(repeticiones):
+                valores.append(valores[-1] + ultima_dif if ultima_dif is not None else valores[-1])
+        else:
+            valores.append(float(prefijo + digitos))
+            ultima_dif = None
+    return valores, ultima_dif is not None
+
+
+def _decodificar_xydata(lineas, encabezado):
+    """Reconstruye (x, y) de un bloque ##XYDATA=(X++(Y..Y))."""
+    xfactor = _numero(encabezado, 'XFACTOR', 1.0)
+    yfactor = _numero(encabezado, 'YFACTOR', 1.0)
+
+    abscisas = []
+    ordenadas = []
+    dif_pendiente = False
+    for linea in lineas:
+        valores, termina_en_dif = _decodificar_asdf(linea)
+        if not valores:
+            continue
+        x_linea, ys = valores[0], valores[1:]
+        inicio = len(ordenadas)
+        # Tras una línea en forma DIF, la primera ordenada de la siguiente es un valor de control repetido
+        if dif_pendiente and ys and ordenadas:
+            ys = ys[1:]
+            inicio -= 1
+        dif_pendiente = termina_en_dif
+        abscisas.append((inicio, x_linea * xfactor))
+        ordenadas.extend(ys)
+
+    y = np.asarray(ordenadas, dtype=np.float64) * yfactor
+    n = len(y)
+
+    primera_x = _numero(encabezado, 'FIRSTX')
+    ultima_x = _numero(encabezado, 'LASTX')
+    if primera_x is not None and ultima_x is not None and n > 0:
+        return np.linspace(primera_x, ultima_x, n), y
+
+    # Sin FIRSTX/LASTX: se interpolan las abscisas de cada línea y se extrapola la última
+    if not abscisas:
+        return np.arange(n, dtype=np.float64), y
+    indices = np.array([i for i, _ in abscisas], dtype=np.float64)
+    valores_x = np.array([v for _, v in abscisas], dtype=np.float64)
+    if len(indices) > 1 and indices[-1] > indices[-2]:
+        paso = (valores_x[-1] - valores_x[-2]) / (indices[-1] - indices[-2])
+    else:
+        paso = _numero(encabezado, 'DELTAX', 1.0)
+    posiciones = np.arange(n, dtype=np.float64)
+    x = np.interp(posiciones, indices, valores_x)
+    fuera = posiciones > indices[-1]
+    x[fuera] = valores_x[-1] + paso * (posiciones[fuera] - indices[-1])
+    return x, y
+
+
+def _decodificar_tabla(lineas, encabezado, resto='', pares=False, numeros=None):
+    """
+    Bloque de columnas numéricas (archivos .txt simples o ##XYPOINTS=(XY..XY)).
+
+    'numeros' son los números de línea en el archivo de 'lineas'; 'resto'
+    empieza en la línea siguiente a la última. ValueError si la tabla está
+    incompleta (el total de valores no es múltiplo del número de columnas).
+    """
+    if not lineas:
+        return np.empty(0), np.empty(0)
+    original = resto
+    if '#' in resto or '$$' in resto:
+        # Hay comentarios o un ##END= después de los datos: se filtra línea por línea
+        filtradas = []
+        for linea in resto.splitlines():
+            linea = linea.split('$$', 1)[0].strip()
+            if linea.startswith('##END'):
+                break
+            if linea and not linea.startswith('#'):
+                filtradas.append(linea)
+        resto = '\n'.join(filtradas)
+    texto = ' '.join(lineas) + ' ' + resto
+    if ',' in texto or ';' in texto:
+        texto = texto.replace(',', ' ').replace(';', ' ')
+    valores = np.fromstring(texto, dtype=np.float64, sep=' ')
+    columnas = 2 if pares else max(2, len(lineas[0].replace(',', ' ').split()))
+    if len(valores) % columnas:
+        numeros = numeros or list(range(1, len(lineas) + 1))
+        filas = chain(zip(numeros, lineas), enumerate(original.splitlines(), numeros[-1] + 1))
+        numero = _linea_incompleta(filas, columnas)
+        donde = f"la línea {numero}" if numero is not None else "el bloque de datos"
+        raise ValueError(f"tabla incompleta: {donde} no tiene un múltiplo de {columnas} valores")
+    valores = valores.reshape(-1, columnas)
+    x = valores[:, 0] * _numero(encabezado, 'XFACTOR', 1.0)
+    y = valores[:, 1] * _numero(encabezado, 'YFACTOR', 1.0)
+    return x, y
+
+
+def _linea_incompleta(filas, columnas):
+    """Número de la primera línea de datos (de pares (número, línea)) con valores sobrantes, o None."""
+    for numero, linea in filas:
+        linea = linea.split('$$', 1)[0].strip()
+        if linea.startswith('##END'):
+            break
+        if not linea or linea.startswith('#'):
+            continue
+        if len(linea.replace(',', ' ').replace(';', ' ').split()) % columnas:
+            return numero
+    return None
+
+
+@cronometrado("lectura.ftir")
+def leer_espectro_ftir(ruta_archivo):
+    """
+    Lee un espectro FTIR (ver _parsear_espectro_ftir), desde la caché de
+    espectros si el archivo no cambió desde la última lectura.
+    """
+    cache = cache_por_defecto()
+    if cache is None:
+        return _parsear_espectro_ftir(ruta_archivo)
+    return cache.cargar(ruta_archivo, f"ftir-v{VERSION_LECTOR}", _parsear_espectro_ftir)
+
+
+@cronometrado("lectura.ftir.parseo")
+def _parsear_espectro_ftir(ruta_archivo):
+    """
+    Lee un espectro FTIR (JCAMP-DX o texto con encabezados '##') en una sola pasada.
+
+    El encabezado y el bloque numérico se leen en el mismo recorrido del archivo.
+    Se aplican ##XFACTOR/##YFACTOR y se soportan las formas de ##XYDATA con
+    varias ordenadas por línea, incluidas las comprimidas SQZ/DIF/DUP. Solo se
+    lee el primer bloque (hasta ##END=).
+
+    Args:
+        ruta_archivo (str): Ruta al archivo .txt/.jdx/.dx.
+
+    Returns:
+        dict: 'x' y 'y' (np.ndarray), 'xunits'/'yunits' (str o None) y
+              'encabezado' con todas las etiquetas leídas.
+    """
+    contar("bytes_leidos.ftir", os.path.getsize(ruta_archivo))
+    encabezado = {}
+    lineas = []
+    numeros = []
+    forma = None
+    resto = ''
+
+    with open(ruta_archivo, 'r', encoding='utf-8', errors='replace') as f:
+        for numero, linea in enumerate(f, 1):
+            linea = linea.split('$$', 1)[0].strip()
+            if not linea:
+                continue
+            if linea.startswith('##'):
+                nombre, _, valor = linea[2:].partition('=')
+                nombre = _etiqueta(nombre)
+                valor = valor.strip()
+                if nombre == 'END':
+                    if lineas:
+                        break
+                    continue
+                if nombre in ('XYDATA', 'XYPOINTS', 'PEAKTABLE'):
+                    forma = (nombre, valor.replace(' ', '').upper())
+                else:
+                    encabezado[nombre] = valor
+                continue
+            if linea.startswith('#'):
+                continue
+            lineas.append(linea)
+            numeros.append(numero)
+            if forma is None or forma[0] != 'XYDATA':
+                # Tabla numérica simple: el resto del archivo se convierte en bloque
+                resto = f.read()
+                break
+
+    if forma is not None and forma[0] == 'XYDATA' and 'X++' in forma[1]:
+        x, y = _decodificar_xydata(lineas, encabezado)
+    else:
+        x, y = _decodificar_tabla(lineas, encabezado, resto, pares=forma is not None, numeros=numeros)
+
+    if len(x) == 0:
+        raise ValueError("el archivo no contiene datos numéricos")
+
+    return {
+        'x': x,
+        'y': y,
+        'xunits': encabezado.get('XUNITS'),
+        'yunits': encabezado.get('YUNITS'),
+        'encabezado': encabezado,
+    }
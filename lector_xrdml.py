@@ -0,0 +1,130 @@
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from cache_espectros import cache_por_defecto
+from instrumentacion import contar, cronometrado
+
+
+# Cambiar al modificar el formato del resultado para invalidar la caché de espectros
+VERSION_LECTOR = 1
+
+
+def _etiqueta(elem):
+    """Devuelve el nombre de la etiqueta sin el namespace ('{...}counts' -> 'counts')."""
+    tag = elem.tag
+    return tag.rsplit('}', 1)[1] if '}' in tag else tag
+
+
+def _namespace(elem):
+    tag = elem.tag
+    return tag[1:].split('}', 1)[0] if tag.startswith('{') else ''
+
+
+def _parsear_numeros(texto):
+    # Conversión vectorizada de todo el bloque de texto a float64 en una sola llamada
+    if not texto:
+        return np.empty(0, dtype=np.float64)
+    return np.fromstring(texto, dtype=np.float64, sep=' ')
+
+
+def _leer_data_points(data_points):
+    """Extrae ángulos 2-Theta e intensidades de un bloque <dataPoints> ya completo."""
+    intensidades = None
+    posiciones = None
+    for hijo in data_points:
+        nombre = _etiqueta(hijo)
+        if nombre in ('counts', 'intensities') and intensidades is None:
+            intensidades = _parsear_numeros(hijo.text)
+        elif nombre == 'positions' and hijo.get('axis') == '2Theta':
+            posiciones = hijo
+
+    if intensidades is None or posiciones is None:
+        return None
+
+    num_puntos = len(intensidades)
+    inicio = fin = lista = None
+    for hijo in posiciones:
+        nombre = _etiqueta(hijo)
+        if nombre == 'startPosition':
+            inicio = float(hijo.text)
+        elif nombre == 'endPosition':
+            fin = float(hijo.text)
+        elif nombre == 'listPositions':
+            lista = _parsear_numeros(hijo.text)
+
+    if lista is not None and len(lista) == num_puntos:
+        angulos = lista
+    elif inicio is not None and fin is not None:
+        angulos = np.linspace(inicio, fin, num_puntos)
+    else:
+        return None
+
+    return {'2theta': angulos, 'intensity': intensidades}
+
+
+@cronometrado("lectura.xrdml.parseo")
+def _parsear_xrdml(ruta_archivo):
+    contar("bytes_leidos.xrdml", os.path.getsize(ruta_archivo))
+    escaneos = []
+    namespace = ''
+    raiz = None
+
+    for evento, elem in ET.iterparse(ruta_archivo, events=('start', 'end')):
+        if raiz is None:
+            raiz = elem
+            namespace = _namespace(elem)
+            continue
+        if evento != 'end':
+            continue
+
+        nombre = _etiqueta(elem)
+        if nombre == 'dataPoints':
+            escaneo = _leer_data_points(elem)
+            if escaneo is not None:
+                escaneos.append(escaneo)
+            elem.clear()
+        elif nombre in ('scan', 'xrdMeasurement'):
+            # El escaneo ya fue procesado; se vacía para no acumular memoria
+            elem.clear()
+
+    if not escaneos:
+        raise ValueError("no se encontró ningún bloque <dataPoints> con eje 2Theta")
+
+    return {'scans': escaneos, 'namespace': namespace}
+
+
+@cronometrado("lectura.xrdml")
+def leer_xrdml_moderno(ruta_archivo, verbose=False):
+    """
+    Lee un archivo XRDML (cualquier versión del namespace) en modo streaming.
+
+    Usa iterparse para no construir el árbol completo, convierte las cuentas
+    directamente a un arreglo float64 y libera cada <dataPoints> al terminar.
+    Si el archivo contiene varios <scan>, el primero se devuelve en las claves
+    '2theta'/'intensity' y todos quedan disponibles en 'scans'. Los archivos
+    ya leídos se sirven desde la caché de espectros mientras no cambien.
+    """
+    try:
+        cache = cache_por_defecto()
+        if cache is not None:
+            leido = cache.cargar(ruta_archivo, f"xrdml-v{VERSION_LECTOR}", _parsear_xrdml)
+        else:
+            leido = _parsear_xrdml(ruta_archivo)
+
+        escaneos = leido['scans']
+        resultado = {
+            '2theta': escaneos[0]['2theta'],
+            'intensity': escaneos[0]['intensity'],
+            'scans': escaneos,
+            'namespace': leido['namespace'],
+        }
+
+        if verbose:
+            print(f"  -> Lectura exitosa de '{os.path.basename(ruta_archivo)}'. Se encontraron {len(resultado['intensity'])} puntos.")
+        return resultado
+
+    except Exception as e:
+        prefijo = "  -> " if verbose else ""
+        print(f"{prefijo}ERROR al leer '{os.path.basename(ruta_archivo)}': {e}")
+        return None
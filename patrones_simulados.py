@@ -0,0 +1,314 @@
+from contextlib import contextmanager
+import hashlib
+import os
+from datetime import datetime
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+
+
+RUTA_PATRONES_POR_DEFECTO = os.path.join(os.path.expanduser("~"), ".cache", "water-hyacinth", "patrones")
+
+_ARREGLOS = ("ids", "hashes", "inicios", "two_theta", "intensidad", "hkl")
+# Arreglos añadidos después; los almacenes antiguos pueden no tenerlos
+_ARREGLOS_OPCIONALES = ("formulas", "actualizados")
+
+
+class PatronSimulado:
+    """Patrón de difracción simulado: posiciones 2-Theta, intensidades normalizadas (0-100) y hkl."""
+
+    __slots__ = ("x", "y", "hkls")
+
+    def __init__(self, x, y, hkls):
+        self.x = x
+        self.y = y
+        self.hkls = hkls
+
+    @classmethod
+    def desde_pymatgen(cls, pattern):
+        y = np.asarray(pattern.y, dtype=np.float64)
+        y = (y / y.max()) * 100 if len(y) and y.max() > 0 else y
+        hkls = [", ".join(str(tuple(h["hkl"])) for h in familia) for familia in pattern.hkls]
+        return cls(np.asarray(pattern.x, dtype=np.float64), y, hkls)
+
+
+def hash_estructura(structure):
+    """Huella de la estructura (red, especies y coordenadas) para invalidar patrones obsoletos."""
+    h = hashlib.sha1()
+    h.update(np.round(np.asarray(structure.lattice.matrix, dtype=np.float64), 6).tobytes())
+    h.update(np.round(np.asarray(structure.frac_coords, dtype=np.float64) % 1.0, 6).tobytes())
+    h.update(" ".join(str(sp) for sp in structure.species).encode())
+    return h.hexdigest()
+
+
+def marca_actualizacion(valor):
+    """
+    'last_updated' de Materials Project como texto ISO comparable, venga como
+    datetime (API) o como texto (caché local). None si no hay dato.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        try:
+            valor = datetime.fromisoformat(valor)
+        except ValueError:
+            return valor
+    return valor.isoformat()
+
+
+def _version(ruta):
+    """Contenido del archivo 'version' del directorio; "" si no lo tiene (almacenes antiguos), None si no existe."""
+    try:
+        with open(os.path.join(ruta, "version"), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return "" if os.path.isdir(ruta) else None
+
+
+@contextmanager
+def _bloqueado(ruta, espera=30.0, abandonado=120.0):
+    """
+    Bloqueo entre procesos de 'ruta' con un archivo '.lock' creado en exclusiva
+    (funciona igual en Windows y en POSIX). Un bloqueo más viejo que 'abandonado'
+    segundos se da por dejado por un proceso que murió. TimeoutError si no se
+    consigue en 'espera' segundos.
+    """
+    bloqueo = ruta + ".lock"
+    limite = time.monotonic() + espera
+    while True:
+        try:
+            os.close(os.open(bloqueo, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(bloqueo) > abandonado:
+                    os.remove(bloqueo)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(bloqueo)
+            time.sleep(0.02)
+    try:
+        yield
+    finally:
+        os.remove(bloqueo)
+
+
+class AlmacenPatrones:
+    """
+    Almacén persistente de patrones simulados con XRDCalculator.
+
+    Hay un directorio por (sistema químico, longitud de onda, rango 2-Theta) con
+    arreglos .npy concatenados que se abren con memory-map; cada material se
+    identifica por material_id y el hash de su estructura, y se guarda su
+    'last_updated' de Materials Project para detectar estructuras revisadas
+    sin descargarlas. Los patrones nuevos se acumulan en memoria hasta llamar
+    a guardar().
+    """
+
+    def __init__(self, directorio, wavelength, two_theta_range=(0, 90)):
+        self.directorio = directorio
+        self.wavelength = str(wavelength)
+        self.two_theta_range = tuple(float(v) for v in two_theta_range)
+        self.aciertos = 0
+        self.fallos = 0
+        self._indices = {}
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _sufijo(self):
+        nombre = f"__{self.wavelength}__{self.two_theta_range[0]:g}-{self.two_theta_range[1]:g}"
+        return re.sub(r"[^A-Za-z0-9_.\-]", "_", nombre)
+
+    def _ruta(self, chemsys):
+        return os.path.join(self.directorio, re.sub(r"[^A-Za-z0-9_.\-]", "_", chemsys) + self._sufijo())
+
+    def sistemas(self):
+        """Sistemas químicos con patrones guardados para esta longitud de onda y rango."""
+        sufijo = self._sufijo()
+        return sorted(
+            nombre[:-len(sufijo)] for nombre in os.listdir(self.directorio)
+            if nombre.endswith(sufijo) and os.path.isdir(os.path.join(self.directorio, nombre))
+        )
+
+    def recorrer(self):
+        """Itera (chemsys, material_id, formula, patrón) sobre toda la biblioteca guardada en disco."""
+        for chemsys in self.sistemas():
+            # Con el lock, para no cargar (y recordar vacío) un sistema que otro hilo está reescribiendo
+            with self._lock:
+                indice = self._cargar(chemsys)
+            for material_id, (_, arreglos, tramo, formula, _) in sorted(indice.items()):
+                yield chemsys, material_id, formula, self._patron_guardado(arreglos, tramo)
+
+    @staticmethod
+    def _patron_guardado(arreglos, tramo):
+        return PatronSimulado(arreglos["two_theta"][tramo], arreglos["intensidad"][tramo],
+                              [str(h) for h in arreglos["hkl"][tramo]])
+
+    def _cargar(self, chemsys):
+        if chemsys in self._indices:
+            return self._indices[chemsys]
+        leido, indice = self._leer(chemsys)
+        # Sin directorio (o mientras otro proceso lo reemplaza) no se recuerda el vacío
+        if leido is not None:
+            self._indices[chemsys] = indice
+        return indice
+
+    def _leer(self, chemsys, intentos=10):
+        """
+        (versión leída, índice) de 'chemsys'; (None, {}) si no hay directorio o
+        no se pudo leer una versión entera.
+
+        Un directorio publicado no se modifica, solo se reemplaza por otro con
+        su propio archivo 'version': si la versión es la misma antes y después
+        de abrir los arreglos, todos son de ese directorio.
+        """
+        ruta = self._ruta(chemsys)
+        for _ in range(intentos):
+            version = _version(ruta)
+            if version is None:
+                return None, {}
+            try:
+                arreglos = {n: np.load(os.path.join(ruta, n + ".npy"), mmap_mode="r") for n in _ARREGLOS}
+                for n in _ARREGLOS_OPCIONALES:
+                    if os.path.exists(os.path.join(ruta, n + ".npy")):
+                        arreglos[n] = np.load(os.path.join(ruta, n + ".npy"), mmap_mode="r")
+                if _version(ruta) != version:
+                    continue
+            except (OSError, ValueError) as e:
+                if _version(ruta) != version:
+                    # Otro proceso reemplazó el directorio mientras se abría
+                    continue
+                print(f"Advertencia: almacén de patrones dañado en '{ruta}' ({e}). Se recalculará.")
+                return version, {}
+            indice = {}
+            try:
+                inicios = arreglos["inicios"]
+                formulas = arreglos.get("formulas")
+                actualizados = arreglos.get("actualizados")
+                for i, material_id in enumerate(arreglos["ids"]):
+                    tramo = slice(int(inicios[i]), int(inicios[i + 1]))
+                    formula = str(formulas[i]) if formulas is not None else ""
+                    actualizado = str(actualizados[i]) if actualizados is not None else ""
+                    indice[str(material_id)] = (str(arreglos["hashes"][i]), arreglos, tramo, formula, actualizado)
+            except (ValueError, KeyError, IndexError) as e:
+                print(f"Advertencia: almacén de patrones dañado en '{ruta}' ({e}). Se recalculará.")
+                return version, {}
+            return version, indice
+        return None, {}
+
+    def obtener(self, chemsys, material_id, huella=None, actualizado=None):
+        """
+        Patrón guardado o None. Con huella=None no se verifica la estructura y
+        con actualizado=None no se verifica 'last_updated' (ver marca_actualizacion).
+        """
+        actualizado = "" if actualizado is None else actualizado
+        with self._lock:
+            pendiente = self._pendientes.get(chemsys, {}).get(str(material_id))
+            if pendiente is not None and huella in (None, pendiente[0]) and actualizado in ("", pendiente[3]):
+                self.aciertos += 1
+                return pendiente[1]
+            entrada = self._cargar(chemsys).get(str(material_id))
+            if entrada is None or huella not in (None, entrada[0]) or actualizado not in ("", entrada[4]):
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        _, arreglos, tramo, _, _ = entrada
+        return self._patron_guardado(arreglos, tramo)
+
+    def agregar(self, chemsys, material_id, huella, patron, formula="", actualizado=None):
+        actualizado = "" if actualizado is None else actualizado
+        with self._lock:
+            self._pendientes.setdefault(chemsys, {})[str(material_id)] = (huella, patron, formula, actualizado)
+
+    def patron(self, chemsys, material_id, structure, calculadora, formula=""):
+        """Devuelve el patrón almacenado o lo calcula con 'calculadora' y lo deja pendiente de guardar."""
+        huella = hash_estructura(structure)
+        patron = self.obtener(chemsys, material_id, huella)
+        if patron is None:
+            patron = PatronSimulado.desde_pymatgen(
+                calculadora.get_pattern(structure, two_theta_range=self.two_theta_range)
+            )
+            self.agregar(chemsys, material_id, huella, patron, formula)
+        return patron
+
+    def guardar(self):
+        """Escribe a disco los sistemas químicos con patrones nuevos."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+            for chemsys, nuevos in pendientes.items():
+                self._escribir(chemsys, nuevos)
+
+    def _escribir(self, chemsys, nuevos):
+        """
+        Publica el directorio de 'chemsys' con lo que hay en disco más 'nuevos'.
+
+        Otro proceso (el vigilante, otra sesión) puede estar guardando el mismo
+        sistema: la escritura se hace con el sistema bloqueado y el disco se
+        vuelve a leer ya bloqueado, así no se pierde lo que el otro publicó.
+        """
+        ruta = self._ruta(chemsys)
+        try:
+            with _bloqueado(ruta):
+                entradas = self._entradas_en_disco(chemsys)
+                entradas.update(nuevos)
+                self._publicar(ruta, self._escribir_temporal(ruta, entradas))
+        except TimeoutError:
+            print(f"Advertencia: no se pudieron guardar {len(nuevos)} patrón(es) de {chemsys} porque otro "
+                  "proceso lleva demasiado tiempo escribiendo el mismo sistema; se volverán a simular.")
+
+    def _entradas_en_disco(self, chemsys):
+        """{material_id: (huella, patrón, formula, actualizado)} en memoria con lo que hay en disco."""
+        # Se libera el memory-map anterior: el directorio se va a reemplazar
+        self._indices.pop(chemsys, None)
+        _, indice = self._leer(chemsys)
+        entradas = {}
+        for material_id, (huella, arreglos, tramo, formula, actualizado) in indice.items():
+            entradas[material_id] = (huella, PatronSimulado(
+                np.array(arreglos["two_theta"][tramo]), np.array(arreglos["intensidad"][tramo]),
+                [str(h) for h in arreglos["hkl"][tramo]]), formula, actualizado)
+        return entradas
+
+    def _escribir_temporal(self, ruta, entradas):
+        ids = sorted(entradas)
+        longitudes = [len(entradas[m][1].x) for m in ids]
+        arreglos = {
+            "ids": np.array(ids, dtype=str),
+            "hashes": np.array([entradas[m][0] for m in ids], dtype=str),
+            "inicios": np.concatenate([[0], np.cumsum(longitudes)]).astype(np.int64),
+            "two_theta": np.concatenate([entradas[m][1].x for m in ids]).astype(np.float64),
+            "intensidad": np.concatenate([entradas[m][1].y for m in ids]).astype(np.float64),
+            "hkl": np.array([h for m in ids for h in entradas[m][1].hkls], dtype=str),
+            "formulas": np.array([entradas[m][2] for m in ids], dtype=str),
+            "actualizados": np.array([entradas[m][3] for m in ids], dtype=str),
+        }
+        # Nombre único: otro proceso puede estar escribiendo el mismo sistema
+        temporal = tempfile.mkdtemp(prefix=os.path.basename(ruta) + ".tmp-", dir=self.directorio)
+        for nombre, arreglo in arreglos.items():
+            np.save(os.path.join(temporal, nombre + ".npy"), arreglo)
+        with open(os.path.join(temporal, "version"), "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        return temporal
+
+    def _publicar(self, ruta, temporal):
+        """Pone 'temporal' en 'ruta'; los lectores ven la versión anterior o la nueva, nunca una mezcla."""
+        viejo = f"{ruta}.old-{time.time_ns()}-{os.getpid()}"
+        try:
+            os.rename(ruta, viejo)
+        except FileNotFoundError:
+            viejo = None
+        try:
+            os.rename(temporal, ruta)
+        except OSError:
+            shutil.rmtree(temporal, ignore_errors=True)
+            if viejo is not None:
+                os.rename(viejo, ruta)
+            raise
+        if viejo is not None:
+            shutil.rmtree(viejo, ignore_errors=True)
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Tarea especial: búsqueda automática en la biblioteca local para sugerir familias a partir de los picos
+AUTO = "auto"
+
+
+def leer_historial(ruta):
+    """Sistemas químicos usados en sesiones anteriores, del más reciente al más antiguo."""
+    if not ruta:
+        return []
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return [list(s) for s in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return []
+
+
+def registrar_en_historial(ruta, elements, maximo=20):
+    if not ruta:
+        return
+    clave = sorted(elements)
+    historial = [s for s in leer_historial(ruta) if sorted(s) != clave]
+    historial.insert(0, list(elements))
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(historial[:maximo], f)
+        os.replace(temporal, ruta)
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el historial de sistemas ({e}).")
+
+
+def sistemas_de_coincidencias(coincidencias, maximo=3):
+    """Familias químicas distintas de las mejores coincidencias de la búsqueda automática."""
+    sistemas = []
+    for coincidencia in coincidencias:
+        elements = coincidencia["sistema"].split("-")
+        if elements not in sistemas:
+            sistemas.append(elements)
+        if len(sistemas) >= maximo:
+            break
+    return sistemas
+
+
+class Precargador:
+    """
+    Busca y puntúa en segundo plano los sistemas químicos más probables
+    mientras el usuario está en el prompt.
+
+    Un único hilo recorre la cola de sistemas sugeridos (los de la sesión, los
+    del historial y los que propone la búsqueda automática a partir de los
+    picos). Las búsquedas del usuario pausan la precarga y, si el sistema ya
+    fue precargado, devuelven el resultado al instante. Cada sistema tiene su
+    propio lock: una búsqueda solo espera a la precarga si es del mismo
+    sistema (y entonces usa su resultado); las de otros sistemas corren a la
+    vez. Lo que informa el identificador desde el hilo de precarga se
+    descarta (ver InteractivePhaseIdentifier.silenciado). Un sistema cuya
+    consulta a Materials Project falla no se guarda: la búsqueda se repite en
+    primer plano y el usuario ve el error. cerrar() interrumpe la tarea en
+    curso en vez de esperar a que termine.
+    """
+
+    def __init__(self, identifier, exp_peaks, max_sistemas=6):
+        self.identifier = identifier
+        self.exp_peaks = exp_peaks
+        self.max_sistemas = max_sistemas
+        self._resultados = {}
+        self._cola = deque()
+        self._encolados = set()
+        # _tarea se toma durante cada tarea de precarga; _locks tiene uno por sistema (o AUTO)
+        self._tarea = threading.Lock()
+        self._locks = {}
+        self._lock_locks = threading.Lock()
+        self._condicion = threading.Condition()
+        self._pausa = 0
+        self._cerrado = False
+        self._cancelar = threading.Event()
+        self._hilo = None
+
+    @staticmethod
+    def clave(elements):
+        return AUTO if elements == AUTO else tuple(sorted(elements))
+
+    def _lock(self, clave):
+        with self._lock_locks:
+            return self._locks.setdefault(clave, threading.Lock())
+
+    def sugerir(self, sistemas, al_frente=False):
+        """Añade sistemas (listas de elementos o AUTO) a la cola de precarga."""
+        with self._condicion:
+            nuevos = []
+            for elements in sistemas:
+                clave = self.clave(elements)
+                if clave in self._encolados:
+                    continue
+                if clave != AUTO and len(self._encolados - {AUTO}) >= self.max_sistemas:
+                    break
+                self._encolados.add(clave)
+                nuevos.append(elements)
+            if al_frente:
+                self._cola.extendleft(reversed(nuevos))
+            else:
+                self._cola.extend(nuevos)
+            self._condicion.notify()
+        self._arrancar()
+
+    def _arrancar(self):
+        if self._hilo is not None or self._cerrado:
+            return
+        self._hilo = threading.Thread(target=self._trabajar, name="precarga", daemon=True)
+        self._hilo.start()
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                while not self._cerrado and (self._pausa or not self._cola):
+                    self._condicion.wait()
+                if self._cerrado:
+                    return
+                tarea = self._cola.popleft()
+            with self._tarea, self._lock(self.clave(tarea)), self.identifier.silenciado(), \
+                    self.identifier.cancelable(self._cancelar):
+                try:
+                    self._ejecutar(tarea)
+                except Exception:
+                    # Si falla (o se cancela), la búsqueda se repite en primer plano y el usuario ve el error
+                    pass
+
+    def _ejecutar(self, tarea):
+        if tarea == AUTO:
+            coincidencias = self.identifier.search_match(self.exp_peaks)
+            self.sugerir(sistemas_de_coincidencias(coincidencias), al_frente=True)
+            return
+        with self.identifier.recoger_errores_consulta() as errores, self.identifier.recoger_fallos() as fallos:
+            coincidencias = self.identifier.search_and_score(tarea, self.exp_peaks)
+        if not errores:
+            self._resultados[self.clave(tarea)] = (coincidencias, fallos)
+
+    @contextmanager
+    def _en_primer_plano(self, lock):
+        """Pausa la cola de precarga y toma 'lock' (espera a la tarea en curso solo si es la misma)."""
+        with self._condicion:
+            self._pausa += 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self._condicion:
+                self._pausa -= 1
+                self._condicion.notify()
+
+    def search_and_score(self, elements):
+        clave = self.clave(elements)
+        with self._en_primer_plano(self._lock(clave)):
+            precargado = self._resultados.get(clave)
+            if precargado is None:
+                return self.identifier.search_and_score(elements, self.exp_peaks)
+            coincidencias, fallos = precargado
+            print(f"\nResultados precargados para {'-'.join(elements)}.")
+            self.identifier.reportar_fallos(fallos)
+            return coincidencias
+
+    def search_match(self):
+        with self._en_primer_plano(self._lock(AUTO)):
+            return self.identifier.search_match(self.exp_peaks)
+
+    def aceptar_fase(self, match):
+        """Registra la fase en el identificador; los resultados precargados dejan de valer y se recalculan."""
+        # Cambia el residuo que usan todas las búsquedas: espera a que termine cualquier tarea de precarga
+        with self._en_primer_plano(self._tarea):
+            self.identifier.aceptar_fase(match)
+            self._resultados.clear()
+            self._encolados.clear()
+            with self._condicion:
+                self._cola.clear()
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify()
+        self._cancelar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
@@ -0,0 +1,161 @@
+import numpy as np
+
+
+def rejilla_comun(escaneos, paso=None):
+    """
+    Rejilla 2-Theta común que cubre todos los escaneos [(x, y), ...].
+
+    Por defecto usa el paso más fino de los escaneos, así ninguno pierde resolución.
+    """
+    minimo = min(float(np.min(x)) for x, _ in escaneos)
+    maximo = max(float(np.max(x)) for x, _ in escaneos)
+    if paso is None:
+        paso = min(float(np.abs(x[-1] - x[0])) / (len(x) - 1) for x, _ in escaneos if len(x) > 1)
+    return np.linspace(minimo, maximo, int(round((maximo - minimo) / paso)) + 1)
+
+
+def apilar(escaneos, rejilla):
+    """
+    Interpola todos los escaneos sobre 'rejilla' en un único arreglo 2D (muestras x puntos).
+
+    Fuera del rango medido de cada escaneo se repite el valor del borde; la
+    máscara 'medido' indica qué puntos están realmente cubiertos.
+    """
+    Y = np.empty((len(escaneos), len(rejilla)))
+    medido = np.zeros(Y.shape, dtype=bool)
+    for fila, (x, y) in enumerate(escaneos):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x[0] > x[-1]:
+            x, y = x[::-1], y[::-1]
+        Y[fila] = np.interp(rejilla, x, y)
+        medido[fila] = (rejilla >= x[0]) & (rejilla <= x[-1])
+    return Y, medido
+
+
+def linea_base(Y, semiancho, metodo="snip"):
+    """
+    Estima el fondo de todas las filas a la vez.
+
+    'snip': recorte iterativo SNIP sobre la transformada LLS (log-log-raíz),
+    con ventanas crecientes hasta 'semiancho' puntos. 'minimo': mínimo móvil
+    de ancho 2*semiancho+1 suavizado con una media móvil del mismo ancho
+    (más rápido, algo más tosco bajo picos anchos).
+    """
+    semiancho = max(1, int(semiancho))
+    if metodo == "minimo":
+        from scipy.ndimage import minimum_filter1d, uniform_filter1d
+        ancho = 2 * semiancho + 1
+        return uniform_filter1d(minimum_filter1d(Y, ancho, axis=1, mode="nearest"), ancho, axis=1, mode="nearest")
+    if metodo != "snip":
+        raise ValueError(f"método de línea base desconocido: '{metodo}'")
+
+    v = np.log(np.log(np.sqrt(np.maximum(Y, 0.0) + 1.0) + 1.0) + 1.0)
+    semiancho = min(semiancho, (Y.shape[1] - 1) // 2)
+    for p in range(1, semiancho + 1):
+        media = 0.5 * (v[:, :-2 * p] + v[:, 2 * p:])
+        np.minimum(v[:, p:-p], media, out=v[:, p:-p])
+    return (np.exp(np.exp(v) - 1.0) - 1.0) ** 2 - 1.0
+
+
+def suavizar(Y, ventana, orden=2):
+    """Savitzky-Golay a lo largo de cada fila; 'ventana' en puntos (se fuerza impar y mayor que 'orden')."""
+    ventana = max(int(ventana) | 1, (orden + 1) | 1)
+    if ventana >= Y.shape[1]:
+        return Y.copy()
+    from scipy.signal import savgol_filter
+    return savgol_filter(Y, ventana, orden, axis=1)
+
+
+def estimar_ruido(Y, fondo=None, medido=None):
+    """
+    Ruido de cada fila sin fondo, estimado con la desviación robusta (MAD):
+    los picos ocupan poca parte del escaneo, así que la mediana refleja el
+    ruido de la señal sobre la que luego se mide la prominencia.
+
+    Con 'fondo' se supone estadística de conteo (ruido proporcional a
+    sqrt(fondo)) y se devuelve un ruido local por punto, con la misma forma que Y.
+    """
+    if medido is not None:
+        Y = np.where(medido, Y, np.nan)
+    mad = 1.4826 * np.nanmedian(np.abs(Y - np.nanmedian(Y, axis=1, keepdims=True)), axis=1)
+    if fondo is None:
+        return mad
+    raiz = np.sqrt(np.maximum(fondo, 1.0))
+    escala = mad / np.nanmedian(np.where(np.isnan(Y), np.nan, raiz), axis=1)
+    return escala[:, None] * raiz
+
+
+def detectar_picos(Y, ruido, prominencia_relativa=5.0, medido=None):
+    """
+    Máximos locales de todas las filas con prominencia >= prominencia_relativa * ruido.
+
+    'ruido' es un valor por fila o, con la forma de Y, un valor por punto.
+
+    Las prominencias se calculan en una sola llamada sobre las filas
+    concatenadas, separadas por una columna más alta que cualquier dato para
+    que la base de un pico nunca se busque en otra fila.
+
+    Returns:
+        tuple: (fila, columna, prominencia) de cada pico, ordenados por fila y columna.
+    """
+    num_filas, num_puntos = Y.shape
+    es_maximo = np.zeros(Y.shape, dtype=bool)
+    es_maximo[:, 1:-1] = (Y[:, 1:-1] > Y[:, :-2]) & (Y[:, 1:-1] >= Y[:, 2:])
+    if medido is not None:
+        es_maximo &= medido
+    fila, columna = np.nonzero(es_maximo)
+    if len(fila) == 0:
+        vacio = np.empty(0, dtype=np.int64)
+        return vacio, vacio, np.empty(0)
+
+    from scipy.signal import peak_prominences
+    separador = np.nanmax(Y) + 1.0
+    plano = np.hstack([Y, np.full((num_filas, 1), separador)]).reshape(-1)
+    prominencias = peak_prominences(plano, fila * (num_puntos + 1) + columna)[0]
+
+    umbral = prominencia_relativa * (ruido[fila, columna] if np.ndim(ruido) == 2 else ruido[fila])
+    validos = (prominencias >= umbral) & (Y[fila, columna] > 0)
+    return fila[validos], columna[validos], prominencias[validos]
+
+
+def extraer_picos_lote(escaneos, paso=None, ancho_linea_base=2.0, ancho_suavizado=0.1,
+                       prominencia_relativa=5.0, metodo="snip"):
+    """
+    Línea base, suavizado y detección de picos de muchos escaneos a la vez.
+
+    Los escaneos [(2theta, cuentas), ...] se interpolan sobre una rejilla
+    común y todo el procesado se hace sobre el arreglo 2D resultante. Los
+    anchos están en grados y el umbral de prominencia es relativo al ruido
+    estimado de cada escaneo, así que no depende de las cuentas absolutas.
+
+    Returns:
+        list: Por escaneo, (picos absolutos [(2θ, cuentas netas)], picos para puntuar
+              [(2θ, intensidad 0-100)]), igual que esprayx.extraer_picos.
+    """
+    if not escaneos:
+        return []
+    rejilla = rejilla_comun(escaneos, paso)
+    paso_rejilla = rejilla[1] - rejilla[0] if len(rejilla) > 1 else 1.0
+    Y, medido = apilar(escaneos, rejilla)
+
+    fondo = linea_base(Y, round(ancho_linea_base / paso_rejilla), metodo)
+    suave = suavizar(Y - fondo, round(ancho_suavizado / paso_rejilla))
+    ruido = estimar_ruido(suave, fondo, medido)
+    fila, columna, _ = detectar_picos(suave, ruido, prominencia_relativa, medido)
+
+    resultados = []
+    limites = np.searchsorted(fila, np.arange(len(escaneos) + 1))
+    for k in range(len(escaneos)):
+        columnas = columna[limites[k]:limites[k + 1]]
+        if len(columnas) == 0:
+            resultados.append(([], []))
+            continue
+        thetas = rejilla[columnas]
+        intensidades = suave[k, columnas]
+        orden = np.argsort(-intensidades, kind="stable")
+        thetas, intensidades = thetas[orden], intensidades[orden]
+        all_peaks = list(zip(thetas, intensidades))
+        peaks_for_scoring = list(zip(thetas, intensidades / intensidades.max() * 100))
+        resultados.append((all_peaks, peaks_for_scoring))
+    return resultados
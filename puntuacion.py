@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def aportes_por_pico(patrones, exp_peaks, tolerancia):
+    """
+    Aporte de cada pico experimental al score de cada patrón (ver puntuar_candidatos).
+
+    Returns:
+        tuple: (aportes, coincide, validos). 'aportes' y 'coincide' tienen forma
+               (candidatos, picos experimentales); 'coincide' indica si el pico de
+               referencia más cercano está dentro de 'tolerancia'. 'validos' marca
+               los patrones con al menos un pico.
+    """
+    num_candidatos = len(patrones)
+    exp = np.asarray(exp_peaks, dtype=np.float64).reshape(-1, 2)
+    exp_thetas, exp_intensidades = exp[:, 0], exp[:, 1]
+    num_exp = len(exp)
+
+    longitudes = np.array([len(p.x) for p in patrones], dtype=np.int64)
+    validos = longitudes > 0
+    if num_candidatos == 0 or num_exp == 0 or not validos.any():
+        aportes = np.zeros((num_candidatos, num_exp), dtype=np.float64)
+        return aportes, aportes.astype(bool), validos
+
+    ref_thetas = np.concatenate([np.asarray(p.x, dtype=np.float64) for p in patrones])
+    ref_intensidades = np.concatenate([
+        (np.asarray(p.y, dtype=np.float64) / np.max(p.y)) * 100 for p in patrones if len(p.x)
+    ])
+    candidato = np.repeat(np.arange(num_candidatos), longitudes)
+    fin = np.cumsum(longitudes)
+    inicio = fin - longitudes
+
+    # Rangos enteros comunes para ordenar por (candidato, 2-Theta) sin pérdida de precisión
+    _, rangos = np.unique(np.concatenate([ref_thetas, exp_thetas]), return_inverse=True)
+    rangos = rangos.reshape(-1)
+    base = len(rangos) + 1
+    claves_ref = candidato * base + rangos[:len(ref_thetas)]
+    orden = np.argsort(claves_ref, kind="stable")
+    claves = claves_ref[orden]
+
+    claves_exp = np.arange(num_candidatos)[:, None] * base + rangos[len(ref_thetas):][None, :]
+    derecha = np.searchsorted(claves, claves_exp, side="left")
+    izquierda = derecha - 1
+
+    hay_derecha = derecha < fin[:, None]
+    hay_izquierda = izquierda >= inicio[:, None]
+    derecha = np.where(hay_derecha, derecha, 0)
+    izquierda = np.where(hay_izquierda, izquierda, 0)
+    # Con 2-Theta repetidos, argmin devuelve la primera aparición del valor
+    izquierda = np.where(hay_izquierda, np.searchsorted(claves, claves[izquierda], side="left"), 0)
+
+    orig_derecha = orden[derecha]
+    orig_izquierda = orden[izquierda]
+    dist_derecha = np.where(hay_derecha, np.abs(ref_thetas[orig_derecha] - exp_thetas), np.inf)
+    dist_izquierda = np.where(hay_izquierda, np.abs(ref_thetas[orig_izquierda] - exp_thetas), np.inf)
+
+    usar_izquierda = (dist_izquierda < dist_derecha) | (
+        (dist_izquierda == dist_derecha) & (orig_izquierda < orig_derecha)
+    )
+    mas_cercano = np.where(usar_izquierda, orig_izquierda, orig_derecha)
+    distancia = np.where(usar_izquierda, dist_izquierda, dist_derecha)
+
+    coincide = distancia <= tolerancia
+    aportes = np.where(
+        coincide, 1.0 - np.abs(exp_intensidades - ref_intensidades[mas_cercano]) / 100.0, 0.0
+    )
+    return aportes, coincide, validos
+
+
+def puntuar_candidatos(patrones, exp_peaks, tolerancia):
+    """
+    Puntúa todos los patrones candidatos contra los picos experimentales de una vez.
+
+    Equivale exactamente al bucle original de search_and_score: para cada pico
+    experimental se toma el pico de referencia más cercano (el primero en caso
+    de empate) y, si está dentro de 'tolerancia', suma
+    1 - |I_exp - I_ref| / 100. El score final es el promedio sobre los picos
+    experimentales, en porcentaje.
+
+    Los picos de todos los candidatos se concatenan en un único arreglo ordenado
+    por (candidato, 2-Theta) y el vecino más cercano se localiza con searchsorted,
+    así que el costo es O((R + C*E) log R) en lugar de O(C*E*R) en Python.
+
+    Args:
+        patrones (list): Objetos con atributos 'x' (2-Theta) e 'y' (intensidad).
+        exp_peaks (list): Pares (2-Theta, intensidad normalizada 0-100).
+        tolerancia (float): Diferencia angular máxima para considerar coincidencia.
+
+    Returns:
+        np.ndarray: Un score por patrón; NaN si el patrón no se pudo puntuar.
+    """
+    num_candidatos = len(patrones)
+    num_exp = len(np.asarray(exp_peaks, dtype=np.float64).reshape(-1, 2))
+    if num_candidatos == 0:
+        return np.empty(0, dtype=np.float64)
+    if num_exp == 0:
+        return np.full(num_candidatos, np.nan)
+
+    aportes, _, validos = aportes_por_pico(patrones, exp_peaks, tolerancia)
+    return sumar_aportes(aportes, validos, num_exp)
+
+
+def sumar_aportes(aportes, validos, num_exp):
+    """Score en porcentaje a partir de la matriz de aportes; NaN para los patrones no válidos."""
+    # cumsum suma en el mismo orden secuencial que el bucle original (resultados idénticos bit a bit)
+    if aportes.shape[1]:
+        total = np.cumsum(aportes, axis=1)[:, -1]
+    else:
+        total = np.zeros(len(aportes))
+    scores = (total / num_exp) * 100 if num_exp else np.zeros(len(aportes))
+    scores[~validos] = np.nan
+    return scores
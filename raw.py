@@ -1,50 +1,21 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import sys
 import os
-from matplotlib.ticker import MultipleLocator
-import xml.etree.ElementTree as ET
-import numpy as np # Necesario para calcular los ángulos
-
-def leer_xrdml_moderno(ruta_archivo):
-    """
-    Lee un archivo XRDML v2.3 que usa start/end position para los ángulos.
-    """
-    try:
-        # Definimos el 'namespace' correcto para la versión 2.3 del archivo
-        namespaces = {'xrdml': 'http://www.xrdml.com/XRDMeasurement/2.3'}
-        
-        tree = ET.parse(ruta_archivo)
-        root = tree.getroot()
-        
-        # 1. Extraer las intensidades (counts)
-        counts_string = root.find('.//xrdml:counts', namespaces).text
-        intensidades = [float(c) for c in counts_string.strip().split()]
-        
-        # 2. Extraer las posiciones de inicio y fin
-        pos_element = root.find('.//xrdml:positions[@axis="2Theta"]', namespaces)
-        start_pos = float(pos_element.find('xrdml:startPosition', namespaces).text)
-        end_pos = float(pos_element.find('xrdml:endPosition', namespaces).text)
-        
-        # 3. Calcular el eje de ángulos 2-Theta
-        num_puntos = len(intensidades)
-        angulos = np.linspace(start_pos, end_pos, num_puntos)
-        
-        print(f"  -> Lectura exitosa de '{os.path.basename(ruta_archivo)}'. Se encontraron {num_puntos} puntos.")
-        return {'2theta': angulos, 'intensity': intensidades}
-
-    except Exception as e:
-        print(f"  -> ERROR al leer '{os.path.basename(ruta_archivo)}': {e}")
-        return None
+from lector_xrdml import leer_xrdml_moderno
+from decimacion import reducir_traza, resolver_presupuesto, separar_opcion_puntos
+from instrumentacion import cronometrado, etapa
 
+@cronometrado("grafica.raw")
+def comparar_difractogramas_crudo(archivos_entrada, nombre_salida, puntos_max=None):
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import MultipleLocator
 
-def comparar_difractogramas_crudo(archivos_entrada, nombre_salida):
     plt.figure(figsize=(15, 8))
+    columnas = resolver_presupuesto(puntos_max, ancho_pulgadas=15, dpi=300)
     archivos_procesados_exitosamente = 0
 
     for ruta_archivo in archivos_entrada:
         print(f"\nProcesando archivo: '{ruta_archivo}'")
-        xrd_data = leer_xrdml_moderno(ruta_archivo)
+        xrd_data = leer_xrdml_moderno(ruta_archivo, verbose=True)
 
         if xrd_data:
             # --- CAMBIO PRINCIPAL: SECCIÓN DE NORMALIZACIÓN ELIMINADA ---
@@ -53,7 +24,7 @@ def comparar_difractogramas_crudo(archivos_entrada, nombre_salida):
             nombre_muestra = os.path.basename(ruta_archivo).split('.')[0]
             
             # Usamos xrd_data['intensity'] directamente en lugar de data['y_norm']
-            plt.plot(xrd_data['2theta'], xrd_data['intensity'], label=nombre_muestra)
+            plt.plot(*reducir_traza(xrd_data['2theta'], xrd_data['intensity'], columnas), label=nombre_muestra)
             archivos_procesados_exitosamente += 1
 
     if archivos_procesados_exitosamente > 0:
@@ -73,17 +44,19 @@ def comparar_difractogramas_crudo(archivos_entrada, nombre_salida):
         ax.grid(which='minor', axis='x', linestyle=':', linewidth='0.5', color='lightgray') # Grid minor solo en X
 
         plt.legend()
-        plt.savefig(nombre_salida, format='jpg', dpi=300)
+        with etapa("grafica.guardar"):
+            plt.savefig(nombre_salida, format='jpg', dpi=300)
         print(f"\n¡Listo! Gráfica con {archivos_procesados_exitosamente} muestra(s) guardada en: {nombre_salida}")
     else:
         print("\nOperación cancelada: No se pudo procesar ningún archivo de entrada válido.")
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
+    puntos_max, argumentos = separar_opcion_puntos(sys.argv[1:])
+    if len(argumentos) < 2:
         # Instrucciones de uso actualizadas con el nuevo nombre del script
-        print("\nUso: python comparar_xrd_crudo.py <salida.jpg> <archivo1.xrdml> ...")
+        print("\nUso: python comparar_xrd_crudo.py [--puntos=N|auto] <salida.jpg> <archivo1.xrdml> ...")
     else:
-        archivo_salida = sys.argv[1]
-        archivos_entrada = sys.argv[2:]
-        comparar_difractogramas_crudo(archivos_entrada, archivo_salida)
\ No newline at end of file
+        archivo_salida = argumentos[0]
+        archivos_entrada = argumentos[1:]
+        comparar_difractogramas_crudo(archivos_entrada, archivo_salida, puntos_max)
\ No newline at end of file
@@ -0,0 +1,79 @@
+import numpy as np
+
+from puntuacion import aportes_por_pico
+
+
+class MotorResidual:
+    """
+    Puntuación incremental contra los picos experimentales que aún no explica
+    ninguna fase aceptada.
+
+    Los aportes de cada candidato a cada pico (ver puntuacion.aportes_por_pico)
+    se calculan una sola vez por material y se guardan junto con la suma sobre
+    los picos activos. Al aceptar una fase se marcan como explicados los picos
+    que coinciden con ella y solo se recalcula la suma de los candidatos con
+    aporte en esos picos; el resto conserva su suma y cambia solo el número de
+    picos del promedio. Sin picos explicados, los scores son idénticos a los de
+    puntuar_candidatos.
+    """
+
+    def __init__(self, exp_peaks, tolerancia):
+        self.exp = np.asarray(exp_peaks, dtype=np.float64).reshape(-1, 2)
+        self.tolerancia = tolerancia
+        self.explicados = np.zeros(len(self.exp), dtype=bool)
+        self._aportes = {}
+        self._sumas = {}
+
+    def residuo(self):
+        """Picos (2-Theta, intensidad 0-100) todavía sin explicar."""
+        return self.exp[~self.explicados]
+
+    def _calcular_aportes(self, claves, patrones):
+        nuevos = [i for i, clave in enumerate(claves) if clave not in self._aportes]
+        if not nuevos:
+            return
+        aportes, coincide, validos = aportes_por_pico([patrones[i] for i in nuevos], self.exp, self.tolerancia)
+        for fila, i in enumerate(nuevos):
+            self._aportes[claves[i]] = (aportes[fila], coincide[fila], bool(validos[fila]))
+            self._sumas.pop(claves[i], None)
+
+    def puntuar(self, claves, patrones):
+        """
+        Scores (en %) de 'patrones' sobre el residuo actual. 'claves' identifica
+        cada patrón (material_id) para reutilizar sus aportes entre iteraciones.
+        """
+        claves = [str(c) for c in claves]
+        self._calcular_aportes(claves, patrones)
+        activos = ~self.explicados
+        num_activos = int(activos.sum())
+
+        faltantes = [c for c in dict.fromkeys(claves) if c not in self._sumas]
+        if faltantes and num_activos:
+            aportes = np.stack([self._aportes[c][0][activos] for c in faltantes])
+            # Misma suma secuencial que puntuar_candidatos
+            for c, suma in zip(faltantes, np.cumsum(aportes, axis=1)[:, -1]):
+                self._sumas[c] = suma
+
+        scores = np.empty(len(claves), dtype=np.float64)
+        for k, clave in enumerate(claves):
+            if not self._aportes[clave][2]:
+                scores[k] = np.nan
+            elif num_activos == 0:
+                scores[k] = 0.0
+            else:
+                scores[k] = (self._sumas[clave] / num_activos) * 100
+        return scores
+
+    def aceptar(self, clave, patron):
+        """Marca como explicados los picos activos que coinciden con la fase aceptada. Devuelve cuántos."""
+        clave = str(clave)
+        self._calcular_aportes([clave], [patron])
+        nuevos = self._aportes[clave][1] & ~self.explicados
+        if not nuevos.any():
+            return 0
+        self.explicados |= nuevos
+        # Solo cambia la suma de los candidatos con aporte en los picos recién explicados
+        for otra, (aportes, _, _) in self._aportes.items():
+            if otra in self._sumas and np.any(aportes[nuevos] != 0):
+                del self._sumas[otra]
+        return int(nuevos.sum())
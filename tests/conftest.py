@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _sin_cache_espectros(monkeypatch):
+    """Las pruebas leen siempre del archivo, nunca de la caché de espectros del usuario."""
+    monkeypatch.setenv("WH_CACHE_ESPECTROS", "0")
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+import pytest
+
+import cache_mp
+from cache_mp import CacheMaterialsProject
+
+
+class MPResterStub:
+    """Responde a materials.summary.search con un documento por consulta y cuenta las llamadas."""
+
+    def __init__(self):
+        self.materials = SimpleNamespace(summary=SimpleNamespace(search=self._buscar))
+        self.consultas = 0
+
+    def _buscar(self, **criterios):
+        self.consultas += 1
+        chemsys = "-".join(sorted(criterios["elements"]))
+        return [SimpleNamespace(material_id=f"mp-{chemsys}", relleno="x" * 2000)]
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1_000_000.0]
+    monkeypatch.setattr(cache_mp.time, "time", lambda: ahora[0])
+    return ahora
+
+
+def test_acierto_con_criterios_en_otro_orden(tmp_path, reloj):
+    mpr = MPResterStub()
+    cache = CacheMaterialsProject(str(tmp_path / "mp.sqlite"))
+    primero = cache.buscar(mpr, elements=["O", "Fe"], fields=["material_id", "formula_pretty"])
+    segundo = cache.buscar(mpr, elements=["Fe", "O"], fields=["formula_pretty", "material_id"])
+    assert mpr.consultas == 1
+    assert (cache.aciertos, cache.fallos) == (1, 1)
+    assert segundo[0].material_id == primero[0].material_id == "mp-Fe-O"
+    cache.cerrar()
+
+
+def test_caducidad(tmp_path, reloj):
+    mpr = MPResterStub()
+    cache = CacheMaterialsProject(str(tmp_path / "mp.sqlite"), ttl_segundos=60)
+    cache.buscar(mpr, elements=["Fe", "O"])
+    reloj[0] += 59
+    cache.buscar(mpr, elements=["Fe", "O"])
+    assert mpr.consultas == 1
+    reloj[0] += 2
+    cache.buscar(mpr, elements=["Fe", "O"])
+    assert mpr.consultas == 2
+    cache.cerrar()
+
+
+def test_desalojo_lru(tmp_path, reloj):
+    mpr = MPResterStub()
+    cache = CacheMaterialsProject(str(tmp_path / "mp.sqlite"), max_bytes=None)
+    for elementos in (["Fe"], ["O"], ["Ca"]):
+        reloj[0] += 1
+        cache.buscar(mpr, elements=elementos)
+    # Se vuelve a usar Fe, así que la entrada menos usada recientemente es O
+    reloj[0] += 1
+    cache.buscar(mpr, elements=["Fe"])
+    tamano = cache._conexion.execute("SELECT MAX(tamano) FROM consultas").fetchone()[0]
+    cache.max_bytes = 3 * tamano
+    reloj[0] += 1
+    cache.buscar(mpr, elements=["Si"])
+
+    consultas = mpr.consultas
+    for elementos in (["Fe"], ["Ca"], ["Si"]):
+        cache.buscar(mpr, elements=elementos)
+    assert mpr.consultas == consultas
+    cache.buscar(mpr, elements=["O"])
+    assert mpr.consultas == consultas + 1
+    cache.cerrar()
+
+
+def test_offline(tmp_path, reloj):
+    ruta = str(tmp_path / "mp.sqlite")
+    mpr = MPResterStub()
+    cache = CacheMaterialsProject(ruta, ttl_segundos=60)
+    cache.buscar(mpr, elements=["Fe", "O"])
+    cache.cerrar()
+
+    # Sin conexión: lo guardado se sirve aunque haya caducado y lo demás se reporta vacío
+    reloj[0] += 3600
+    offline = CacheMaterialsProject(ruta, ttl_segundos=60, offline=True)
+    assert [d.material_id for d in offline.buscar(None, elements=["O", "Fe"])] == ["mp-Fe-O"]
+    assert offline.buscar(mpr, elements=["Ca"]) == []
+    assert mpr.consultas == 1
+    offline.cerrar()
+
+
+def test_documentos_reales_de_mp_api(tmp_path):
+    # Los documentos de mp_api son modelos pydantic creados al vuelo que pickle no sabe serializar
+    schemas = pytest.importorskip("mp_api.client.core.schemas")
+    summary = pytest.importorskip("emmet.core.summary")
+    from pymatgen.core import Lattice, Structure
+
+    estructura = Structure(Lattice.cubic(4.3), ["Fe", "O"], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    campos_resumen = ["material_id", "formula_pretty", "energy_above_hull"]
+    resumen = schemas._convert_to_model(
+        [{"material_id": "mp-19770", "formula_pretty": "FeO", "energy_above_hull": 0.01}],
+        summary.SummaryDoc, requested_fields=campos_resumen,
+    )
+    estructuras = schemas._convert_to_model(
+        [{"material_id": "mp-19770", "structure": estructura.as_dict()}],
+        summary.SummaryDoc, requested_fields=["material_id", "structure"],
+    )
+    respuestas = {"resumen": resumen, "estructuras": estructuras}
+    mpr = SimpleNamespace(materials=SimpleNamespace(summary=SimpleNamespace(
+        search=lambda **criterios: respuestas["estructuras" if "material_ids" in criterios else "resumen"]
+    )))
+
+    cache = CacheMaterialsProject(str(tmp_path / "mp.sqlite"))
+    for _ in range(2):
+        docs = cache.buscar(mpr, elements=["Fe", "O"], fields=campos_resumen)
+        assert [(str(d.material_id), d.formula_pretty, d.energy_above_hull) for d in docs] == \
+            [(str(resumen[0].material_id), "FeO", 0.01)]
+        docs = cache.buscar(mpr, material_ids=["mp-19770"], fields=["material_id", "structure"])
+        assert isinstance(docs[0].structure, Structure)
+        assert docs[0].structure == estructura
+    assert (cache.aciertos, cache.fallos) == (2, 2)
+    cache.cerrar()
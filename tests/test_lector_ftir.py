@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from lector_ftir import _decodificar_asdf, leer_espectro_ftir
+
+
+def test_lineas_affn_con_exponente():
+    assert _decodificar_asdf("4000 1.5E+02 2.0e3") == ([4000.0, 150.0, 2000.0], False)
+    assert _decodificar_asdf("100-5-3") == ([100.0, -5.0, -3.0], False)
+
+
+def test_sqz_con_e_no_se_lee_como_exponente():
+    # 'E' y 'e' son los dígitos SQZ de +5 y -5, no exponentes
+    assert _decodificar_asdf("103E1E2E3") == ([103.0, 51.0, 52.0, 53.0], False)
+    assert _decodificar_asdf("3998E345E346E347") == ([3998.0, 5345.0, 5346.0, 5347.0], False)
+    assert _decodificar_asdf("3998E345") == ([3998.0, 5345.0], False)
+    assert _decodificar_asdf("3998e345J2") == ([3998.0, -5345.0, -5333.0], True)
+
+
+def test_xydata_sqz_con_e(tmp_path):
+    ruta = tmp_path / "sqz.jdx"
+    ruta.write_text(
+        "##TITLE=prueba\n##JCAMP-DX=4.24\n##XUNITS=1/CM\n##YUNITS=ABSORBANCE\n"
+        "##XFACTOR=1.0\n##YFACTOR=0.001\n##FIRSTX=4000\n##LASTX=3994\n##NPOINTS=7\n"
+        "##XYDATA=(X++(Y..Y))\n4000E1E2E3\n3997e4A2D5\n3994I9\n##END=\n",
+        encoding="utf-8",
+    )
+    espectro = leer_espectro_ftir(str(ruta))
+    np.testing.assert_allclose(espectro["y"], [0.051, 0.052, 0.053, -0.054, 0.012, 0.045, 0.099])
+    np.testing.assert_allclose(espectro["x"], np.linspace(4000, 3994, 7))
+
+
+def test_tabla_incompleta_indica_la_linea(tmp_path):
+    ruta = tmp_path / "irregular.txt"
+    ruta.write_text("# prueba\n4000 0.10\n3998 0.12\n3996\n3994 0.15\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="línea 4"):
+        leer_espectro_ftir(str(ruta))
@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from cache_espectros import hash_contenido
+
+
+EXTENSIONES = {".xrdml": "xrd", ".txt": "ftir", ".jdx": "ftir", ".dx": "ftir"}
+VERSION_MANIFIESTO = 1
+# Figuras de comparación que se regeneran cuando cambian los archivos de su técnica
+FIGURAS = {
+    "xrd": [("crudo", "comparacion_xrd_crudo.jpg"), ("normalizado", "comparacion_xrd_normalizado.jpg")],
+    "ftir": [("crudo", "comparacion_ftir_crudo.png"), ("normalizado", "comparacion_ftir_normalizado.png")],
+}
+
+
+class Vigilante:
+    """
+    Procesa de forma incremental los archivos que un equipo va dejando en un directorio.
+
+    En cada ciclo se listan los .xrdml y los espectros FTIR del directorio y
+    solo se procesan los nuevos o modificados: los XRDML pasan por
+    esprayx.procesar_lote (picos y, si hay sistemas o 'auto', identificación
+    de fases) y los FTIR se validan con su lector. Después se rehacen el
+    resumen.csv, la tabla picos.csv y las figuras de comparación de las
+    técnicas que cambiaron.
+
+    El manifiesto (manifiesto.json en el directorio de salida) guarda tamaño,
+    mtime, hash y resultado de cada archivo, así un reinicio retoma sin
+    reprocesar nada. Un archivo se procesa cuando lleva 'asentamiento'
+    segundos sin cambiar, para no leerlo mientras el equipo aún lo escribe.
+    Si su procesamiento lanza una excepción o falla la consulta a Materials
+    Project de algún sistema, queda en el manifiesto con estado 'error' y se
+    reintenta en el ciclo siguiente.
+    """
+
+    def __init__(self, directorio, salida, sistemas=(), auto=False, config=None,
+                 asentamiento=2.0, max_figura=10):
+        import esprayx
+        self.directorio = directorio
+        self.salida = salida
+        self.sistemas = [list(s) for s in sistemas]
+        self.auto = auto
+        self.config = dict(config or esprayx.CONFIGURACION)
+        self.asentamiento = asentamiento
+        self.max_figura = max_figura
+        self.ruta_manifiesto = os.path.join(salida, "manifiesto.json")
+        self.archivos = {}
+        os.makedirs(salida, exist_ok=True)
+        self._cargar_manifiesto()
+
+    def parametros(self):
+        """Lo que afecta a los resultados XRD; si cambia entre sesiones se reprocesan todos."""
+        return {
+            "sistemas": sorted("-".join(sorted(s)) for s in self.sistemas),
+            "auto": self.auto,
+            **{clave: self.config[clave] for clave in (
+                "DETECCION_PICOS", "PROMINENCIA_PICO", "PROMINENCIA_RELATIVA", "TOLERANCIA_ANGULO",
+                "SCORE_THRESHOLD", "STABILITY_THRESHOLD_EV_PER_ATOM", "LAMBDA_RAYOS_X_STR", "TOP_LOTE",
+                "MODO_PUNTUACION", "PERFIL_FWHM", "PERFIL_DESPLAZAMIENTO_MAX",
+            )},
+        }
+
+    def _cargar_manifiesto(self):
+        try:
+            with open(self.ruta_manifiesto, encoding="utf-8") as f:
+                manifiesto = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: manifiesto ilegible ({e}); se procesará todo de nuevo.")
+            return
+        if manifiesto.get("version") != VERSION_MANIFIESTO:
+            return
+        self.archivos = manifiesto.get("archivos", {})
+        if manifiesto.get("parametros") != json.loads(json.dumps(self.parametros())):
+            print("Los parámetros de identificación cambiaron: se reprocesarán los archivos XRD.")
+            self.archivos = {nombre: e for nombre, e in self.archivos.items() if e["tecnica"] != "xrd"}
+
+    def _guardar_manifiesto(self):
+        manifiesto = {"version": VERSION_MANIFIESTO, "parametros": self.parametros(), "archivos": self.archivos}
+        temporal = f"{self.ruta_manifiesto}.{os.getpid()}"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self.ruta_manifiesto)
+
+    def explorar(self):
+        """{nombre: (técnica, tamaño, mtime_ns)} de los archivos ya asentados del directorio."""
+        ahora = time.time_ns()
+        encontrados = {}
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                tecnica = EXTENSIONES.get(os.path.splitext(entrada.name)[1].lower())
+                if tecnica is None or not entrada.is_file():
+                    continue
+                estado = entrada.stat()
+                if ahora - estado.st_mtime_ns < self.asentamiento * 1e9:
+                    continue
+                encontrados[entrada.name] = (tecnica, estado.st_size, estado.st_mtime_ns)
+        return encontrados
+
+    def _cambiados(self, encontrados):
+        """
+        Archivos nuevos, con otro contenido o con un error pendiente de reintentar.
+
+        Los que solo cambiaron de mtime se actualizan en el manifiesto.
+
+        Returns:
+            tuple: ({nombre: hash} a procesar, [nombres que desaparecieron antes de leerlos]).
+        """
+        cambiados = {}
+        desaparecidos = []
+        self._refrescados = 0
+        for nombre, (tecnica, tamano, mtime_ns) in sorted(encontrados.items()):
+            anterior = self.archivos.get(nombre)
+            vigente = anterior is not None and anterior.get("estado") != "error" and anterior["tamano"] == tamano
+            if vigente and anterior["mtime_ns"] == mtime_ns:
+                continue
+            try:
+                huella = hash_contenido(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                desaparecidos.append(nombre)
+                continue
+            if vigente and huella == anterior["hash"]:
+                # Mismo contenido con otro mtime (copia, touch): no hace falta reprocesarlo
+                anterior["mtime_ns"] = mtime_ns
+                self._refrescados += 1
+                continue
+            cambiados[nombre] = huella
+        return cambiados, desaparecidos
+
+    def _procesar_xrd(self, nombres):
+        from esprayx import procesar_lote
+        rutas = [os.path.join(self.directorio, nombre) for nombre in nombres]
+        resultados = procesar_lote(rutas, self.sistemas, self.config, self.salida, auto=self.auto, resumen=False)
+        return {nombre: resultados[ruta] for nombre, ruta in zip(nombres, rutas)}
+
+    def _procesar_ftir(self, nombres):
+        from lector_ftir import leer_espectro_ftir
+        resultados = {}
+        for nombre in nombres:
+            try:
+                espectro = leer_espectro_ftir(os.path.join(self.directorio, nombre))
+                resultados[nombre] = {"puntos": len(espectro["x"]), "yunits": espectro["yunits"], "error": None}
+            except Exception as e:
+                print(f"Ocurrió un error al procesar '{nombre}': {e}")
+                resultados[nombre] = {"puntos": 0, "yunits": None, "error": str(e)}
+        return resultados
+
+    def _procesar(self, tecnica, nombres):
+        """
+        Resultados de 'nombres' con su estado. Si el lote lanza una excepción,
+        cada archivo queda con el error y estado 'error' para reintentarlo; lo
+        mismo si falló alguna consulta a Materials Project, para no dejar
+        registrado como definitivo un "sin fases" que solo fue un corte de red.
+        """
+        procesar = self._procesar_xrd if tecnica == "xrd" else self._procesar_ftir
+        try:
+            return {
+                nombre: (resultado, "error" if resultado.get("errores_consulta") else None)
+                for nombre, resultado in procesar(nombres).items()
+            }
+        except Exception as e:
+            print(f"Ocurrió un error al procesar {len(nombres)} archivo(s) {tecnica.upper()}: {e}. "
+                  "Se reintentará en la próxima revisión.")
+            if tecnica == "xrd":
+                return {
+                    nombre: ({"archivo": os.path.join(self.directorio, nombre), "picos": [], "coincidencias": {},
+                              "error": str(e)}, "error")
+                    for nombre in nombres
+                }
+            return {nombre: ({"puntos": 0, "yunits": None, "error": str(e)}, "error") for nombre in nombres}
+
+    def ciclo(self):
+        """
+        Una pasada por el directorio.
+
+        Returns:
+            int: Archivos procesados o eliminados en esta pasada.
+        """
+        encontrados = self.explorar()
+        cambiados, desaparecidos = self._cambiados(encontrados)
+        eliminados = [n for n in self.archivos if n in desaparecidos or (
+            n not in encontrados and not os.path.exists(os.path.join(self.directorio, n)))]
+        if not cambiados and not eliminados:
+            if self._refrescados:
+                self._guardar_manifiesto()
+            return 0
+
+        try:
+            return self._actualizar(encontrados, cambiados, eliminados)
+        finally:
+            # Lo ya procesado no se repite aunque fallen las tablas o las figuras
+            self._guardar_manifiesto()
+
+    def _actualizar(self, encontrados, cambiados, eliminados):
+        tecnicas = set()
+        for nombre in eliminados:
+            entrada = self.archivos.pop(nombre)
+            tecnicas.add(entrada["tecnica"])
+            if entrada["tecnica"] == "xrd":
+                # Manifiestos anteriores no guardaban el nombre del JSON: era el del archivo
+                json_resultado = entrada["resultado"].get("json") or os.path.splitext(nombre)[0] + ".json"
+                ruta_json = os.path.join(self.salida, json_resultado)
+                if os.path.exists(ruta_json):
+                    os.remove(ruta_json)
+        if eliminados:
+            print(f"\n{len(eliminados)} archivo(s) eliminado(s) del directorio: {', '.join(eliminados)}")
+
+        por_tecnica = {}
+        for nombre in cambiados:
+            por_tecnica.setdefault(encontrados[nombre][0], []).append(nombre)
+        for tecnica, nombres in por_tecnica.items():
+            print(f"\n{len(nombres)} archivo(s) {tecnica.upper()} nuevo(s) o modificado(s).")
+            for nombre, (resultado, estado) in self._procesar(tecnica, nombres).items():
+                _, tamano, mtime_ns = encontrados[nombre]
+                self.archivos[nombre] = {
+                    "tecnica": tecnica, "tamano": tamano, "mtime_ns": mtime_ns,
+                    "hash": cambiados[nombre], "resultado": resultado,
+                }
+                if estado is not None:
+                    self.archivos[nombre]["estado"] = estado
+            tecnicas.add(tecnica)
+
+        if "xrd" in tecnicas:
+            self._escribir_tablas()
+        for tecnica in tecnicas:
+            self._actualizar_figuras(tecnica)
+        return len(cambiados) + len(eliminados)
+
+    def _escribir_tablas(self):
+        import csv
+        from esprayx import escribir_resumen
+        xrd = [(n, e["resultado"]) for n, e in sorted(self.archivos.items()) if e["tecnica"] == "xrd"]
+        escribir_resumen([resultado for _, resultado in xrd], os.path.join(self.salida, "resumen.csv"))
+        with open(os.path.join(self.salida, "picos.csv"), "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["archivo", "2theta", "intensidad"])
+            for _, resultado in xrd:
+                for pico in resultado["picos"]:
+                    escritor.writerow([resultado["archivo"], f"{pico['2theta']:.4f}", f"{pico['intensidad']:.2f}"])
+
+    def _actualizar_figuras(self, tecnica):
+        """Rehace las figuras de comparación con los 'max_figura' archivos válidos más recientes."""
+        from figuras_lote import olvidar_espectros, renderizar_figura
+        # Los espectros de la ronda anterior pueden haber cambiado; así la memoria no crece sin límite
+        olvidar_espectros()
+        validos = [
+            (e["mtime_ns"], nombre) for nombre, e in self.archivos.items()
+            if e["tecnica"] == tecnica and not e["resultado"].get("error")
+        ]
+        recientes = [nombre for _, nombre in sorted(validos)[-self.max_figura:]]
+        for modo, archivo in FIGURAS[tecnica]:
+            salida = os.path.join(self.salida, archivo)
+            if not recientes:
+                if os.path.exists(salida):
+                    os.remove(salida)
+                continue
+            figura = {
+                "salida": salida, "modo": modo, "tecnica": tecnica,
+                "entradas": [os.path.join(self.directorio, nombre) for nombre in recientes], "puntos": "auto",
+            }
+            _, muestras, error = renderizar_figura(figura)
+            if error:
+                print(f"No se pudo generar '{archivo}': {error}")
+            else:
+                print(f"Figura actualizada: {salida} ({muestras} muestra(s)).")
+
+    def vigilar(self, intervalo=5.0, ciclos=None):
+        """Repite ciclo() cada 'intervalo' segundos ('ciclos' veces, o hasta Ctrl+C)."""
+        print(f"Vigilando '{self.directorio}' cada {intervalo:g} s ({len(self.archivos)} archivo(s) ya procesados). "
+              "Ctrl+C para terminar.")
+        hechos = 0
+        try:
+            while ciclos is None or hechos < ciclos:
+                try:
+                    self.ciclo()
+                except Exception as e:
+                    # Un error en una pasada no detiene la vigilancia: se reintenta en la siguiente
+                    print(f"Ocurrió un error al revisar '{self.directorio}': {e}")
+                hechos += 1
+                if ciclos is None or hechos < ciclos:
+                    time.sleep(intervalo)
+        except KeyboardInterrupt:
+            print("\nVigilancia detenida.")
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        prog="vigilar.py",
+        description="Procesa de forma incremental los archivos XRDML y FTIR que aparecen en un directorio.",
+    )
+    parser.add_argument("directorio", help="Directorio donde el equipo deja los archivos.")
+    parser.add_argument("-o", "--salida", default=None,
+                        help="Directorio de resultados (por defecto, <directorio>/resultados).")
+    parser.add_argument("-s", "--sistemas", nargs="+", default=[],
+                        help="Sistemas químicos para identificar fases, p. ej. Fe,O Ca,Si,O")
+    parser.add_argument("--auto", action="store_true", help="Buscar también en la biblioteca local de patrones.")
+    parser.add_argument("-i", "--intervalo", type=float, default=5.0, help="Segundos entre revisiones.")
+    parser.add_argument("--asentamiento", type=float, default=2.0,
+                        help="Segundos sin cambios antes de leer un archivo.")
+    parser.add_argument("--max-figura", type=int, default=10, help="Muestras más recientes en cada figura.")
+    parser.add_argument("--una-vez", action="store_true", help="Procesar lo pendiente y terminar.")
+    args = parser.parse_args(argumentos)
+
+    if not os.path.isdir(args.directorio):
+        parser.error(f"no existe el directorio '{args.directorio}'")
+    sistemas = [[e.strip().capitalize() for e in s.split(",") if e.strip()] for s in args.sistemas]
+    vigilante = Vigilante(
+        args.directorio, args.salida or os.path.join(args.directorio, "resultados"), sistemas, args.auto,
+        asentamiento=args.asentamiento, max_figura=args.max_figura,
+    )
+    vigilante.vigilar(args.intervalo, ciclos=1 if args.una_vez else None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import argparse
+import builtins
+import os
+import sys
+import threading
+import time
+
+
+class MedidorImportaciones:
+    """
+    Mide cuánto tarda en importarse cada paquete mientras está instalado.
+
+    Envuelve builtins.__import__ y, por cada módulo que aún no estaba
+    cargado, acumula su tiempo propio (sin los módulos que importa a su vez)
+    en el paquete de nivel superior al que pertenece. Así la suma de todas las
+    filas es el tiempo total de importación.
+    """
+
+    def __init__(self):
+        self.propio = {}
+        self._original = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def instalar(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._importar
+
+    def desinstalar(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _importar(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        pila = self._local.__dict__.setdefault("pila", [])
+        pila.append(0.0)
+        inicio = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - inicio
+            propio = total - pila.pop()
+            if pila:
+                pila[-1] += total
+            paquete = name.partition(".")[0]
+            with self._lock:
+                self.propio[paquete] = self.propio.get(paquete, 0.0) + propio
+
+    def imprimir(self, maximo=15, salida=None):
+        salida = salida or sys.stderr
+        filas = sorted(self.propio.items(), key=lambda item: item[1], reverse=True)
+        total = sum(t for _, t in filas)
+        print("\n--- Tiempo de importación ---", file=salida)
+        print(f"{'Paquete':<28} {'Tiempo (s)':>11} {'%':>6}", file=salida)
+        for paquete, tiempo in filas[:maximo]:
+            print(f"{paquete:<28} {tiempo:>11.3f} {tiempo / total * 100 if total else 0:>6.1f}", file=salida)
+        resto = sum(t for _, t in filas[maximo:])
+        if resto:
+            print(f"{f'otros ({len(filas) - maximo})':<28} {resto:>11.3f} {resto / total * 100:>6.1f}", file=salida)
+        print(f"{'Total':<28} {total:>11.3f}", file=salida)
+
+
+def _puntos(texto):
+    return texto if texto == "auto" else int(texto)
+
+
+# Cada subcomando importa su módulo solo al ejecutarse
+def _xrd_plot(args):
+    from analisis import comparar_difractogramas
+    comparar_difractogramas(args.archivos, args.salida, args.puntos)
+
+
+def _xrd_raw(args):
+    from raw import comparar_difractogramas_crudo
+    comparar_difractogramas_crudo(args.archivos, args.salida, args.puntos)
+
+
+def _ftir_plot(args):
+    from comparar import comparar_espectros
+    comparar_espectros(args.archivos, args.salida, args.puntos)
+
+
+def _ftir_raw(args):
+    from ftirabs import comparar_espectros_crudo
+    comparar_espectros_crudo(args.archivos, args.salida, args.puntos)
+
+
+def _identify(args):
+    from esprayx import main as main_esprayx
+    return main_esprayx(args.argumentos_directos)
+
+
+def _watch(args):
+    from vigilar import main as main_vigilar
+    return main_vigilar(args.argumentos_directos)
+
+
+GRAFICAS = {
+    "xrd-plot": (_xrd_plot, "Difractogramas XRD normalizados (analisis.py)."),
+    "xrd-raw": (_xrd_raw, "Difractogramas XRD en crudo (raw.py)."),
+    "ftir-plot": (_ftir_plot, "Espectros FTIR normalizados (comparar.py)."),
+    "ftir-raw": (_ftir_raw, "Espectros FTIR en crudo (ftirabs.py)."),
+}
+
+# Subcomandos cuyos argumentos los interpreta el propio script
+DIRECTOS = {
+    "identify": (_identify, "Identificación de fases: 'identify archivo.xrdml' (interactivo) o "
+                            "'identify --lote ...' (argumentos de esprayx.py)."),
+    "watch": (_watch, "Procesa de forma incremental un directorio de salida del equipo (argumentos de vigilar.py)."),
+}
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(prog="wh.py", description="Análisis XRD y FTIR de water-hyacinth.")
+    parser.add_argument("--tiempos-importacion", action="store_true",
+                        default=os.getenv("WH_TIEMPOS_IMPORTACION", "0") == "1",
+                        help="Al terminar, mostrar cuánto tardó en importarse cada paquete.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    for nombre, (funcion, ayuda) in GRAFICAS.items():
+        sub = subparsers.add_parser(nombre, help=ayuda, description=ayuda)
+        sub.add_argument("salida", help="Imagen de salida (.jpg, .png...).")
+        sub.add_argument("archivos", nargs="+", help="Archivos de entrada.")
+        sub.add_argument("--puntos", type=_puntos, default=None,
+                         help="Puntos máximos por traza (N o 'auto', ver decimacion.py).")
+        sub.set_defaults(funcion=funcion)
+
+    for nombre, (funcion, ayuda) in DIRECTOS.items():
+        subparsers.add_parser(nombre, help=ayuda, description=ayuda).set_defaults(funcion=funcion)
+
+    # Lo que sigue a 'identify' o 'watch' pasa tal cual a su script (incluido --lote y sus opciones)
+    argumentos = sys.argv[1:] if argumentos is None else list(argumentos)
+    posicionales = [i for i, a in enumerate(argumentos) if not a.startswith("-")]
+    argumentos_directos = []
+    if posicionales and argumentos[posicionales[0]] in DIRECTOS:
+        corte = posicionales[0] + 1
+        argumentos, argumentos_directos = argumentos[:corte], argumentos[corte:]
+    args = parser.parse_args(argumentos)
+    args.argumentos_directos = argumentos_directos
+
+    medidor = None
+    if args.tiempos_importacion:
+        medidor = MedidorImportaciones()
+        medidor.instalar()
+    try:
+        return args.funcion(args)
+    finally:
+        if medidor is not None:
+            medidor.desinstalar()
+            medidor.imprimir()
+
+
+if __name__ == '__main__':
+    sys.exit(main())